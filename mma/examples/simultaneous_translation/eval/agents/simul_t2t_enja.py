@@ -5,6 +5,10 @@
 
 import os
 
+from examples.simultaneous_translation.models.transformer_monotonic_attention import (
+    TransformerMonotonicDecoderOut,
+)
+from examples.simultaneous_translation.utils.decoder_state import DecoderStateManager
 from fairseq import checkpoint_utils, tasks
 import sentencepiece as spm
 import torch
@@ -33,6 +37,9 @@ class SimulTransTextAgentJA(TextAgent):
         # Max len
         self.max_len = args.max_len
 
+        # Only encode the newly read units on every read
+        self.incremental_encoder = getattr(args, "incremental_encoder", False)
+
         # Load Model
         self.load_model_vocab(args)
 
@@ -42,8 +49,11 @@ class SimulTransTextAgentJA(TextAgent):
         self.eos = DEFAULT_EOS
 
     def initialize_states(self, states):
-        states.incremental_states = dict()
-        states.incremental_states["online"] = dict()
+        states.decoder_state = DecoderStateManager(
+            self.model.decoder.dictionary,
+            device=next(self.model.parameters()).device,
+        )
+        states.encoder_incremental_states = dict()
 
     def to_device(self, tensor):
         if self.gpu:
@@ -98,6 +108,10 @@ class SimulTransTextAgentJA(TextAgent):
                             help="Subword splitter type for source text.")
         parser.add_argument("--src-splitter-path", type=str, default=None,
                             help="Subword splitter model path for source text.")
+        parser.add_argument("--incremental-encoder", action="store_true",
+                            help="Encode only the newly read source units on "
+                            "every read, reusing the cached states of the "
+                            "unidirectional encoder.")
         # fmt: on
         return parser
 
@@ -127,7 +141,14 @@ class SimulTransTextAgentJA(TextAgent):
         src_indices = self.to_device(torch.LongTensor(src_indices).unsqueeze(0))
         src_lengths = self.to_device(torch.LongTensor([src_indices.size(1)]))
 
-        states.encoder_states = self.model.encoder(src_indices, src_lengths)
+        if self.incremental_encoder:
+            states.encoder_states = self.model.encoder(
+                src_indices,
+                src_lengths,
+                incremental_state=states.encoder_incremental_states,
+            )
+        else:
+            states.encoder_states = self.model.encoder(src_indices, src_lengths)
 
         torch.cuda.empty_cache()
 
@@ -164,40 +185,44 @@ class SimulTransTextAgentJA(TextAgent):
             # No encoder states, read a token first
             return READ_ACTION
 
-        # encode previous predicted target tokens
-        tgt_indices = self.to_device(
-            torch.LongTensor(
-                [self.model.decoder.dictionary.eos()]
-                + [
-                    self.dict["tgt"].index(x)
-                    for x in states.units.target.value
-                    if x is not None
-                ]
-            ).unsqueeze(0)
-        )
+        meters = states.decoder_state.meters
+        meters["policy"].start()
+
+        # previous predicted target tokens, only the new ones are looked up
+        states.decoder_state.update(states.units.target.value)
+        tgt_indices = states.decoder_state.prefix()
+
+        # The decoder state manager replaces the incremental state
+        # when the target units are rewritten
+        incremental_state = states.decoder_state.incremental_state
 
         # Current steps
-        states.incremental_states["steps"] = {
+        incremental_state["steps"] = {
             "src": states.encoder_states["encoder_out"][0].size(0),
             "tgt": 1 + len(states.units.target),
         }
 
         # Online only means the reading is not finished
-        states.incremental_states["online"]["only"] = torch.BoolTensor(
+        incremental_state["online"]["only"] = torch.BoolTensor(
             [not states.finish_read()]
         )
 
+        meters["decoder"].start()
         x, outputs = self.model.decoder.forward(
             prev_output_tokens=tgt_indices,
             encoder_out=states.encoder_states,
-            incremental_state=states.incremental_states,
+            incremental_state=incremental_state,
         )
+        meters["decoder"].stop()
 
         states.decoder_out = x
 
         torch.cuda.empty_cache()
 
-        if outputs.action == 0:
+        meters["policy"].stop()
+
+        # The decoder only returns a TransformerMonotonicDecoderOut to read
+        if isinstance(outputs, TransformerMonotonicDecoderOut):
             return READ_ACTION
         else:
             return WRITE_ACTION
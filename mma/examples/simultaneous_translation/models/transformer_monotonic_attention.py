@@ -5,7 +5,6 @@
 
 from typing import Dict, List, NamedTuple, Optional
 
-import pdb
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -92,6 +91,91 @@ class TransformerMonotonicEncoder(TransformerEncoder):
             [TransformerMonotonicEncoderLayer(args) for i in range(args.encoder_layers)]
         )
 
+    def forward(
+        self,
+        src_tokens,
+        src_lengths: Optional[Tensor] = None,
+        return_all_hiddens: bool = False,
+        token_embeddings: Optional[Tensor] = None,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None,
+    ):
+        """
+        Same as TransformerEncoder.forward, except when *incremental_state*
+        is given: *src_tokens* is then the whole source prefix read so far,
+        but only the positions not seen by the previous call are encoded.
+        Since every encoder layer is causal, the output is the same
+        as re-encoding the whole prefix.
+        """
+        if incremental_state is None:
+            return super().forward(
+                src_tokens, src_lengths, return_all_hiddens, token_embeddings
+            )
+        return self.forward_incremental(src_tokens, incremental_state)
+
+    def forward_incremental(
+        self,
+        src_tokens,
+        incremental_state: Dict[str, Dict[str, Optional[Tensor]]],
+    ):
+        cache = incremental_state.get("encoder_cache", {})
+        prev_x = cache.get("encoder_out")
+        prev_len = prev_x.size(0) if prev_x is not None else 0
+        src_len = src_tokens.size(1)
+        assert src_len >= prev_len, "The source prefix can only grow."
+
+        if src_len > prev_len:
+            new_tokens = src_tokens[:, prev_len:]
+            encoder_padding_mask = new_tokens.eq(self.padding_idx)
+            has_pads = encoder_padding_mask.any()
+
+            # Positions are computed over the whole prefix
+            x = embed = self.embed_scale * self.embed_tokens(new_tokens)
+            if self.embed_positions is not None:
+                x = embed + self.embed_positions(src_tokens)[:, prev_len:]
+            if self.layernorm_embedding is not None:
+                x = self.layernorm_embedding(x)
+            x = self.dropout_module(x)
+            if self.quant_noise is not None:
+                x = self.quant_noise(x)
+
+            if has_pads:
+                x = x * (1 - encoder_padding_mask.unsqueeze(-1).type_as(x))
+
+            # B x T x C -> T x B x C
+            x = x.transpose(0, 1)
+
+            for layer in self.layers:
+                x = layer(
+                    x,
+                    encoder_padding_mask=encoder_padding_mask if has_pads else None,
+                    incremental_state=incremental_state,
+                )
+
+            if self.layer_norm is not None:
+                x = self.layer_norm(x)
+
+            if prev_x is not None:
+                x = torch.cat([prev_x, x], dim=0)
+                embed = torch.cat([cache["encoder_embedding"], embed], dim=1)
+            cache = {"encoder_out": x, "encoder_embedding": embed}
+            incremental_state["encoder_cache"] = cache
+
+        encoder_padding_mask = src_tokens.eq(self.padding_idx)
+        src_lengths = (
+            (~encoder_padding_mask)
+            .sum(dim=1, dtype=torch.int32)
+            .reshape(-1, 1)
+            .contiguous()
+        )
+        return {
+            "encoder_out": [cache["encoder_out"]],  # T x B x C
+            "encoder_padding_mask": [encoder_padding_mask],  # B x T
+            "encoder_embedding": [cache["encoder_embedding"]],  # B x T x C
+            "encoder_states": [],
+            "src_tokens": [],
+            "src_lengths": [src_lengths],
+        }
+
 
 class TransformerMonotonicDecoder(TransformerDecoder):
     """
@@ -127,10 +211,7 @@ class TransformerMonotonicDecoder(TransformerDecoder):
         incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None,
     ):
         positions = (
-            self.embed_positions(
-                prev_output_tokens,
-                incremental_state=incremental_state,
-            )
+            self.embed_target_positions(prev_output_tokens, incremental_state)
             if self.embed_positions is not None
             else None
         )
@@ -167,6 +248,41 @@ class TransformerMonotonicDecoder(TransformerDecoder):
 
         return x, encoder_out, encoder_padding_mask
 
+    def embed_target_positions(
+        self,
+        prev_output_tokens,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None,
+    ):
+        """
+        Positional embeddings of the target prefix, or of its last token
+        only in incremental decoding.
+        The multi-stream scheduler batches left padded prefixes of
+        different lengths, and gives their lengths as "tgt_lengths" in
+        the steps of *incremental_state*: each row then gets the position
+        of its own last token.
+        """
+        assert self.embed_positions is not None
+        tgt_lengths: Optional[Tensor] = None
+        if incremental_state is not None and "steps" in incremental_state:
+            tgt_lengths = incremental_state["steps"].get("tgt_lengths")
+
+        if tgt_lengths is None:
+            return self.embed_positions(
+                prev_output_tokens, incremental_state=incremental_state
+            )
+
+        max_tgt_len = prev_output_tokens.size(1)
+        return torch.cat(
+            [
+                self.embed_positions(
+                    prev_output_tokens[i : i + 1, max_tgt_len - tgt_len :],
+                    incremental_state=incremental_state,
+                )
+                for i, tgt_len in enumerate(tgt_lengths.tolist())
+            ],
+            dim=0,
+        )
+
     def post_attention(self, x):
         if self.layer_norm is not None:
             x = self.layer_norm(x)
@@ -183,18 +299,42 @@ class TransformerMonotonicDecoder(TransformerDecoder):
         self,
         incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
         end_id: Optional[int] = None,
+        length: Optional[int] = None,
     ):
         """
         Clear cache in the monotonic layers.
         The cache is generated because of a forward pass of decode but no prediction.
         end_id is the last idx of the layers
+        length is the number of target steps to keep, the last step by default
         """
         if end_id is None:
             end_id = len(self.layers)
 
         for index, layer in enumerate(self.layers):
             if index < end_id:
-                layer.prune_incremental_state(incremental_state)
+                layer.prune_incremental_state(incremental_state, length)
+
+    def init_offline_state(
+        self,
+        incremental_state: Dict[str, Dict[str, Optional[Tensor]]],
+        prev_output_tokens: Tensor,
+        encoder_out: Tensor,
+    ):
+        """
+        Fill in the online states for offline incremental decoding, as in
+        fairseq-generate, where nobody else sets them: the whole source
+        is read, and the target grows by one token per call.
+        """
+        if "online" not in incremental_state:
+            incremental_state["online"] = {
+                "only": torch.tensor(False),
+                "offline": torch.tensor(True),
+            }
+        if "offline" in incremental_state["online"]:
+            incremental_state["steps"] = {
+                "src": encoder_out.size(0),
+                "tgt": prev_output_tokens.size(1),
+            }
 
     def extract_features(
         self,
@@ -204,7 +344,7 @@ class TransformerMonotonicDecoder(TransformerDecoder):
         full_context_alignment: bool = False,  # unused
         alignment_layer: Optional[int] = None,  # unused
         alignment_heads: Optional[int] = None,  # unsed
-        pre_alpha=None,
+        pre_alpha: Optional[Dict[str, Tensor]] = None,
     ):
         """
         Similar to *forward* but only return features.
@@ -219,6 +359,8 @@ class TransformerMonotonicDecoder(TransformerDecoder):
         (x, encoder_outs, encoder_padding_mask) = self.pre_attention(
             prev_output_tokens, encoder_out, incremental_state
         )
+        if incremental_state is not None:
+            self.init_offline_state(incremental_state, prev_output_tokens, encoder_outs)
         attn = None
         inner_states = [x]
         attn_list: List[Optional[Dict[str, Tensor]]] = []
@@ -226,7 +368,10 @@ class TransformerMonotonicDecoder(TransformerDecoder):
 
         p_choose = torch.tensor([1.0])
 
-        betas = []
+        # Only the first layer computes the alignment, the others take it
+        # from pre_alpha. The expected attention of the layers is averaged
+        # for the outputs at inference only, as a running sum
+        beta_sum: Optional[Tensor] = None
 
         for i, layer in enumerate(self.layers):
 
@@ -241,12 +386,14 @@ class TransformerMonotonicDecoder(TransformerDecoder):
                 pre_alpha=pre_alpha,
             )
             pre_alpha = attn
-            betas.append(attn["beta"])
+            if not self.training:
+                beta_sum = attn["beta"] if beta_sum is None else beta_sum + attn["beta"]
 
             inner_states.append(x)
             attn_list.append(attn)
 
-            if incremental_state is not None:
+            if incremental_state is not None and layer.need_alpha:
+                # Only the layers computing their own alignment have steps
                 curr_steps = layer.get_head_steps(incremental_state)
                 step_list.append(curr_steps)
                 if_online = incremental_state["online"]["only"]
@@ -267,7 +414,9 @@ class TransformerMonotonicDecoder(TransformerDecoder):
                         # We need to prune the last self_attn saved_state
                         # if model decide not to read
                         # otherwise there will be duplicated saved_state
-                        self.clear_cache(incremental_state, i + 1)
+                        self.clear_cache(
+                            incremental_state, i + 1, prev_output_tokens.size(1) - 1
+                        )
 
                         return x, TransformerMonotonicDecoderOut(
                             action=0,
@@ -280,7 +429,10 @@ class TransformerMonotonicDecoder(TransformerDecoder):
 
         x = self.post_attention(x)
 
-        pre_alpha["beta"] = torch.mean(torch.stack(betas), 0)
+        if beta_sum is not None:
+            pre_alpha["beta"] = beta_sum / len(self.layers)
+        else:
+            del pre_alpha["beta"]
 
         return x, {
             "action": 1,
@@ -169,7 +169,7 @@ def fixed_pooling_monotonic_attention(monotonic_attention):
                         )
                     else:  # hard_aligned or infinite_lookback
                         q_proj, k_proj, _ = self.input_projections(
-                            query, key, None, "monotonic"
+                            query, key, None, "monotonic", incremental_state
                         )
                         attn_energy = self.attn_energy(q_proj, k_proj, key_padding_mask)
                         return p_choose_strategy.hard_aligned(
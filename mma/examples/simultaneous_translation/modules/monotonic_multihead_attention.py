@@ -4,14 +4,15 @@
 # LICENSE file in the root directory of this source tree.
 
 import math
-import pdb
 import torch
 from torch import Tensor
 import torch.nn as nn
 
 from examples.simultaneous_translation.utils.functions import (
     exclusive_cumprod,
+    expected_alignment_fused,
     lengths_to_mask,
+    monotonic_step_search,
 )
 from fairseq.incremental_decoding_utils import with_incremental_state
 from fairseq.modules import MultiheadAttention
@@ -30,6 +31,7 @@ class MonotonicAttention(nn.Module):
     def __init__(self, args):
         self.eps = args.attention_eps
         self.mass_preservation = args.mass_preservation
+        self.alignment_train_impl = getattr(args, "alignment_train_impl", "loop")
 
         self.noise_type = args.noise_type
         self.noise_mean = args.noise_mean
@@ -66,6 +68,11 @@ class MonotonicAttention(nn.Module):
                             help='Initial value of the bias for energy')
         parser.add_argument('--attention-eps', type=float, default=1e-5,
                             help='Epsilon when calculating expected attention')
+        parser.add_argument('--alignment-train-impl', type=str, default="loop",
+                            choices=["loop", "fused"],
+                            help='Implementation of the expected alignment in training: '
+                                 'a python loop over target steps, or a fused recurrence '
+                                 'with a hand-written backward pass')
 
     def p_choose(self, *args):
         raise NotImplementedError
@@ -127,29 +134,33 @@ class MonotonicAttention(nn.Module):
         # p_choose: bsz * num_heads, tgt_len, src_len
         bsz_num_heads, tgt_len, src_len = p_choose.size()
 
-        # cumprod_1mp : bsz * num_heads, tgt_len, src_len
-        cumprod_1mp = exclusive_cumprod(1 - p_choose, dim=2, eps=self.eps)
-        cumprod_1mp_clamp = torch.clamp(cumprod_1mp, self.eps, 1.0)
-
-        init_attention = p_choose.new_zeros([bsz_num_heads, 1, src_len])
-        init_attention[:, :, 0] = 1.0
-
-        previous_attn = [init_attention]
-
-        for i in range(tgt_len):
-            # p_choose: bsz * num_heads, tgt_len, src_len
-            # cumprod_1mp_clamp : bsz * num_heads, tgt_len, src_len
-            # previous_attn[i]: bsz * num_heads, 1, src_len
-            # alpha_i: bsz * num_heads, src_len
-            alpha_i = (
-                p_choose[:, i]
-                * cumprod_1mp[:, i]
-                * torch.cumsum(previous_attn[i][:, 0] / cumprod_1mp_clamp[:, i], dim=1)
-            ).clamp(0, 1.0)
-            previous_attn.append(alpha_i.unsqueeze(1))
-
-        # alpha: bsz * num_heads, tgt_len, src_len
-        alpha = torch.cat(previous_attn[1:], dim=1)
+        if self.alignment_train_impl == "fused":
+            # alpha: bsz * num_heads, tgt_len, src_len
+            alpha = expected_alignment_fused(p_choose, eps=self.eps)
+        else:
+            # cumprod_1mp : bsz * num_heads, tgt_len, src_len
+            cumprod_1mp = exclusive_cumprod(1 - p_choose, dim=2, eps=self.eps)
+            cumprod_1mp_clamp = torch.clamp(cumprod_1mp, self.eps, 1.0)
+
+            init_attention = p_choose.new_zeros([bsz_num_heads, 1, src_len])
+            init_attention[:, :, 0] = 1.0
+
+            previous_attn = [init_attention]
+
+            for i in range(tgt_len):
+                # p_choose: bsz * num_heads, tgt_len, src_len
+                # cumprod_1mp_clamp : bsz * num_heads, tgt_len, src_len
+                # previous_attn[i]: bsz * num_heads, 1, src_len
+                # alpha_i: bsz * num_heads, src_len
+                alpha_i = (
+                    p_choose[:, i]
+                    * cumprod_1mp[:, i]
+                    * torch.cumsum(previous_attn[i][:, 0] / cumprod_1mp_clamp[:, i], dim=1)
+                ).clamp(0, 1.0)
+                previous_attn.append(alpha_i.unsqueeze(1))
+
+            # alpha: bsz * num_heads, tgt_len, src_len
+            alpha = torch.cat(previous_attn[1:], dim=1)
 
         if self.mass_preservation:
             # Last token has the residual probabilities
@@ -218,54 +229,25 @@ class MonotonicAttention(nn.Module):
 
         # src_lengths: bsz, num_heads
         src_lengths = src_lengths.expand_as(prev_monotonic_step)
-        # new_monotonic_step: bsz, num_heads
-        new_monotonic_step = prev_monotonic_step
-
-        step_offset = 0
+        step_offset = prev_monotonic_step.new_zeros([bsz, 1])
         if encoder_padding_mask is not None:
-            if encoder_padding_mask[:, 0].any():
-                # left_pad_source = True:
-                step_offset = encoder_padding_mask.sum(dim=-1, keepdim=True)
-
-        max_steps = src_lengths - 1 if self.mass_preservation else src_lengths
-
-        # finish_read: bsz, num_heads
-        finish_read = new_monotonic_step.eq(max_steps)
-        p_choose_i = 1
-        while finish_read.sum().item() < bsz * self.num_heads:
-            # p_choose: bsz * self.num_heads, src_len
-            # only choose the p at monotonic steps
-            # p_choose_i: bsz , self.num_heads
-            p_choose_i = (
-                p_choose.gather(
-                    2,
-                    (step_offset + new_monotonic_step)
-                    .unsqueeze(2)
-                    .clamp(0, src_len - 1),
-                )
-            ).squeeze(2)
-
-            action = (
-                (p_choose_i < 0.5)
-                .type_as(prev_monotonic_step)
-                .masked_fill(finish_read, 0)
+            # left_pad_source = True: offset by the number of pads,
+            # right padding has no pad at the first position
+            step_offset = (
+                encoder_padding_mask[:, :1].long()
+                * encoder_padding_mask.sum(dim=-1, keepdim=True)
             )
-            # 1 x bsz
-            # sample actions on unfinished seq
-            # 1 means stay, finish reading
-            # 0 means leave, continue reading
-            # dist = torch.distributions.bernoulli.Bernoulli(p_choose)
-            # action = dist.sample().type_as(finish_read) * (1 - finish_read)
 
-            new_monotonic_step += action
+        max_steps = src_lengths - 1 if self.mass_preservation else src_lengths
 
-            finish_read = new_monotonic_step.eq(max_steps) | (action == 0)
+        # new_monotonic_step: bsz, num_heads
+        new_monotonic_step, head_read = monotonic_step_search(
+            p_choose, prev_monotonic_step, max_steps, step_offset
+        )
 
         monotonic_cache["head_step"] = new_monotonic_step
         # Whether a head is looking for new input
-        monotonic_cache["head_read"] = (
-            new_monotonic_step.eq(max_steps) & (p_choose_i < 0.5)
-        )
+        monotonic_cache["head_read"] = head_read
 
         # alpha: bsz * num_heads, 1, src_len
         # new_monotonic_step: bsz, num_heads
@@ -379,10 +361,6 @@ class MonotonicMultiheadAttentionHardAligned(
 
         MonotonicAttention.__init__(self, args)
 
-        self.k_in_proj = {"monotonic": self.k_proj}
-        self.q_in_proj = {"monotonic": self.q_proj}
-        self.v_in_proj = {"output": self.v_proj}
-
     @staticmethod
     def add_args(parser):
         # fmt: off
@@ -406,6 +384,11 @@ class MonotonicMultiheadAttentionHardAligned(
                             help='Initial value of the bias for energy')
         parser.add_argument('--attention-eps', type=float, default=1e-2,
                             help='Epsilon when calculating expected attention')
+        parser.add_argument('--alignment-train-impl', type=str, default="loop",
+                            choices=["loop", "fused"],
+                            help='Implementation of the expected alignment in training: '
+                                 'a python loop over target steps, or a fused recurrence '
+                                 'with a hand-written backward pass')
 
     def attn_energy(
         self, q_proj: Optional[Tensor], k_proj: Optional[Tensor], key_padding_mask: Optional[Tensor] = None, attn_mask: Optional[Tensor] = None
@@ -444,6 +427,7 @@ class MonotonicMultiheadAttentionHardAligned(
 
         return attn_energy
 
+    @torch.jit.unused
     def expected_alignment_train(self, p_choose, key_padding_mask: Optional[Tensor]):
         """
         Calculating expected alignment for MMA
@@ -463,29 +447,33 @@ class MonotonicMultiheadAttentionHardAligned(
         # p_choose: bsz * num_heads, tgt_len, src_len
         bsz_num_heads, tgt_len, src_len = p_choose.size()
 
-        # cumprod_1mp : bsz * num_heads, tgt_len, src_len
-        cumprod_1mp = exclusive_cumprod(1 - p_choose, dim=2, eps=self.eps)
-        cumprod_1mp_clamp = torch.clamp(cumprod_1mp, self.eps, 1.0)
-
-        init_attention = p_choose.new_zeros([bsz_num_heads, 1, src_len])
-        init_attention[:, :, 0] = 1.0
-
-        previous_attn = [init_attention]
-
-        for i in range(tgt_len):
-            # p_choose: bsz * num_heads, tgt_len, src_len
-            # cumprod_1mp_clamp : bsz * num_heads, tgt_len, src_len
-            # previous_attn[i]: bsz * num_heads, 1, src_len
-            # alpha_i: bsz * num_heads, src_len
-            alpha_i = (
-                p_choose[:, i]
-                * cumprod_1mp[:, i]
-                * torch.cumsum(previous_attn[i][:, 0] / cumprod_1mp_clamp[:, i], dim=1)
-            ).clamp(0, 1.0)
-            previous_attn.append(alpha_i.unsqueeze(1))
-
-        # alpha: bsz * num_heads, tgt_len, src_len
-        alpha = torch.cat(previous_attn[1:], dim=1)
+        if self.alignment_train_impl == "fused":
+            # alpha: bsz * num_heads, tgt_len, src_len
+            alpha = expected_alignment_fused(p_choose, eps=self.eps)
+        else:
+            # cumprod_1mp : bsz * num_heads, tgt_len, src_len
+            cumprod_1mp = exclusive_cumprod(1 - p_choose, dim=2, eps=self.eps)
+            cumprod_1mp_clamp = torch.clamp(cumprod_1mp, self.eps, 1.0)
+
+            init_attention = p_choose.new_zeros([bsz_num_heads, 1, src_len])
+            init_attention[:, :, 0] = 1.0
+
+            previous_attn = [init_attention]
+
+            for i in range(tgt_len):
+                # p_choose: bsz * num_heads, tgt_len, src_len
+                # cumprod_1mp_clamp : bsz * num_heads, tgt_len, src_len
+                # previous_attn[i]: bsz * num_heads, 1, src_len
+                # alpha_i: bsz * num_heads, src_len
+                alpha_i = (
+                    p_choose[:, i]
+                    * cumprod_1mp[:, i]
+                    * torch.cumsum(previous_attn[i][:, 0] / cumprod_1mp_clamp[:, i], dim=1)
+                ).clamp(0, 1.0)
+                previous_attn.append(alpha_i.unsqueeze(1))
+
+            # alpha: bsz * num_heads, tgt_len, src_len
+            alpha = torch.cat(previous_attn[1:], dim=1)
 
         if self.mass_preservation:
             # Last token has the residual probabilities
@@ -538,7 +526,7 @@ class MonotonicMultiheadAttentionHardAligned(
         init_attention[:, :, 0] = 1.0
         previous_attn = [init_attention]
         pre_p_choose=init_attention.contiguous().squeeze(1)
-        pre_mask = torch.arange(0, src_len,device=p_choose.device).unsqueeze(0).repeat(bsz_num_heads, 1)
+        pre_mask = torch.arange(src_len, device=p_choose.device).unsqueeze(0).expand(bsz_num_heads, -1)
 
         for i in range(tgt_len):
         
@@ -623,54 +611,25 @@ class MonotonicMultiheadAttentionHardAligned(
 
         # src_lengths: bsz, num_heads
         src_lengths = src_lengths.expand_as(prev_monotonic_step)
-        # new_monotonic_step: bsz, num_heads
-        new_monotonic_step = prev_monotonic_step
-
-        step_offset = torch.tensor(0)
+        step_offset = prev_monotonic_step.new_zeros([bsz, 1])
         if encoder_padding_mask is not None:
-            if encoder_padding_mask[:, 0].any():
-                # left_pad_source = True:
-                step_offset = encoder_padding_mask.sum(dim=-1, keepdim=True)
-
-        max_steps = src_lengths - 1 if self.mass_preservation else src_lengths
-
-        # finish_read: bsz, num_heads
-        finish_read = new_monotonic_step.eq(max_steps)
-        p_choose_i = torch.tensor(1)
-        while finish_read.sum().item() < bsz * self.num_heads:
-            # p_choose: bsz * self.num_heads, src_len
-            # only choose the p at monotonic steps
-            # p_choose_i: bsz , self.num_heads
-            p_choose_i = (
-                p_choose.gather(
-                    2,
-                    (step_offset + new_monotonic_step)
-                    .unsqueeze(2)
-                    .clamp(0, src_len - 1),
-                )
-            ).squeeze(2)
-
-            action = (
-                (p_choose_i < 0.5)
-                .type_as(prev_monotonic_step)
-                .masked_fill(finish_read, 0)
+            # left_pad_source = True: offset by the number of pads,
+            # right padding has no pad at the first position
+            step_offset = (
+                encoder_padding_mask[:, :1].long()
+                * encoder_padding_mask.sum(dim=-1, keepdim=True)
             )
-            # 1 x bsz
-            # sample actions on unfinished seq
-            # 1 means stay, finish reading
-            # 0 means leave, continue reading
-            # dist = torch.distributions.bernoulli.Bernoulli(p_choose)
-            # action = dist.sample().type_as(finish_read) * (1 - finish_read)
 
-            new_monotonic_step += action
+        max_steps = src_lengths - 1 if self.mass_preservation else src_lengths
 
-            finish_read = new_monotonic_step.eq(max_steps) | (action == 0)
+        # new_monotonic_step: bsz, num_heads
+        new_monotonic_step, head_read = monotonic_step_search(
+            p_choose, prev_monotonic_step, max_steps, step_offset
+        )
 
         monotonic_cache["head_step"] = new_monotonic_step
         # Whether a head is looking for new input
-        monotonic_cache["head_read"] = (
-            new_monotonic_step.eq(max_steps) & (p_choose_i < 0.5)
-        )
+        monotonic_cache["head_read"] = head_read
 
         # alpha: bsz * num_heads, 1, src_len
         # new_monotonic_step: bsz, num_heads
@@ -716,36 +675,62 @@ class MonotonicMultiheadAttentionHardAligned(
             buffer,
         )
 
+    def reorder_incremental_state(
+        self,
+        incremental_state: Dict[str, Dict[str, Optional[Tensor]]],
+        new_order: Tensor,
+    ):
+        """
+        Reorder the cached keys and values, and the monotonic step of
+        every head, which differs between the beams of a sentence.
+        """
+        incremental_state = super().reorder_incremental_state(incremental_state, new_order)
+        monotonic_cache = self._get_monotonic_buffer(incremental_state)
+        if len(monotonic_cache) > 0:
+            for k in monotonic_cache.keys():
+                monotonic_cache_k = monotonic_cache[k]
+                if monotonic_cache_k is not None:
+                    monotonic_cache[k] = monotonic_cache_k.index_select(0, new_order)
+            self._set_monotonic_buffer(incremental_state, monotonic_cache)
+        return incremental_state
+
     def forward(
         self, query: Optional[Tensor], key: Optional[Tensor], value: Optional[Tensor],
         key_padding_mask: Optional[Tensor] = None, attn_mask: Optional[Tensor] = None, incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None,
-        need_weights: bool = True, static_kv: bool = False, need_head_weights: bool = False,need_alpha=False,pre_alpha=None
+        need_weights: bool = True, static_kv: bool = False, need_head_weights: bool = False, need_alpha: bool = False,
+        pre_alpha: Optional[Dict[str, Tensor]] = None,
     ):
         assert query is not None
         assert value is not None
         tgt_len, bsz, embed_dim = query.size()
         src_len = value.size(0)
 
+        # The alignment of the layer below, if any
+        alpha: Optional[Tensor] = None
+        p_choose: Optional[Tensor] = None
+        # The monotonic step of every head, at inference only
+        head_step: Optional[Tensor] = None
+        if pre_alpha is not None:
+            alpha = pre_alpha.get("alpha")
+            p_choose = pre_alpha.get("p_choose")
+            head_step = pre_alpha.get("head_step")
+
         # stepwise prob
         # p_choose: bsz * self.num_heads, tgt_len, src_len
-        if pre_alpha is not None and pre_alpha['alpha'] is not None:
-            alpha = pre_alpha['alpha'].contiguous().view(bsz* self.num_heads, tgt_len, src_len)
-            p_choose=pre_alpha['p_choose'].contiguous().view(bsz* self.num_heads, tgt_len, src_len)
-            #alpha = pre_alpha['alpha'].contiguous().repeat(1,self.num_heads,1,1).view(bsz* self.num_heads, tgt_len, src_len)
-            #p_choose=pre_alpha['p_choose'].contiguous().repeat(1,self.num_heads,1,1).view(bsz* self.num_heads, tgt_len, src_len)
+        if p_choose is None:
+            p_choose = self.p_choose(query, key, key_padding_mask, incremental_state)
         else:
-            if pre_alpha is not None:
-                p_choose = pre_alpha['p_choose'].contiguous().view(bsz* self.num_heads, tgt_len, src_len)
-
-            else:
-                p_choose = self.p_choose(query, key, key_padding_mask, incremental_state,)
+            p_choose = p_choose.contiguous().view(bsz * self.num_heads, tgt_len, src_len)
 
+        if alpha is not None:
+            alpha = alpha.contiguous().view(bsz * self.num_heads, tgt_len, src_len)
+        else:
             # expected alignment alpha
             # bsz * self.num_heads, tgt_len, src_len
-            #if incremental_state is not None:
-                #alpha = self.expected_alignment_infer(p_choose, key_padding_mask, incremental_state)
-            
-            if self.training==False :
+            if incremental_state is not None:
+                alpha = self.expected_alignment_infer(p_choose, key_padding_mask, incremental_state)
+                head_step = self._get_monotonic_buffer(incremental_state).get("head_step")
+            elif self.training==False :
                 #alpha = self.expected_alignment_infer(p_choose, key_padding_mask, incremental_state)
                 alpha = self.expected_alignment_test((p_choose>=0.5).int(), key_padding_mask,)
                 alpha = torch.round(alpha )
@@ -757,12 +742,12 @@ class MonotonicMultiheadAttentionHardAligned(
         beta = self.expected_attention(
             alpha, query, key, value,
             key_padding_mask, attn_mask,
-            incremental_state
+            incremental_state, head_step
         )
 
         attn_weights = beta
 
-        v_proj = self.v_proj_output(value)
+        v_proj = self.v_proj_output(value, incremental_state)
         assert v_proj is not None
 
         attn = torch.bmm(attn_weights.type_as(v_proj), v_proj)
@@ -775,13 +760,21 @@ class MonotonicMultiheadAttentionHardAligned(
         alpha = alpha.view(bsz, self.num_heads, tgt_len, src_len)
         p_choose = p_choose.view(bsz, self.num_heads, tgt_len, src_len)
 
-        return attn, {
+        attn_out: Dict[str, Tensor] = {
             "alpha": alpha,
             "beta": beta,
             "p_choose": p_choose,
         }
-
-    def input_projections(self, query: Optional[Tensor], key: Optional[Tensor], value: Optional[Tensor], name: str):
+        if head_step is not None:
+            # The layers above take the steps with the alignment,
+            # they do not search for steps of their own
+            attn_out["head_step"] = head_step
+        return attn, attn_out
+
+    def input_projections(
+        self, query: Optional[Tensor], key: Optional[Tensor], value: Optional[Tensor], name: str,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None,
+    ):
         """
         Prepare inputs for multihead attention
 
@@ -791,6 +784,8 @@ class MonotonicMultiheadAttentionHardAligned(
         key: src_len, bsz, embed_dim
         value: src_len, bsz, embed_dim
         name: monotonic or soft
+        incremental_state: dict, to take the projected key and value
+            from the static cache (see static_kv_projection)
         """
 
         if query is not None:
@@ -804,25 +799,76 @@ class MonotonicMultiheadAttentionHardAligned(
             q = None
 
         if key is not None:
-            bsz = key.size(1)
-            k = self.k_proj(key)
-            k = k.contiguous().view(
-                -1, bsz * self.num_heads, self.head_dim
-            ).transpose(0, 1)
+            if incremental_state is not None:
+                k = self.static_kv_projection(key, "prev_key", incremental_state)
+            else:
+                bsz = key.size(1)
+                k = self.k_proj(key)
+                k = k.contiguous().view(
+                    -1, bsz * self.num_heads, self.head_dim
+                ).transpose(0, 1)
         else:
             k = None
 
         if value is not None:
-            bsz = value.size(1)
-            v = self.v_proj(value)
-            v = v.contiguous().view(
-                -1, bsz * self.num_heads, self.head_dim
-            ).transpose(0, 1)
+            if incremental_state is not None:
+                v = self.static_kv_projection(value, "prev_value", incremental_state)
+            else:
+                bsz = value.size(1)
+                v = self.v_proj(value)
+                v = v.contiguous().view(
+                    -1, bsz * self.num_heads, self.head_dim
+                ).transpose(0, 1)
         else:
             v = None
 
         return q, k, v
 
+    def static_kv_projection(
+        self, x: Tensor, name: str, incremental_state: Dict[str, Dict[str, Optional[Tensor]]]
+    ):
+        """
+        Project the encoder states *x* with k_proj ("prev_key") or v_proj
+        ("prev_value"), caching the result in the attention buffer of
+        *incremental_state* across decoding steps.
+
+        The cache has the layout of the MultiheadAttention buffer, so
+        reorder_incremental_state reorders it with the beams. When the
+        source grows, only the new encoder states are projected: the
+        monotonic encoder is unidirectional, so the states of a source
+        prefix do not change when more source is read.
+
+        ============================================================
+        Expected input size
+        x: src_len, bsz, embed_dim
+        Return size
+        bsz * num_heads, src_len, head_dim
+        """
+        src_len, bsz, _ = x.size()
+        saved_state = self._get_input_buffer(incremental_state)
+        cached = saved_state.get(name)
+        # cached: bsz, num_heads, cached_len, head_dim
+        if cached is not None and (cached.size(0) != bsz or cached.size(2) > src_len):
+            cached = None
+        cached_len = 0 if cached is None else cached.size(2)
+
+        if cached is None or cached_len < src_len:
+            if name == "prev_key":
+                new_states = self.k_proj(x[cached_len:])
+            else:
+                new_states = self.v_proj(x[cached_len:])
+            new_states = new_states.view(
+                src_len - cached_len, bsz, self.num_heads, self.head_dim
+            ).permute(1, 2, 0, 3)
+            if cached is None:
+                cached = new_states.contiguous()
+            else:
+                cached = torch.cat([cached, new_states], dim=2)
+            saved_state[name] = cached
+            self._set_input_buffer(incremental_state, saved_state)
+
+        return cached.view(bsz * self.num_heads, src_len, self.head_dim)
+
     def p_choose(
         self, query: Optional[Tensor], key: Optional[Tensor], key_padding_mask: Optional[Tensor] = None,
         incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None
@@ -844,7 +890,7 @@ class MonotonicMultiheadAttentionHardAligned(
 
         # prepare inputs
         q_proj, k_proj, _ = self.input_projections(
-            query, key, None, "monotonic"
+            query, key, None, "monotonic", incremental_state
         )
 
         # attention energy
@@ -852,14 +898,22 @@ class MonotonicMultiheadAttentionHardAligned(
 
         return p_choose_strategy.hard_aligned(q_proj, k_proj, attn_energy, self.noise_mean, self.noise_var, self.training)
 
-    def expected_attention(self, alpha, *args):
+    def expected_attention(
+        self, alpha, query: Optional[Tensor], key: Optional[Tensor], value: Optional[Tensor],
+        key_padding_mask: Optional[Tensor], attn_mask: Optional[Tensor], incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+        head_step: Optional[Tensor] = None,
+    ):
         """
         For MMA-H, beta = alpha
         """
         return alpha
 
-    def v_proj_output(self, value):
-        _, _, v_proj = self.input_projections(None, None, value, "output")
+    def v_proj_output(
+        self, value, incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None
+    ):
+        _, _, v_proj = self.input_projections(
+            None, None, value, "output", incremental_state
+        )
         return v_proj
 
 
@@ -874,31 +928,26 @@ class MonotonicMultiheadAttentionInfiniteLookback(
     def init_soft_attention(self):
         self.k_proj_soft = nn.Linear(self.kdim, self.embed_dim, bias=True)
         self.q_proj_soft = nn.Linear(self.embed_dim, self.embed_dim, bias=True)
-        self.k_in_proj["soft"] = self.k_proj_soft
-        self.q_in_proj["soft"] = self.q_proj_soft
 
         if self.qkv_same_dim:
             # Empirically observed the convergence to be much better with
             # the scaled initialization
-            nn.init.xavier_uniform_(
-                self.k_in_proj["soft"].weight, gain=1 / math.sqrt(2)
-            )
-            nn.init.xavier_uniform_(
-                self.q_in_proj["soft"].weight, gain=1 / math.sqrt(2)
-            )
+            nn.init.xavier_uniform_(self.k_proj_soft.weight, gain=1 / math.sqrt(2))
+            nn.init.xavier_uniform_(self.q_proj_soft.weight, gain=1 / math.sqrt(2))
         else:
-            nn.init.xavier_uniform_(self.k_in_proj["soft"].weight)
-            nn.init.xavier_uniform_(self.q_in_proj["soft"].weight)
+            nn.init.xavier_uniform_(self.k_proj_soft.weight)
+            nn.init.xavier_uniform_(self.q_proj_soft.weight)
 
     def expected_attention(
         self, alpha, query: Optional[Tensor], key: Optional[Tensor], value: Optional[Tensor],
-        key_padding_mask: Optional[Tensor], attn_mask: Optional[Tensor], incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]]
+        key_padding_mask: Optional[Tensor], attn_mask: Optional[Tensor], incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+        head_step: Optional[Tensor] = None,
     ):
         # monotonic attention, we will calculate milk here
         bsz_x_num_heads, tgt_len, src_len = alpha.size()
         bsz = int(bsz_x_num_heads / self.num_heads)
 
-        q, k, _ = self.input_projections(query, key, None, "soft")
+        q, k, _ = self.input_projections(query, key, None, "soft", incremental_state)
         soft_energy = self.attn_energy(q, k, key_padding_mask, attn_mask)
 
         assert list(soft_energy.size()) == \
@@ -907,16 +956,13 @@ class MonotonicMultiheadAttentionInfiniteLookback(
         soft_energy = soft_energy.view(bsz * self.num_heads, tgt_len, src_len)
 
         if incremental_state is not None:
-            monotonic_cache = self._get_monotonic_buffer(incremental_state)
-            head_step = monotonic_cache["head_step"]
+            # head_step: bsz, num_heads, from the layer computing the alignment
             assert head_step is not None
             monotonic_length = head_step + 1
-            step_offset = 0
             if key_padding_mask is not None:
                 if key_padding_mask[:, 0].any():
                     # left_pad_source = True:
-                    step_offset = key_padding_mask.sum(dim=-1, keepdim=True)
-            monotonic_length += step_offset
+                    monotonic_length += key_padding_mask.sum(dim=-1, keepdim=True)
             mask = lengths_to_mask(
                 monotonic_length.view(-1),
                 soft_energy.size(2), 1
@@ -963,8 +1009,6 @@ class MonotonicMultiheadAttentionWaitK(
 ):
     def __init__(self, args):
         super().__init__(args)
-        self.q_in_proj["soft"] = self.q_in_proj["monotonic"]
-        self.k_in_proj["soft"] = self.k_in_proj["monotonic"]
         self.waitk_lagging = args.waitk_lagging
         assert self.waitk_lagging > 0, (
             f"Lagging has to been larger than 0, get {self.waitk_lagging}."
@@ -990,4 +1034,6 @@ class MonotonicMultiheadAttentionWaitK(
         key: bsz, src_len
         key_padding_mask: bsz, src_len
         """
+        assert query is not None
+        assert key is not None
         return p_choose_strategy.waitk(query, key, self.waitk_lagging, self.num_heads, key_padding_mask, incremental_state)
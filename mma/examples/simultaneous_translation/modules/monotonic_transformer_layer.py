@@ -11,15 +11,44 @@ from typing import Dict, List, Optional
 
 import torch
 from torch import Tensor
-import pdb
 
 
 class TransformerMonotonicEncoderLayer(TransformerEncoderLayer):
-    def forward(self, x, encoder_padding_mask):
+    def forward(
+        self,
+        x,
+        encoder_padding_mask: Optional[Tensor],
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None,
+    ):
+        """
+        Args:
+            x (Tensor): input to the layer of shape `(seq_len, batch, embed_dim)`
+            encoder_padding_mask (ByteTensor): binary ByteTensor of shape
+                `(batch, seq_len)` where padding elements are indicated by ``1``.
+            incremental_state (dict, optional): if given, *x* only holds
+                the newly read source positions, and the keys and values
+                of the previous positions are read from and appended to
+                the cache of the self attention.
+
+        Returns:
+            encoded output of shape `(seq_len, batch, embed_dim)`
+        """
         seq_len, _, _ = x.size()
-        attn_mask = x.new_ones([seq_len, seq_len]).triu(1)
-        attn_mask = attn_mask.masked_fill(attn_mask.bool(), float("-inf"))
-        return super().forward(x, encoder_padding_mask, attn_mask)
+        prev_len = 0
+        if incremental_state is not None:
+            prev_key = self.self_attn._get_input_buffer(incremental_state).get(
+                "prev_key"
+            )
+            if prev_key is not None:
+                prev_len = prev_key.size(2)
+        # Causal mask of the new positions over all the positions read so far
+        attn_mask = x.new_ones([seq_len, prev_len + seq_len]).triu(1 + prev_len)
+        return self.forward_scriptable(
+            x,
+            encoder_padding_mask,
+            attn_mask=attn_mask,
+            incremental_state=incremental_state,
+        )
 
 
 class TransformerMonotonicDecoderLayer(TransformerDecoderLayer):
@@ -53,14 +82,26 @@ class TransformerMonotonicDecoderLayer(TransformerDecoderLayer):
         )
 
     def prune_incremental_state(
-        self, incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]]
+        self,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]],
+        length: Optional[int] = None,
     ):
+        """
+        Roll the self attention cache back to its first *length* steps,
+        or drop the last step if *length* is None.
+        Rolling back to a length the cache does not exceed is a no-op.
+        The narrowed buffers are views, but the next self attention step
+        still concatenates its keys and values to them, which copies the
+        whole cache.
+        """
         input_buffer = self.self_attn._get_input_buffer(incremental_state)
         for key in ["prev_key", "prev_value"]:
             input_buffer_key = input_buffer[key]
             assert input_buffer_key is not None
-            if input_buffer_key.size(2) > 1:
-                input_buffer[key] = input_buffer_key[:, :, :-1, :]
+            cache_len = input_buffer_key.size(2)
+            keep_len = cache_len - 1 if length is None else min(length, cache_len)
+            if keep_len > 0:
+                input_buffer[key] = input_buffer_key.narrow(2, 0, keep_len)
             else:
                 typed_empty_dict: Dict[str, Optional[Tensor]] = {}
                 input_buffer = typed_empty_dict
@@ -83,7 +124,7 @@ class TransformerMonotonicDecoderLayer(TransformerDecoderLayer):
         self_attn_padding_mask: Optional[torch.Tensor] = None,
         need_attn: bool = False,
         need_head_weights: bool = False,
-        pre_alpha=None,
+        pre_alpha: Optional[Dict[str, Tensor]] = None,
     ):
         """
         Args:
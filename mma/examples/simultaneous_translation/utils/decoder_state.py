@@ -0,0 +1,93 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from typing import Dict, List, Optional
+
+import torch
+from fairseq.logging.meters import StopwatchMeter
+from torch import Tensor
+
+
+class DecoderStateManager(object):
+    """
+    Decoder states of a simultaneous agent for one stream.
+
+    The target prefix is kept as a growing preallocated tensor,
+    so that each policy call only looks up the newly predicted units.
+    The incremental state of the decoder lives here as well;
+    a READ decision rolls the self attention caches back to the
+    committed prefix length (see TransformerMonotonicDecoder.clear_cache).
+
+    meters holds per-call timings:
+        policy: the whole policy call
+        decoder: the decoder forward pass within the policy call
+    """
+
+    def __init__(self, dictionary, device=None, capacity: int = 64):
+        self.dictionary = dictionary
+        self.device = device
+        self.capacity = capacity
+        self.meters = {
+            "policy": StopwatchMeter(),
+            "decoder": StopwatchMeter(),
+        }
+        self.reset()
+
+    def reset(self):
+        self.tokens = torch.full(
+            [1, self.capacity],
+            self.dictionary.pad(),
+            dtype=torch.long,
+            device=self.device,
+        )
+        self.tokens[0, 0] = self.dictionary.eos()
+        self.length = 1
+        # Number of target units already looked up
+        self.num_units = 0
+        self.incremental_state: Dict[str, Dict[str, Optional[Tensor]]] = {
+            "online": {}
+        }
+
+    def _grow(self, length: int):
+        if length <= self.tokens.size(1):
+            return
+        capacity = self.tokens.size(1)
+        while capacity < length:
+            capacity *= 2
+        tokens = self.tokens.new_full([1, capacity], self.dictionary.pad())
+        tokens[:, : self.length] = self.tokens[:, : self.length]
+        self.tokens = tokens
+
+    def update(self, units: List[Optional[str]]):
+        """
+        Append the units of *units* that were not seen by the previous call.
+        *units* is the whole target unit list, None entries are skipped.
+        """
+        if len(units) < self.num_units:
+            # The unit list was rewritten, the cached states are stale
+            self.reset()
+
+        new_indices = [
+            self.dictionary.index(x) for x in units[self.num_units :] if x is not None
+        ]
+        self.num_units = len(units)
+        if len(new_indices) == 0:
+            return
+
+        self._grow(self.length + len(new_indices))
+        self.tokens[0, self.length : self.length + len(new_indices)] = torch.tensor(
+            new_indices, dtype=torch.long, device=self.tokens.device
+        )
+        self.length += len(new_indices)
+
+    def prefix(self) -> Tensor:
+        """The target prefix, starting with eos, of shape `(1, length)`"""
+        return self.tokens[:, : self.length]
+
+    def timings(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {"n": meter.n, "sum": meter.sum, "avg": meter.avg}
+            for name, meter in self.meters.items()
+        }
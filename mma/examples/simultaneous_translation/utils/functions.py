@@ -4,6 +4,25 @@
 # LICENSE file in the root directory of this source tree.
 
 import torch
+from fairseq.utils import buffered_arange
+from torch import Tensor
+
+
+@torch.jit.unused
+def _buffered_arange(n: int, device: torch.device) -> Tensor:
+    return buffered_arange(n, device)
+
+
+def cached_arange(n: int, device: torch.device) -> Tensor:
+    """
+    torch.arange(n) on *device*. In eager mode it is sliced from the
+    buffer of fairseq.utils.buffered_arange, which TorchScript can not
+    compile, so scripted code falls back to torch.arange.
+    The returned tensor must not be modified in place.
+    """
+    if torch.jit.is_scripting():
+        return torch.arange(n, device=device)
+    return _buffered_arange(n, device)
 
 
 def exclusive_cumprod(tensor, dim: int, eps: float = 1e-10):
@@ -52,6 +71,156 @@ def safe_cumprod(tensor, dim: int, eps: float = 1e-10):
     return exp_cumsum_log_tensor
 
 
+class ExpectedAlignmentFunction(torch.autograd.Function):
+    """
+    Fused recurrence of the expected alignment for MMA training.
+
+    alpha_i = clamp(a_i * cumsum(alpha_{i-1} / c_i), 0, 1)
+
+    Where a_i = p_i * cumprod(1 - p_i) and c_i = clamp(cumprod(1 - p_i), eps, 1)
+    are computed for all target steps at once by the caller.
+    The forward pass only runs the recurrence itself, writing into a
+    preallocated buffer without building an autograd graph per step.
+    In the backward pass, every term except the carry to alpha_{i-1}
+    is recomputed in parallel over the target steps.
+    """
+
+    @staticmethod
+    def forward(ctx, a, c):
+        # a, c: bsz * num_heads, tgt_len, src_len
+        bsz_num_heads, tgt_len, src_len = a.size()
+
+        # Target steps go first so that every step is a contiguous slice
+        # a, c: tgt_len, bsz * num_heads, src_len
+        a = a.transpose(0, 1).contiguous()
+        c = c.transpose(0, 1).contiguous()
+
+        # prev_alpha[i] is alpha_{i-1}, prev_alpha[0] is the init attention
+        prev_alpha = a.new_zeros([tgt_len + 1, bsz_num_heads, src_len])
+        prev_alpha[0, :, 0] = 1.0
+        buffer = a.new_empty([bsz_num_heads, src_len])
+
+        for i in range(tgt_len):
+            torch.div(prev_alpha[i], c[i], out=buffer)
+            torch.cumsum(buffer, dim=1, out=prev_alpha[i + 1])
+            prev_alpha[i + 1].mul_(a[i]).clamp_(0, 1.0)
+
+        ctx.save_for_backward(a, c, prev_alpha)
+
+        # alpha: bsz * num_heads, tgt_len, src_len
+        return prev_alpha[1:].transpose(0, 1).clone(
+            memory_format=torch.contiguous_format
+        )
+
+    @staticmethod
+    def backward(ctx, grad_alpha):
+        # a, c, prev_alpha: tgt_len (+ 1), bsz * num_heads, src_len
+        a, c, prev_alpha = ctx.saved_tensors
+        tgt_len = a.size(0)
+
+        # Recompute the cumsum and the pre-clamp values for all steps at once
+        scaled_prev = prev_alpha[:-1] / c
+        cumsum_prev = torch.cumsum(scaled_prev, dim=2)
+        pre_clamp = a * cumsum_prev
+        clamp_mask = (pre_clamp >= 0) & (pre_clamp <= 1.0)
+
+        grad_alpha = grad_alpha.transpose(0, 1).contiguous()
+        grad_pre_clamp = torch.empty_like(grad_alpha)
+        grad_scaled_prev = torch.empty_like(grad_alpha)
+        carry = grad_alpha.new_zeros(grad_alpha[0].size())
+
+        for i in range(tgt_len - 1, -1, -1):
+            torch.mul(grad_alpha[i] + carry, clamp_mask[i], out=grad_pre_clamp[i])
+            # The gradient of a cumsum is a reversed cumsum
+            grad_scaled_prev[i] = (
+                (grad_pre_clamp[i] * a[i]).flip(1).cumsum(1).flip(1)
+            )
+            carry = grad_scaled_prev[i] / c[i]
+
+        grad_a = grad_c = None
+        if ctx.needs_input_grad[0]:
+            grad_a = (grad_pre_clamp * cumsum_prev).transpose(0, 1)
+        if ctx.needs_input_grad[1]:
+            grad_c = (-grad_scaled_prev * scaled_prev / c).transpose(0, 1)
+
+        return grad_a, grad_c
+
+
+def expected_alignment_fused(p_choose, eps: float = 1e-10):
+    """
+    Expected alignment for MMA training, numerically matched to the
+    per-target-step loop in MonotonicAttention.expected_alignment_train
+    (without mass preservation).
+
+    p_choose: bsz * num_heads, tgt_len, src_len
+    """
+    cumprod_1mp = exclusive_cumprod(1 - p_choose, dim=2, eps=eps)
+    cumprod_1mp_clamp = torch.clamp(cumprod_1mp, eps, 1.0)
+
+    return ExpectedAlignmentFunction.apply(p_choose * cumprod_1mp, cumprod_1mp_clamp)
+
+
+def monotonic_step_search(p_choose, prev_step, max_steps, step_offset):
+    """
+    Greedy monotonic step search for MMA inference, in one shot.
+
+    Starting from prev_step, each head moves forward to the first step
+    whose p_choose >= 0.5, and stops at max_steps otherwise.
+    This is identical to advancing every head one step at a time,
+    but without a host sync per step.
+
+    ============================================================
+    Expected input size
+    p_choose: bsz, num_heads, src_len
+    prev_step: bsz, num_heads
+    max_steps: bsz, num_heads
+    step_offset: bsz, 1 (left padding) or a scalar
+
+    Returns
+    new_step: bsz, num_heads
+    head_read: bsz, num_heads, whether a head is looking for new input
+    """
+    bsz, num_heads, src_len = p_choose.size()
+    max_steps = max_steps.type_as(prev_step)
+    step_offset = torch.as_tensor(step_offset, device=prev_step.device)
+
+    # steps: bsz or 1, 1, src_len, the monotonic step of each source position
+    steps = (
+        cached_arange(src_len, prev_step.device).view(1, 1, src_len)
+        - step_offset.view(-1, 1, 1)
+    ).type_as(prev_step)
+
+    # A head stops at the first step in [prev_step, max_steps)
+    # where p_choose >= 0.5
+    stop = (
+        (p_choose >= 0.5)
+        & (steps >= prev_step.unsqueeze(2))
+        & (steps < max_steps.unsqueeze(2))
+    )
+    new_step = torch.where(
+        stop, steps, max_steps.unsqueeze(2).expand_as(stop)
+    ).min(dim=2)[0]
+    # Finished heads stay where they are
+    new_step = torch.where(prev_step < max_steps, new_step, prev_step)
+
+    # p_choose at the new steps, p_choose_i: bsz, num_heads
+    p_choose_i = p_choose.gather(
+        2, (step_offset.view(-1, 1) + new_step).unsqueeze(2).clamp(0, src_len - 1)
+    ).squeeze(2)
+
+    # Number of one-step iterations each head would take: a head that
+    # stops early also checks its final step, a head at max_steps does not.
+    num_iters = new_step - prev_step + (new_step < max_steps).type_as(prev_step)
+    # A head reaching max_steps reads if p_choose at max_steps is < 0.5.
+    # When it is the last head to finish, the one-step search never
+    # checks max_steps, and the head reads because it just moved there.
+    head_read = new_step.eq(max_steps) & torch.where(
+        num_iters < num_iters.max(), p_choose_i < 0.5, num_iters > 0
+    )
+
+    return new_step, head_read
+
+
 def lengths_to_mask(lengths, max_len: int, dim: int = 0, negative_mask: bool = False):
     """
     Convert a tensor of lengths to mask
@@ -77,7 +246,7 @@ def lengths_to_mask(lengths, max_len: int, dim: int = 0, negative_mask: bool = F
     batch_size = lengths.size(0)
     # batch_size, max_len
     mask = (
-        torch.arange(max_len, device="cuda")
+        cached_arange(max_len, lengths.device)
         .expand(batch_size, max_len)
         .type_as(lengths)
         < lengths
@@ -157,6 +157,10 @@ class DifferentiableAverageLagging(LatencyMetric):
         1. delays_i if i == 1
         2. max(delays_i, delays'_{i-1} + 1 / gamma)
 
+    Unrolling the recursion,
+    delays'_i - (i - 1) / gamma = max_{j <= i} delays_j - (j - 1) / gamma
+    which is computed for all i at once with a cumulative max.
+
     """
 
     @staticmethod
@@ -164,28 +168,14 @@ class DifferentiableAverageLagging(LatencyMetric):
         tgt_len, bsz = delays.size()
 
         gamma = tgt_lens / src_lens
-        new_delays = torch.zeros_like(delays)
-
-        for i in range(delays.size(0)):
-            if i == 0:
-                new_delays[i] = delays[i]
-            else:
-                new_delays[i] = torch.cat(
-                    [
-                        new_delays[i - 1].unsqueeze(0) + 1 / gamma,
-                        delays[i].unsqueeze(0),
-                    ],
-                    dim=0,
-                ).max(dim=0)[0]
-
-        DAL = (
-            new_delays
-            - torch.arange(delays.size(0), device=delays.device)
+        DAL = torch.cummax(
+            delays
+            - torch.arange(tgt_len, device=delays.device)
             .unsqueeze(1)
             .type_as(delays)
-            .expand_as(delays)
-            / gamma
-        )
+            / gamma,
+            dim=0,
+        )[0]
         if target_padding_mask is not None:
             DAL = DAL.masked_fill(target_padding_mask, 0)
 
@@ -1,6 +1,7 @@
 from typing import Optional, Dict
 from torch import Tensor
 import torch
+from examples.simultaneous_translation.utils.functions import cached_arange
 
 
 def waitk(
@@ -49,7 +50,11 @@ def waitk(
     # Third, resize the tensor to (bsz, tgt_len, src_len)
 
     activate_indices_offset = (
-        (torch.arange(tgt_len, device="cuda") * (max_src_len + 1) + waitk_lagging - 1)
+        (
+            cached_arange(tgt_len, query.device) * (max_src_len + 1)
+            + waitk_lagging
+            - 1
+        )
         .unsqueeze(0)
         .expand(bsz, tgt_len)
         .to(query)
@@ -101,14 +106,14 @@ def hard_aligned(
     1 to read, 0 to write
     """
 
-    noise = 0
     if training:
         # add noise here to encourage discretness
         noise = torch.normal(
             noise_mean, noise_var, attn_energy.size(), device=attn_energy.device
         ).type_as(attn_energy)
+        attn_energy = attn_energy + noise
 
-    p_choose = torch.sigmoid(attn_energy + noise)
+    p_choose = torch.sigmoid(attn_energy)
     _, _, tgt_len, src_len = p_choose.size()
 
     # p_choose: bsz * self.num_heads, tgt_len, src_len
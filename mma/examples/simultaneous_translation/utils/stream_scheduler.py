@@ -0,0 +1,321 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from typing import Dict, List, NamedTuple, Optional
+
+import torch
+from torch import Tensor
+
+
+READ_ACTION = "read"
+WRITE_ACTION = "write"
+
+StreamAction = NamedTuple(
+    "StreamAction",
+    [
+        ("action", str),
+        # The predicted target index of a write action
+        ("index", Optional[int]),
+    ],
+)
+
+
+class StreamState(object):
+    """States of one simultaneous translation stream"""
+
+    def __init__(self, eos: int):
+        self.source: List[int] = []
+        self.source_finished = False
+        # Number of source units the encoder states cover
+        self.num_encoded = 0
+        self.encoder_incremental_state: Dict[str, Dict[str, Optional[Tensor]]] = {}
+        self.encoder_out: Optional[Tensor] = None
+        # The target prefix, starting with eos
+        self.target: List[int] = [eos]
+        self.incremental_state: Dict[str, Dict[str, Optional[Tensor]]] = {}
+        # Whether the stream read and no new source arrived since
+        self.waiting_for_source = False
+        self.finished = False
+
+
+class MultiStreamScheduler(object):
+    """
+    Serve many simultaneous translation streams with one monotonic model.
+
+    Each call to *step* runs the policy of every stream that can act:
+    streams without encoder states read, and the others are grouped into
+    batched decoder steps of at most *max_batch_size* streams, with
+    ragged source and target lengths.
+    A stream that decides to read waits until *push_source* gives it new
+    source units or finishes its source.
+
+    The decisions and predictions are the same as running the
+    incremental decoder on every stream on its own, as the simultaneous
+    agents do, up to floating point differences from padding.
+    Hard aligned and infinite lookback models can be served, wait-k
+    models can not.
+    """
+
+    def __init__(self, model, max_len: int = 200, max_batch_size: int = 32):
+        from examples.simultaneous_translation.models.transformer_monotonic_attention import (
+            TransformerMonotonicEncoder,
+        )
+        from examples.simultaneous_translation.modules.monotonic_multihead_attention import (
+            MonotonicMultiheadAttentionWaitK,
+        )
+
+        self.model = model
+        self.max_len = max_len
+        self.max_batch_size = max_batch_size
+        self.src_eos = model.encoder.dictionary.eos()
+        self.tgt_dict = model.decoder.dictionary
+        self.incremental_encoder = isinstance(
+            model.encoder, TransformerMonotonicEncoder
+        )
+        self.device = next(model.parameters()).device
+        if any(
+            isinstance(layer.encoder_attn, MonotonicMultiheadAttentionWaitK)
+            for layer in model.decoder.layers
+        ):
+            # The wait-k p_choose takes a single target step for the batch
+            raise ValueError("Wait-k models can not be served with ragged batches.")
+
+        self.streams: Dict[int, StreamState] = {}
+        self._next_id = 0
+
+    def add_stream(self) -> int:
+        stream_id = self._next_id
+        self._next_id += 1
+        self.streams[stream_id] = StreamState(self.tgt_dict.eos())
+        return stream_id
+
+    def remove_stream(self, stream_id: int):
+        del self.streams[stream_id]
+
+    def push_source(self, stream_id: int, indices: List[int], finished: bool = False):
+        """Append source units to a stream, *finished* ends its source."""
+        stream = self.streams[stream_id]
+        assert not stream.source_finished, "The source is already finished."
+        stream.source.extend(indices)
+        stream.waiting_for_source = False
+        if finished:
+            # Append the eos index when the source is over
+            stream.source.append(self.src_eos)
+            stream.source_finished = True
+
+    def step(self) -> Dict[int, StreamAction]:
+        """
+        Run the policy of every stream that can act.
+        Returns the action of those streams, by stream id.
+        """
+        actions: Dict[int, StreamAction] = {}
+        decode_ids: List[int] = []
+        for stream_id, stream in self.streams.items():
+            if stream.finished or stream.waiting_for_source:
+                continue
+            if len(stream.source) == 0:
+                # No encoder states, read a token first
+                stream.waiting_for_source = True
+                actions[stream_id] = StreamAction(READ_ACTION, None)
+                continue
+            self._update_encoder(stream)
+            decode_ids.append(stream_id)
+
+        with torch.no_grad():
+            for start in range(0, len(decode_ids), self.max_batch_size):
+                batch_ids = decode_ids[start : start + self.max_batch_size]
+                actions.update(
+                    zip(batch_ids, self._decode([self.streams[i] for i in batch_ids]))
+                )
+
+        return actions
+
+    def _update_encoder(self, stream: StreamState):
+        if stream.num_encoded == len(stream.source):
+            return
+        src_tokens = torch.tensor([stream.source], dtype=torch.long, device=self.device)
+        with torch.no_grad():
+            if self.incremental_encoder:
+                encoder_out = self.model.encoder(
+                    src_tokens, incremental_state=stream.encoder_incremental_state
+                )
+            else:
+                encoder_out = self.model.encoder(src_tokens)
+        stream.encoder_out = encoder_out["encoder_out"][0]
+        stream.num_encoded = len(stream.source)
+
+    def _collate_encoder_out(self, streams: List[StreamState]):
+        # Right padded encoder states: src_len, bsz, embed_dim
+        src_lengths = [stream.encoder_out.size(0) for stream in streams]
+        max_src_len = max(src_lengths)
+        first = streams[0].encoder_out
+        encoder_out = first.new_zeros([max_src_len, len(streams), first.size(2)])
+        encoder_padding_mask = torch.ones(
+            [len(streams), max_src_len], dtype=torch.bool, device=self.device
+        )
+        for i, stream in enumerate(streams):
+            encoder_out[: src_lengths[i], i] = stream.encoder_out[:, 0]
+            encoder_padding_mask[i, : src_lengths[i]] = False
+        return {
+            "encoder_out": [encoder_out],
+            "encoder_padding_mask": [encoder_padding_mask],
+        }, src_lengths
+
+    def _collate_incremental_state(self, streams: List[StreamState]):
+        """
+        Batch the decoder caches of *streams*.
+        The self attention caches are right padded, with a key padding mask.
+        """
+        incremental_state: Dict[str, Dict[str, Optional[Tensor]]] = {
+            "online": {},
+            "steps": {},
+        }
+        # The read decisions are made by the scheduler for each stream
+        incremental_state["online"]["only"] = torch.tensor([False])
+        # The target prefixes are left padded, the decoder takes their
+        # lengths to embed the position of each last token. They stay on
+        # the host, as they are only used to slice the prefixes.
+        incremental_state["steps"]["tgt_lengths"] = torch.tensor(
+            [len(stream.target) for stream in streams]
+        )
+        cache_lengths = [len(stream.target) - 1 for stream in streams]
+        max_cache_len = max(cache_lengths)
+
+        for layer in self.model.decoder.layers:
+            if max_cache_len > 0:
+                buffers = [
+                    layer.self_attn._get_input_buffer(stream.incremental_state)
+                    for stream in streams
+                ]
+                saved_state: Dict[str, Optional[Tensor]] = {}
+                for key in ["prev_key", "prev_value"]:
+                    first = next(b[key] for b in buffers if key in b)
+                    batch = first.new_zeros(
+                        [len(streams), first.size(1), max_cache_len, first.size(3)]
+                    )
+                    for i, buffer in enumerate(buffers):
+                        if cache_lengths[i] > 0:
+                            batch[i, :, : cache_lengths[i]] = buffer[key][0]
+                    saved_state[key] = batch
+                key_padding_mask = torch.ones(
+                    [len(streams), max_cache_len], dtype=torch.bool, device=self.device
+                )
+                for i, cache_len in enumerate(cache_lengths):
+                    key_padding_mask[i, :cache_len] = False
+                saved_state["prev_key_padding_mask"] = key_padding_mask
+                layer.self_attn._set_input_buffer(incremental_state, saved_state)
+
+            # Only the layer computing the alignment keeps the steps of the
+            # heads, the layers above take them with the alignment
+            if layer.need_alpha:
+                head_steps = []
+                for stream in streams:
+                    head_step = layer.encoder_attn._get_monotonic_buffer(
+                        stream.incremental_state
+                    ).get("head_step")
+                    if head_step is None:
+                        head_step = torch.zeros(
+                            [1, layer.encoder_attn.num_heads],
+                            dtype=torch.long,
+                            device=self.device,
+                        )
+                    head_steps.append(head_step)
+                layer.encoder_attn._set_monotonic_buffer(
+                    incremental_state, {"head_step": torch.cat(head_steps, dim=0)}
+                )
+
+        return incremental_state, cache_lengths
+
+    def _split_incremental_state(
+        self,
+        streams: List[StreamState],
+        incremental_state: Dict[str, Dict[str, Optional[Tensor]]],
+        cache_lengths: List[int],
+        read: List[bool],
+    ):
+        """
+        Write the batched caches back to *streams*.
+        A stream that reads drops the step that was just computed.
+        """
+        max_cache_len = max(cache_lengths)
+        for layer in self.model.decoder.layers:
+            buffer = layer.self_attn._get_input_buffer(incremental_state)
+            for i, stream in enumerate(streams):
+                saved_state: Dict[str, Optional[Tensor]] = {}
+                keep = list(range(cache_lengths[i]))
+                if not read[i]:
+                    keep.append(max_cache_len)
+                if len(keep) > 0:
+                    index = torch.tensor(keep, dtype=torch.long, device=self.device)
+                    for key in ["prev_key", "prev_value"]:
+                        saved_state[key] = buffer[key][i : i + 1].index_select(2, index)
+                layer.self_attn._set_input_buffer(stream.incremental_state, saved_state)
+
+            if layer.need_alpha:
+                monotonic_buffer = layer.encoder_attn._get_monotonic_buffer(
+                    incremental_state
+                )
+                for i, stream in enumerate(streams):
+                    layer.encoder_attn._set_monotonic_buffer(
+                        stream.incremental_state,
+                        {
+                            key: value[i : i + 1]
+                            for key, value in monotonic_buffer.items()
+                            if value is not None
+                        },
+                    )
+
+    def _decode(self, streams: List[StreamState]) -> List[StreamAction]:
+        decoder = self.model.decoder
+        bsz = len(streams)
+
+        # Left padded target prefixes: bsz, max_tgt_len
+        max_tgt_len = max(len(stream.target) for stream in streams)
+        prev_output_tokens = torch.full(
+            [bsz, max_tgt_len], self.tgt_dict.pad(), dtype=torch.long
+        )
+        for i, stream in enumerate(streams):
+            prev_output_tokens[i, max_tgt_len - len(stream.target) :] = torch.tensor(
+                stream.target
+            )
+        prev_output_tokens = prev_output_tokens.to(self.device)
+
+        encoder_out, src_lengths = self._collate_encoder_out(streams)
+        incremental_state, cache_lengths = self._collate_incremental_state(streams)
+
+        x, outputs = decoder.extract_features(
+            prev_output_tokens,
+            encoder_out=encoder_out,
+            incremental_state=incremental_state,
+        )
+
+        # Same read decision as the online decoding of a single stream:
+        # read if a head would move past the source read so far
+        head_step = outputs["step_list"][0]
+        # p_choose: bsz, num_heads, src_len
+        p_choose = outputs["attn_list"][0]["p_choose"].squeeze(2)
+        p_choose = p_choose.gather(2, head_step.unsqueeze(2)).squeeze(2)
+        new_steps = head_step + (p_choose < 0.5).type_as(head_step)
+        online = torch.tensor(
+            [not stream.source_finished for stream in streams], device=self.device
+        )
+        src_lengths = torch.tensor(src_lengths, device=self.device)
+        read = (online & (new_steps >= src_lengths.unsqueeze(1)).any(dim=1)).tolist()
+
+        index = decoder.output_layer(x[:, -1]).argmax(dim=-1).tolist()
+
+        self._split_incremental_state(streams, incremental_state, cache_lengths, read)
+
+        actions = []
+        for i, stream in enumerate(streams):
+            if read[i]:
+                stream.waiting_for_source = True
+                actions.append(StreamAction(READ_ACTION, None))
+                continue
+            stream.target.append(index[i])
+            if index[i] == self.tgt_dict.eos() or len(stream.target) > self.max_len:
+                stream.finished = True
+            actions.append(StreamAction(WRITE_ACTION, index[i]))
+        return actions
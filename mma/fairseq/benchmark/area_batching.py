@@ -0,0 +1,145 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU benchmark of offline greedy decoding of a set of sentences of mixed
+lengths with a monotonic model, batched as fairseq-generate does with
+--batch-size ("sentences") or with --max-token-area ("area"). The area
+budget is the largest padded area (batch size x source length x target
+length) of the "sentences" batches, so that both modes peak at the same
+memory for the attention tensors.
+
+The targets are forced with prefix tokens, so that every hypothesis is
+as long as its reference.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.area_batching --threads 1
+"""
+
+import argparse
+
+import numpy as np
+import torch
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from fairseq.data import LanguagePairDataset
+from fairseq.sequence_generator import SequenceGenerator
+from tests.utils import build_monotonic_model
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-sentences", type=int, default=400)
+    parser.add_argument("--min-len", type=int, default=5)
+    parser.add_argument("--max-len", type=int, default=100)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 50])
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--ffn-embed-dim", type=int, default=1024)
+    parser.add_argument("--attention-heads", type=int, default=4)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def build_dataset(dictionary, num_sentences, min_len, max_len):
+    """Sentence pairs with targets 0.7 to 1.3 times as long as the source"""
+    rng = np.random.RandomState(1)
+    src_sizes = rng.randint(min_len, max_len + 1, num_sentences)
+    tgt_sizes = np.maximum(
+        (src_sizes * rng.uniform(0.7, 1.3, num_sentences)).astype(np.int64), 2
+    )
+
+    def sentences(sizes):
+        return [
+            torch.cat(
+                [torch.randint(4, len(dictionary), (size - 1,)), torch.tensor([2])]
+            )
+            for size in sizes
+        ]
+
+    return LanguagePairDataset(
+        sentences(src_sizes),
+        src_sizes,
+        dictionary,
+        sentences(tgt_sizes),
+        tgt_sizes,
+        dictionary,
+        shuffle=False,
+    )
+
+
+def padded_area(dataset, batch):
+    return (
+        len(batch)
+        * int(dataset.src_sizes[batch].max())
+        * int(dataset.tgt_sizes[batch].max())
+    )
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(1)
+
+    model = build_monotonic_model(
+        embed_dim=args.embed_dim,
+        ffn_embed_dim=args.ffn_embed_dim,
+        num_heads=args.attention_heads,
+        num_layers=args.layers,
+        vocab_size=1000,
+        max_positions=1024,
+    )
+    dictionary = model.decoder.dictionary
+    dataset = build_dataset(
+        dictionary, args.num_sentences, args.min_len, args.max_len
+    )
+    generator = SequenceGenerator(
+        [model],
+        dictionary,
+        beam_size=1,
+        max_len_a=0,
+        max_len_b=int(dataset.tgt_sizes.max()),
+    )
+    indices = dataset.ordered_indices()
+    used = (dataset.src_sizes * dataset.tgt_sizes).sum()
+
+    header = ["batching", "bsz", "batches", "peak_area", "padding", "sents/s"]
+    print(format_row(header))
+    for bsz in args.batch_sizes:
+        batches = dataset.batch_by_size(indices, max_sentences=bsz)
+        max_token_area = max(padded_area(dataset, batch) for batch in batches)
+        area_batches = dataset.batch_by_area(indices, max_token_area=max_token_area)
+        for name, batches in [("sentences", batches), ("area", area_batches)]:
+            samples = [dataset.collater([dataset[i] for i in b]) for b in batches]
+
+            def generate():
+                for sample in samples:
+                    generator.generate(
+                        [model], sample, prefix_tokens=sample["target"]
+                    )
+
+            with torch.no_grad():
+                times = time_fn(generate, args.repeat, warmup=0)
+            areas = [padded_area(dataset, batch) for batch in batches]
+            columns = [
+                name,
+                bsz,
+                len(batches),
+                max(areas),
+                "{:.1%}".format(1 - used / sum(areas)),
+                len(dataset) / summarize(times)["mean_ms"] * 1000,
+            ]
+            print(format_row(columns))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU benchmark of decoding with the SequenceGenerator and a monotonic model
+for several values of --compact-threshold, on batches with a skewed target
+length distribution: most targets are short, and a few are long.
+
+Removing the finished sentences from the batch reindexes the encoder output
+and every incremental state of the decoder, whereas keeping them decodes
+rows that are thrown away. The targets are forced with prefix tokens, so
+that the hypotheses are the same for every threshold.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.batch_compaction --threads 1
+"""
+
+import argparse
+
+import torch
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from fairseq.sequence_generator import SequenceGenerator
+from tests.utils import build_monotonic_model
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--thresholds", type=float, nargs="+", default=[0.0, 0.1, 0.25, 0.5, 1.0]
+    )
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 64])
+    parser.add_argument("--beam-sizes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--src-len", type=int, default=30)
+    parser.add_argument(
+        "--short-len", type=int, default=10,
+        help="short target lengths are drawn uniformly from 1 to this",
+    )
+    parser.add_argument("--long-len", type=int, default=60)
+    parser.add_argument(
+        "--long-fraction", type=float, default=0.1,
+        help="fraction of the targets that are --long-len tokens long",
+    )
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--ffn-embed-dim", type=int, default=1024)
+    parser.add_argument("--attention-heads", type=int, default=4)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def build_batch(dictionary, bsz, src_len, short_len, long_len, long_fraction):
+    """A sample and prefix tokens ending each target at a skewed length"""
+    src_tokens = torch.randint(4, len(dictionary), (bsz, src_len))
+    src_tokens[:, -1] = dictionary.eos()
+    sample = {
+        "net_input": {
+            "src_tokens": src_tokens,
+            "src_lengths": torch.full((bsz,), src_len),
+        }
+    }
+    tgt_lens = torch.randint(1, short_len + 1, (bsz,))
+    tgt_lens[torch.rand(bsz) < long_fraction] = long_len
+    tgt_lens[0] = long_len
+    prefix_tokens = torch.randint(4, len(dictionary), (bsz, long_len + 1))
+    prefix_tokens[torch.arange(bsz), tgt_lens] = dictionary.eos()
+    prefix_tokens[torch.arange(long_len + 1) > tgt_lens.unsqueeze(1)] = (
+        dictionary.pad()
+    )
+    return sample, prefix_tokens
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(1)
+
+    model = build_monotonic_model(
+        embed_dim=args.embed_dim,
+        ffn_embed_dim=args.ffn_embed_dim,
+        num_heads=args.attention_heads,
+        num_layers=args.layers,
+        vocab_size=1000,
+        max_positions=1024,
+    )
+    dictionary = model.decoder.dictionary
+
+    header = ["beam", "bsz"] + ["t={:g}".format(t) for t in args.thresholds]
+    print(format_row(header))
+    for beam_size in args.beam_sizes:
+        for bsz in args.batch_sizes:
+            sample, prefix_tokens = build_batch(
+                dictionary,
+                bsz,
+                args.src_len,
+                args.short_len,
+                args.long_len,
+                args.long_fraction,
+            )
+            columns = [beam_size, bsz]
+            for compact_threshold in args.thresholds:
+                generator = SequenceGenerator(
+                    [model],
+                    dictionary,
+                    beam_size=beam_size,
+                    max_len_a=0,
+                    max_len_b=args.long_len,
+                    compact_threshold=compact_threshold,
+                )
+                with torch.no_grad():
+                    times = time_fn(
+                        lambda: generator.generate(
+                            [model], sample, prefix_tokens=prefix_tokens
+                        ),
+                        args.repeat,
+                        warmup=1,
+                    )
+                columns.append(summarize(times)["mean_ms"])
+            print(format_row(columns))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
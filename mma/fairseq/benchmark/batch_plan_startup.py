@@ -0,0 +1,111 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Startup time of FairseqTask.get_batch_iterator on a LanguagePairDataset
+of memory-mapped source and target datasets with random lengths, as at the
+beginning of fairseq-train or fairseq-generate: ordering, filtering and
+batching the whole dataset ("uncached"), doing so and saving the batch plan
+("cold cache"), or loading the plan saved by a previous run ("warm cache").
+The batches are checked to be identical.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.batch_plan_startup --threads 1
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+from fairseq.benchmark.utils import format_row
+from fairseq.data import Dictionary, LanguagePairDataset
+from fairseq.data.indexed_dataset import (
+    MMapIndexedDataset,
+    MMapIndexedDatasetBuilder,
+    best_fitting_int_dtype,
+    data_file_path,
+    index_file_path,
+)
+from fairseq.tasks.fairseq_task import FairseqTask
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-sentences", type=int, default=5000000)
+    parser.add_argument("--min-len", type=int, default=2)
+    parser.add_argument("--max-len", type=int, default=250)
+    parser.add_argument("--max-positions", type=int, default=256)
+    parser.add_argument("--max-tokens", type=int, default=4096)
+    parser.add_argument("--required-batch-size-multiple", type=int, default=8)
+    parser.add_argument("--tmpdir", default=None, help="where to write the datasets")
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def build_mmap(path, lengths, vocab_size):
+    dtype = best_fitting_int_dtype(vocab_size)
+    builder = MMapIndexedDatasetBuilder(data_file_path(path), dtype=dtype)
+    # the batching only reads the sizes, the tokens are left to zero
+    builder.add_items(np.zeros(lengths.sum(), dtype=dtype), lengths)
+    builder.finalize(index_file_path(path))
+    return MMapIndexedDataset(path)
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    dictionary = Dictionary()
+    rng = np.random.RandomState(1)
+    src_lengths = rng.randint(args.min_len, args.max_len + 1, args.num_sentences)
+    tgt_lengths = rng.randint(args.min_len, args.max_len + 1, args.num_sentences)
+
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as dirname:
+        src = build_mmap(os.path.join(dirname, "src"), src_lengths, len(dictionary))
+        tgt = build_mmap(os.path.join(dirname, "tgt"), tgt_lengths, len(dictionary))
+        cache_dir = os.path.join(dirname, "cache")
+
+        def startup(batch_plan_cache_dir):
+            # a new dataset and task, as in a new run
+            dataset = LanguagePairDataset(
+                src, src.sizes, dictionary, tgt, tgt.sizes, dictionary
+            )
+            start = time.perf_counter()
+            itr = FairseqTask(None).get_batch_iterator(
+                dataset,
+                max_tokens=args.max_tokens,
+                max_positions=(args.max_positions, args.max_positions),
+                ignore_invalid_inputs=True,
+                required_batch_size_multiple=args.required_batch_size_multiple,
+                batch_plan_cache_dir=batch_plan_cache_dir,
+            )
+            batches = itr.frozen_batches
+            return batches, time.perf_counter() - start
+
+        header = ["startup", "batches", "seconds", "speedup", "identical"]
+        print(format_row(header))
+        expected, uncached_seconds = startup(None)
+        print(format_row(["uncached", len(expected), uncached_seconds, 1.0, "-"]))
+        for name in ["cold cache", "warm cache"]:
+            batches, seconds = startup(cache_dir)
+            identical = len(batches) == len(expected) and all(
+                np.array_equal(a, b) for a, b in zip(batches, expected)
+            )
+            columns = [name, len(batches), seconds, uncached_seconds / seconds]
+            print(format_row(columns + [identical]))
+        del src, tgt
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Throughput of the binarization of fairseq-preprocess in a single worker,
+line by line (Binarizer.binarize) or by chunks of lines
+(Binarizer.binarize_fast), into a MMapIndexedDatasetBuilder. The corpus is
+written to a temporary directory, with Zipf-distributed words, some of
+which are left out of the dictionary. The output files are checked to be
+identical.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.binarizer_throughput
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from fairseq.benchmark.utils import format_row
+from fairseq.binarizer import Binarizer
+from fairseq.data import Dictionary
+from fairseq.data.indexed_dataset import (
+    MMapIndexedDatasetBuilder,
+    best_fitting_int_dtype,
+    data_file_path,
+    index_file_path,
+)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-lines", type=int, default=200000)
+    parser.add_argument("--min-len", type=int, default=5)
+    parser.add_argument("--max-len", type=int, default=60)
+    parser.add_argument("--vocab-size", type=int, default=30000)
+    parser.add_argument(
+        "--dict-size", type=int, default=20000,
+        help="the most frequent words kept in the dictionary",
+    )
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1000, 10000])
+    return parser
+
+
+def write_corpus(filename, args):
+    rng = np.random.RandomState(1)
+    lengths = rng.randint(args.min_len, args.max_len + 1, args.num_lines)
+    words = np.minimum(rng.zipf(1.2, lengths.sum()), args.vocab_size)
+    with open(filename, "w", encoding="utf-8") as f:
+        for line in np.split(words, np.cumsum(lengths)[:-1]):
+            f.write(" ".join("w{}".format(w) for w in line.tolist()) + "\n")
+
+
+def binarize(filename, dictionary, prefix, chunk_size=None):
+    builder = MMapIndexedDatasetBuilder(
+        data_file_path(prefix), dtype=best_fitting_int_dtype(len(dictionary))
+    )
+    start = time.perf_counter()
+    if chunk_size is None:
+        res = Binarizer.binarize(filename, dictionary, builder.add_item)
+    else:
+        res = Binarizer.binarize_fast(
+            filename, dictionary, builder, chunk_size=chunk_size
+        )
+    builder.finalize(index_file_path(prefix))
+    seconds = time.perf_counter() - start
+    files = []
+    for path in [data_file_path(prefix), index_file_path(prefix)]:
+        with open(path, "rb") as f:
+            files.append(f.read())
+    return res, files, seconds
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, "corpus.txt")
+        write_corpus(filename, args)
+        dictionary = Dictionary()
+        for i in range(1, args.dict_size + 1):
+            dictionary.add_symbol("w{}".format(i))
+
+        header = ["binarizer", "chunk_size", "lines/s", "unk", "identical"]
+        print(format_row(header))
+        prefix = os.path.join(dirname, "out")
+        expected_res, expected_files, seconds = binarize(filename, dictionary, prefix)
+        unk = "{:.2%}".format(expected_res["nunk"] / expected_res["ntok"])
+        print(format_row(["binarize", "-", args.num_lines / seconds, unk, "-"]))
+        for chunk_size in args.chunk_sizes:
+            res, files, seconds = binarize(filename, dictionary, prefix, chunk_size)
+            identical = files == expected_files and res == expected_res
+            columns = ["binarize_fast", chunk_size, args.num_lines / seconds, unk]
+            print(format_row(columns + [identical]))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
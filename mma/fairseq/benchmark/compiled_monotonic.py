@@ -0,0 +1,141 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU benchmark of a monotonic model with its encoder and decoder layers
+exported with torch.jit.script or compiled with torch.compile.
+
+The "forward" rows time the full sequence forward pass of inference
+(encoder, then decoder on the whole target). The "decode" rows time
+greedy incremental decoding, where only torch.compile applies: scripted
+modules do not write the incremental state back to the dict of the
+caller. The compilation time is left out of the timings.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.compiled_monotonic --threads 1
+"""
+
+import argparse
+import copy
+
+import torch
+from fairseq.benchmark.single_path_training import build_sample
+from fairseq.benchmark.static_kv_cache import greedy_decode
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from tests.utils import build_monotonic_model
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--simul-types",
+        nargs="+",
+        default=["hard_aligned", "infinite_lookback"],
+    )
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--src-len", type=int, default=40)
+    parser.add_argument("--tgt-len", type=int, default=40)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--ffn-embed-dim", type=int, default=1024)
+    parser.add_argument("--attention-heads", type=int, default=4)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--no-compile", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def export_layers(model, mode, decoder_only=False):
+    """A copy of the model with its layers scripted or compiled"""
+    model = copy.deepcopy(model)
+    layer_lists = [model.decoder.layers]
+    if not decoder_only:
+        layer_lists.append(model.encoder.layers)
+    for layers in layer_lists:
+        for i, layer in enumerate(layers):
+            if mode == "script":
+                layers[i] = torch.jit.script(layer)
+            else:
+                layer.forward = torch.compile(layer.forward, dynamic=True)
+    return model
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    modes = ["eager", "script"] + ([] if args.no_compile else ["compile"])
+
+    header = ["bench", "simul_type", "bsz"] + [m + "_ms" for m in modes]
+    widths = [9, 18] + [10] * (len(header) - 2)
+    print(format_row(header, widths))
+    for simul_type in args.simul_types:
+        torch.manual_seed(1)
+        model = build_monotonic_model(
+            embed_dim=args.embed_dim,
+            ffn_embed_dim=args.ffn_embed_dim,
+            num_heads=args.attention_heads,
+            num_layers=args.layers,
+            vocab_size=1000,
+            max_positions=max(args.src_len, args.tgt_len) + 2,
+            simul_type=simul_type,
+        ).eval()
+        dictionary = model.decoder.dictionary
+        models = {mode: export_layers(model, mode) for mode in modes[1:]}
+        models["eager"] = model
+
+        for bsz in args.batch_sizes:
+            net_input = build_sample(
+                dictionary, bsz, args.src_len, args.tgt_len
+            )["net_input"]
+
+            def forward(model):
+                encoder_out = model.encoder(net_input["src_tokens"], src_lengths=None)
+                return model.decoder(
+                    net_input["prev_output_tokens"], encoder_out=encoder_out
+                )
+
+            columns = ["forward", simul_type, bsz]
+            with torch.no_grad():
+                for mode in modes:
+                    times = time_fn(
+                        lambda: forward(models[mode]), args.repeat, warmup=2
+                    )
+                    columns.append(summarize(times)["mean_ms"])
+            print(format_row(columns, widths))
+
+        if args.no_compile:
+            continue
+        compiled = export_layers(model, "compile", decoder_only=True)
+        for bsz in args.batch_sizes:
+            src_tokens = build_sample(
+                dictionary, bsz, args.src_len, args.tgt_len
+            )["net_input"]["src_tokens"]
+            columns = ["decode", simul_type, bsz]
+            with torch.no_grad():
+                for mode in modes:
+                    if mode == "script":
+                        columns.append("-")
+                        continue
+                    decode_model = compiled if mode == "compile" else model
+                    times = time_fn(
+                        lambda: greedy_decode(
+                            decode_model, src_tokens, args.tgt_len, cached=True
+                        ),
+                        args.repeat,
+                        warmup=2,
+                    )
+                    columns.append(summarize(times)["mean_ms"])
+            print(format_row(columns, widths))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Benchmark of Dictionary.add_file_to_dictionary on a synthetic corpus of
+Zipf-distributed words, against the previous implementation ("legacy": a
+Counter.update per token in the workers, merged one worker at a time into
+the dictionary in the parent). The "bounded" rows count at most
+2 * --max-types words per worker; "kept" is the number of words of the
+dictionary finalized with --threshold identical to the exact one.
+
+The default corpus has 20M tokens; the 1B tokens setting is
+--num-tokens 1000000000 (about 6 GB of text).
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.dictionary_counting --workers 1 4
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+import numpy as np
+from fairseq.benchmark.utils import format_row
+from fairseq.data import Dictionary
+from fairseq.file_chunker_utils import Chunker, find_offsets
+from fairseq.tokenizer import tokenize_line
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-tokens", type=int, default=20000000)
+    parser.add_argument("--line-len", type=int, default=25)
+    parser.add_argument("--vocab-size", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--max-types", type=int, default=50000)
+    parser.add_argument("--threshold", type=int, default=100)
+    parser.add_argument("--tmpdir", default=None, help="where to write the corpus")
+    return parser
+
+
+def write_corpus(filename, args):
+    rng = np.random.RandomState(1)
+    block_lines = 100000
+    with open(filename, "w", encoding="utf-8") as f:
+        for start in range(0, args.num_tokens, block_lines * args.line_len):
+            num_tokens = min(block_lines * args.line_len, args.num_tokens - start)
+            words = np.minimum(rng.zipf(1.1, num_tokens), args.vocab_size).tolist()
+            for i in range(0, num_tokens, args.line_len):
+                f.write(" ".join(map(str, words[i : i + args.line_len])) + "\n")
+
+
+def legacy_single_worker(filename, tokenize, eos_word, start_offset, end_offset):
+    counter = Counter()
+    with Chunker(filename, start_offset, end_offset) as line_iterator:
+        for line in line_iterator:
+            for word in tokenize(line):
+                counter.update([word])
+            counter.update([eos_word])
+    return counter
+
+
+def legacy_add_file_to_dictionary(filename, dict, tokenize, num_workers):
+    offsets = find_offsets(filename, num_workers)
+    with Pool(processes=num_workers) as pool:
+        results = pool.starmap(
+            legacy_single_worker,
+            [
+                (filename, tokenize, dict.eos_word, start_offset, end_offset)
+                for start_offset, end_offset in zip(offsets, offsets[1:])
+            ],
+        )
+    for counter in results:
+        for w, c in sorted(counter.items()):
+            dict.add_symbol(w, c)
+
+
+def build(fn, filename, num_workers, threshold, **kwargs):
+    d = Dictionary()
+    start = time.perf_counter()
+    fn(filename, d, tokenize_line, num_workers, **kwargs)
+    seconds = time.perf_counter() - start
+    types = len(d)
+    d.finalize(threshold=threshold, padding_factor=1)
+    return d, types, seconds
+
+
+def main(args):
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as dirname:
+        filename = os.path.join(dirname, "corpus.txt")
+        write_corpus(filename, args)
+
+        header = ["counting", "workers", "seconds", "Mtokens/s", "types", "kept"]
+        print(format_row(header))
+        for num_workers in args.workers:
+            runs = [
+                ("legacy", legacy_add_file_to_dictionary, {}),
+                ("exact", Dictionary.add_file_to_dictionary, {}),
+                (
+                    "bounded",
+                    Dictionary.add_file_to_dictionary,
+                    {"max_types": args.max_types},
+                ),
+            ]
+            expected = None
+            for name, fn, kwargs in runs:
+                d, types, seconds = build(
+                    fn, filename, num_workers, args.threshold, **kwargs
+                )
+                if expected is None:
+                    expected = d
+                kept = len(set(d.symbols) & set(expected.symbols))
+                kept = "{}/{}".format(kept - d.nspecial, len(expected) - d.nspecial)
+                rate = args.num_tokens / seconds / 1e6
+                print(format_row([name, num_workers, seconds, rate, types, kept]))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
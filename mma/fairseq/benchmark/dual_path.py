@@ -0,0 +1,135 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU benchmark of generate_dual_path, run in both directions on every dual
+path training step, comparing the dense mask implementation with the
+argmax index one. Batches are sized like --max-tokens training batches.
+
+The peak memory is the peak resident set size increase of a fresh
+process running one call, so it needs Linux.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.dual_path --threads 1
+"""
+
+import argparse
+import multiprocessing
+
+import torch
+from fairseq.benchmark.utils import (
+    format_row,
+    proc_status,
+    reset_peak_rss,
+    summarize,
+    time_fn,
+)
+from fairseq.modules.dual_path import generate_dual_path
+
+
+def generate_dual_path_dense(alpha):
+    """generate_dual_path as originally written, with dense segment masks"""
+    bsz, tgt_len, src_len = alpha.size()
+
+    # Segment
+    max_idx = alpha.max(dim=-1, keepdim=True)[1]
+    inn = torch.cat(
+        (
+            torch.full((max_idx.size(0), 1, max_idx.size(2)), -1, device=alpha.device),
+            max_idx[:, :-1, :],
+        ),
+        dim=1,
+    )
+    min_idx = (max_idx > inn).int()
+    inn += 1
+    min_idx = min_idx * inn
+    min_idx = torch.cummax(min_idx, dim=1)[0]
+    tmp = torch.arange(src_len, device=alpha.device).unsqueeze(0).unsqueeze(0)
+    tmp = tmp.repeat(bsz, tgt_len, 1)
+    mask1 = (tmp <= max_idx).int()
+    mask2 = (tmp >= min_idx).int()
+    mask = mask1 * mask2
+
+    # Transpose
+    mask = mask.transpose(1, 2)
+
+    # Merge
+    tmp = torch.arange(tgt_len, device=alpha.device).unsqueeze(0).unsqueeze(0)
+    tmp = tmp.repeat(bsz, src_len, 1)
+    mask = (tmp <= mask.max(dim=-1, keepdim=True)[1]).int() + mask
+    mask = mask.bool().int()
+    src_lens = mask.sum(dim=2, keepdim=True)
+    src_lens = torch.cummax(src_lens, dim=1)[0]
+    dual_path = (tmp == src_lens - 1).int()
+    dual_path = dual_path / dual_path.sum(dim=-1, keepdim=True)
+
+    return dual_path
+
+
+IMPLEMENTATIONS = {
+    "dense": generate_dual_path_dense,
+    "index": generate_dual_path,
+}
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lens", type=int, nargs="+", default=[25, 50, 100, 200])
+    parser.add_argument("--max-tokens", type=int, default=4000)
+    parser.add_argument("--num-heads", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def _peak_memory(name, shape, queue):
+    alpha = torch.rand(shape)
+    # Leave out the memory of lazy initializations on the first call
+    IMPLEMENTATIONS[name](torch.rand(1, 2, 2))
+    rss = proc_status("VmRSS")
+    reset_peak_rss()
+    IMPLEMENTATIONS[name](alpha)
+    queue.put(proc_status("VmHWM") - rss)
+
+
+def peak_memory(name, shape):
+    """Peak memory increase in MB of one call in a fresh process"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_peak_memory, args=(name, shape, queue))
+    process.start()
+    peak = queue.get()
+    process.join()
+    return peak / 2 ** 20
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    header = ["len", "rows", "dense_ms", "index_ms", "dense_MB", "index_MB"]
+    print(format_row(header))
+    for length in args.lens:
+        rows = max(args.max_tokens // length, 1) * args.num_heads
+        shape = (rows, length, length)
+        alpha = torch.rand(shape)
+        columns = [length, rows]
+        for name in ["dense", "index"]:
+            times = time_fn(lambda: IMPLEMENTATIONS[name](alpha), args.repeat)
+            columns.append(summarize(times)["mean_ms"])
+        for name in ["dense", "index"]:
+            columns.append(peak_memory(name, shape))
+        print(format_row(columns))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU throughput of fairseq-generate for several intra-op thread counts.
+Any argument that is not listed below is passed on to fairseq-generate,
+and --cpu is always set.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.generate_cpu data-bin --path checkpoint.pt \
+        --user-dir examples/simultaneous_translation --batch-size 16 \
+        --bench-threads 1 2 4
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from fairseq import options
+from fairseq.benchmark.utils import format_row
+from fairseq.dataclass.utils import convert_namespace_to_omegaconf
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--bench-threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--bench-repeat", type=int, default=1)
+    return parser
+
+
+def count_hypotheses(results_path, gen_subset):
+    with open(os.path.join(results_path, "generate-{}.txt".format(gen_subset))) as h:
+        lines = [line for line in h if line.startswith("H-")]
+    return len(lines), sum(len(line.split("\t")[2].split()) + 1 for line in lines)
+
+
+def main(args, generate_args):
+    from fairseq_cli import generate
+
+    header = ["threads", "sentences/s", "tokens/s", "seconds"]
+    print(format_row(header))
+    for threads in args.bench_threads:
+        with tempfile.TemporaryDirectory() as results_path:
+            parser = options.get_generation_parser()
+            gen_args = options.parse_args_and_arch(
+                parser,
+                generate_args
+                + [
+                    "--cpu",
+                    "--cpu-threads",
+                    str(threads),
+                    "--results-path",
+                    results_path,
+                ],
+            )
+            cfg = convert_namespace_to_omegaconf(gen_args)
+            seconds = []
+            for _ in range(args.bench_repeat):
+                start = time.perf_counter()
+                generate.main(cfg)
+                seconds.append(time.perf_counter() - start)
+            seconds = min(seconds)
+            num_sentences, num_tokens = count_hypotheses(
+                results_path, cfg.dataset.gen_subset
+            )
+        print(
+            format_row(
+                [threads, num_sentences / seconds, num_tokens / seconds, seconds]
+            )
+        )
+
+
+def cli_main():
+    parser = get_parser()
+    args, generate_args = parser.parse_known_args()
+    main(args, generate_args)
+
+
+if __name__ == "__main__":
+    cli_main()
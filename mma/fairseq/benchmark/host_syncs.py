@@ -0,0 +1,110 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Benchmark of greedy decoding with the SequenceGenerator and a monotonic
+model, counting the explicit copies from the device to the host of every
+batch (SequenceGenerator.num_host_syncs) along with the decoding time.
+The target lengths are forced by prefix tokens, so that sentences finish
+at many different steps.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.host_syncs --threads 1
+"""
+
+import argparse
+
+import torch
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from fairseq.sequence_generator import SequenceGenerator
+from tests.utils import build_monotonic_model
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--src-len", type=int, default=30)
+    parser.add_argument(
+        "--max-tgt-len", type=int, default=40,
+        help="target lengths are drawn uniformly from 1 to this",
+    )
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--ffn-embed-dim", type=int, default=1024)
+    parser.add_argument("--attention-heads", type=int, default=4)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cuda", action="store_true")
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def build_batch(dictionary, bsz, src_len, max_tgt_len):
+    """A sample and prefix tokens ending each target at a random length"""
+    src_tokens = torch.randint(4, len(dictionary), (bsz, src_len))
+    src_tokens[:, -1] = dictionary.eos()
+    sample = {
+        "net_input": {
+            "src_tokens": src_tokens,
+            "src_lengths": torch.full((bsz,), src_len),
+        }
+    }
+    tgt_lens = torch.randint(1, max_tgt_len + 1, (bsz,))
+    prefix_tokens = torch.randint(4, len(dictionary), (bsz, max_tgt_len + 1))
+    prefix_tokens[torch.arange(bsz), tgt_lens] = dictionary.eos()
+    prefix_tokens[torch.arange(max_tgt_len + 1) > tgt_lens.unsqueeze(1)] = (
+        dictionary.pad()
+    )
+    return sample, prefix_tokens, len(set(tgt_lens.tolist()))
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(1)
+
+    model = build_monotonic_model(
+        embed_dim=args.embed_dim,
+        ffn_embed_dim=args.ffn_embed_dim,
+        num_heads=args.attention_heads,
+        num_layers=args.layers,
+        vocab_size=1000,
+        max_positions=1024,
+    )
+    if args.cuda:
+        model.cuda()
+    dictionary = model.decoder.dictionary
+    generator = SequenceGenerator(
+        [model], dictionary, beam_size=1, max_len_a=0, max_len_b=args.max_tgt_len
+    )
+
+    header = ["bsz", "ms/batch", "syncs/batch", "finish_steps"]
+    print(format_row(header))
+    for bsz in args.batch_sizes:
+        sample, prefix_tokens, finish_steps = build_batch(
+            dictionary, bsz, args.src_len, args.max_tgt_len
+        )
+        if args.cuda:
+            sample = {"net_input": {k: v.cuda() for k, v in sample["net_input"].items()}}
+            prefix_tokens = prefix_tokens.cuda()
+
+        with torch.no_grad():
+            times = time_fn(
+                lambda: generator.generate([model], sample, prefix_tokens=prefix_tokens),
+                args.repeat,
+                warmup=1,
+            )
+        columns = [bsz, summarize(times)["mean_ms"], generator.num_host_syncs]
+        print(format_row(columns + [finish_steps]))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU benchmark of offline greedy decoding of long documents with the
+SequenceGenerator and a monotonic model, comparing the recomputation of
+the whole target prefix and of its hard alignment on every step with
+incremental decoding, where each head moves forward from its previous
+monotonic step.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.incremental_alignment --threads 1
+"""
+
+import argparse
+
+import torch
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from fairseq.sequence_generator import SequenceGenerator
+from tests.utils import build_monotonic_model
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--src-lens", type=int, nargs="+", default=[200, 500, 1000]
+    )
+    parser.add_argument(
+        "--tgt-len", type=int, default=50,
+        help="number of target tokens generated for every document",
+    )
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--ffn-embed-dim", type=int, default=1024)
+    parser.add_argument("--attention-heads", type=int, default=4)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    model = build_monotonic_model(
+        embed_dim=args.embed_dim,
+        ffn_embed_dim=args.ffn_embed_dim,
+        num_heads=args.attention_heads,
+        num_layers=args.layers,
+        vocab_size=1000,
+        max_positions=max(args.src_lens) + 1,
+    )
+    dictionary = model.decoder.dictionary
+    # Always generate tgt_len tokens
+    generator = SequenceGenerator(
+        [model],
+        dictionary,
+        beam_size=1,
+        max_len_a=0,
+        max_len_b=args.tgt_len,
+        min_len=args.tgt_len,
+    )
+
+    header = ["src_len", "full_ms/tok", "incr_ms/tok", "speedup"]
+    print(format_row(header))
+    for src_len in args.src_lens:
+        src_tokens = torch.randint(4, len(dictionary), (args.batch_size, src_len))
+        src_tokens[:, -1] = dictionary.eos()
+        sample = {
+            "net_input": {
+                "src_tokens": src_tokens,
+                "src_lengths": torch.full((args.batch_size,), src_len),
+            }
+        }
+        num_tokens = args.batch_size * (args.tgt_len + 1)
+
+        columns = [src_len]
+        with torch.no_grad():
+            for incremental in [False, True]:
+                generator.model.has_incremental = incremental
+                times = time_fn(
+                    lambda: generator.generate([model], sample), args.repeat, warmup=1
+                )
+                columns.append(summarize(times)["mean_ms"] / num_tokens)
+        columns.append(columns[1] / columns[2])
+        print(format_row(columns))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU microbenchmark of the encoder update on every READ of a simultaneous
+agent, comparing a full re-encode of the source prefix with the
+incremental encoder.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.incremental_encoder --threads 1
+"""
+
+import argparse
+
+import torch
+import torch.nn as nn
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from fairseq.data import Dictionary
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--stream-lens", type=int, nargs="+", default=[10, 50, 100, 200, 500]
+    )
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--ffn-embed-dim", type=int, default=1024)
+    parser.add_argument("--attention-heads", type=int, default=4)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def build_encoder(args, max_source_positions):
+    from examples.simultaneous_translation.models.transformer_monotonic_attention import (
+        TransformerMonotonicEncoder,
+        base_monotonic_architecture,
+    )
+
+    encoder_args = argparse.Namespace(
+        encoder_embed_dim=args.embed_dim,
+        encoder_ffn_embed_dim=args.ffn_embed_dim,
+        encoder_attention_heads=args.attention_heads,
+        encoder_layers=args.layers,
+        max_source_positions=max_source_positions,
+    )
+    base_monotonic_architecture(encoder_args)
+    dictionary = Dictionary()
+    for i in range(1000):
+        dictionary.add_symbol("token_{}".format(i))
+    embed_tokens = nn.Embedding(len(dictionary), args.embed_dim, dictionary.pad())
+    return TransformerMonotonicEncoder(encoder_args, dictionary, embed_tokens).eval()
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    encoder = build_encoder(args, max(args.stream_lens) + 1)
+
+    header = ["stream_len", "full_ms/read", "incr_ms/read", "speedup"]
+    print(format_row(header))
+    for stream_len in args.stream_lens:
+        src_tokens = torch.randint(4, len(encoder.dictionary), (1, stream_len))
+
+        # Read one unit at a time, encoding the source after every READ
+        def stream(incremental):
+            incremental_state = {} if incremental else None
+            for src_len in range(1, stream_len + 1):
+                encoder(src_tokens[:, :src_len], incremental_state=incremental_state)
+
+        with torch.no_grad():
+            full_ms = summarize(time_fn(lambda: stream(False), args.repeat, warmup=1))
+            incr_ms = summarize(time_fn(lambda: stream(True), args.repeat, warmup=1))
+        full_ms = full_ms["mean_ms"] / stream_len
+        incr_ms = incr_ms["mean_ms"] / stream_len
+        print(format_row([stream_len, full_ms, incr_ms, full_ms / incr_ms]))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU microbenchmark of the differentiable average lagging loss of the
+latency augmented criterion, forward and backward, comparing the
+recursion over target steps with the cumulative max. Both the whole
+LatencyTraining.loss and the DAL metric alone are timed.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.latency_loss --threads 1
+"""
+
+import argparse
+
+import torch
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+
+
+def differentiable_average_lagging_loop(delays, src_lens, tgt_lens, target_padding_mask):
+    """DifferentiableAverageLagging.cal_metric as originally written"""
+    tgt_len, bsz = delays.size()
+
+    gamma = tgt_lens / src_lens
+    new_delays = torch.zeros_like(delays)
+
+    for i in range(delays.size(0)):
+        if i == 0:
+            new_delays[i] = delays[i]
+        else:
+            new_delays[i] = torch.cat(
+                [
+                    new_delays[i - 1].unsqueeze(0) + 1 / gamma,
+                    delays[i].unsqueeze(0),
+                ],
+                dim=0,
+            ).max(dim=0)[0]
+
+    DAL = (
+        new_delays
+        - torch.arange(delays.size(0), device=delays.device)
+        .unsqueeze(1)
+        .type_as(delays)
+        .expand_as(delays)
+        / gamma
+    )
+    if target_padding_mask is not None:
+        DAL = DAL.masked_fill(target_padding_mask, 0)
+
+    DAL = DAL.sum(dim=0, keepdim=True) / tgt_lens
+
+    return DAL
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tgt-lens", type=int, nargs="+", default=[50, 100, 200, 300])
+    parser.add_argument("--bsz", type=int, default=32)
+    parser.add_argument("--num-heads", type=int, default=4)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def main(args):
+    from examples.simultaneous_translation.utils.latency import (
+        DifferentiableAverageLagging,
+        LatencyTraining,
+    )
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    class DifferentiableAverageLaggingLoop(DifferentiableAverageLagging):
+        cal_metric = staticmethod(differentiable_average_lagging_loop)
+
+    latency_train = LatencyTraining(
+        avg_weight=0.1,
+        var_weight=0.0,
+        avg_type="differentiable_average_lagging",
+        var_type="variance_delay",
+        stay_on_last_token=True,
+        average_method="weighted_average",
+    )
+    metrics = {
+        "loop": DifferentiableAverageLaggingLoop(),
+        "cummax": DifferentiableAverageLagging(),
+    }
+
+    header = ["tgt_len", "loop_ms", "cummax_ms", "dal_loop_ms", "dal_cummax_ms"]
+    print(format_row(header))
+    for tgt_len in args.tgt_lens:
+        # Source as long as the target, right padded targets
+        src_len = tgt_len
+        attention = [
+            torch.softmax(
+                torch.rand(args.bsz, args.num_heads, tgt_len, src_len), dim=-1
+            ).requires_grad_()
+            for _ in range(args.layers)
+        ]
+        tgt_lens = torch.randint(tgt_len // 2, tgt_len + 1, (args.bsz, 1))
+        target_padding_mask = torch.arange(tgt_len).unsqueeze(0) >= tgt_lens
+
+        def loss(name):
+            latency_train.metric_calculator[
+                "differentiable_average_lagging"
+            ] = metrics[name]
+            latency_train.loss(attention, None, target_padding_mask).backward()
+
+        expected_delays = (
+            torch.rand(args.bsz, tgt_len) * src_len
+        ).requires_grad_()
+        src_lens = torch.full((args.bsz, 1), src_len).float()
+
+        def metric(name):
+            metrics[name](
+                expected_delays,
+                src_lens,
+                target_padding_mask,
+                batch_first=True,
+                start_from_zero=False,
+            ).sum().backward()
+
+        columns = [tgt_len]
+        for fn in [loss, metric]:
+            for name in ["loop", "cummax"]:
+                times = time_fn(lambda: fn(name), args.repeat)
+                columns.append(summarize(times)["mean_ms"])
+        print(format_row(columns))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
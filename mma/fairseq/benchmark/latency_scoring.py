@@ -0,0 +1,82 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU benchmark of the latency scoring at the end of fairseq-generate,
+comparing the read/write strings parsed by compute_delay with the
+LatencyScorer on delay arrays, for random monotonic delays fed in
+generation sized batches.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.latency_scoring --num-sentences 100000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from fairseq.benchmark.utils import format_row
+from fairseq.scoring.latency import LatencyScorer
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--num-sentences", type=int, nargs="+", default=[10000, 100000]
+    )
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--max-len", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser
+
+
+def build_batches(num_sentences, batch_size, max_len, rng):
+    batches = []
+    for start in range(0, num_sentences, batch_size):
+        bsz = min(batch_size, num_sentences - start)
+        src_lens = rng.randint(1, max_len + 1, bsz).tolist()
+        delays = [
+            np.sort(rng.randint(0, src_len, rng.randint(1, max_len + 1))).tolist()
+            for src_len in src_lens
+        ]
+        batches.append((delays, src_lens))
+    return batches
+
+
+def main(args):
+    from fairseq_cli.generate import compute_delay, d201
+
+    rng = np.random.RandomState(args.seed)
+    header = ["sentences", "strings_s", "arrays_s", "speedup"]
+    print(format_row(header))
+    for num_sentences in args.num_sentences:
+        batches = build_batches(num_sentences, args.batch_size, args.max_len, rng)
+
+        start = time.perf_counter()
+        rws = []
+        for delays, src_lens in batches:
+            rws.extend(d201(d, s) for d, s in zip(delays, src_lens))
+        compute_delay(rws, is_weight_ave=True)
+        strings_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scorer = LatencyScorer()
+        for delays, src_lens in batches:
+            scorer.add(delays, src_lens)
+        scorer.score()
+        arrays_s = time.perf_counter() - start
+
+        print(format_row([num_sentences, strings_s, arrays_s, strings_s / arrays_s]))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU benchmark of shallow fusion with the auxiliary LM decoder of a
+monotonic model, comparing the LM run on the whole target prefix on every
+step with the LM run incrementally, its state reordered with the beams.
+
+The "generate" rows time greedy decoding with the SequenceGenerator. The
+SequenceGenerator tracks a single read position per sentence, so it only
+decodes monotonic models with beam 1: the "lm" rows time the fusion term
+alone for every beam size, with the beams reordered at random on every
+step as a beam search would.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.lm_fusion --threads 1
+"""
+
+import argparse
+
+import torch
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from fairseq.sequence_generator import SequenceGenerator
+from tests.utils import build_monotonic_model
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tgt-lens", type=int, nargs="+", default=[50, 100])
+    parser.add_argument("--beams", type=int, nargs="+", default=[1, 5])
+    parser.add_argument("--src-len", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--ffn-embed-dim", type=int, default=1024)
+    parser.add_argument("--attention-heads", type=int, default=4)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--lm-weight", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def fused_lm_steps(lm_decoder, bsz, beam_size, tgt_len, incremental):
+    """The LM log probabilities of every step of a beam search"""
+    eos = lm_decoder.dictionary.eos()
+    tokens = torch.full((bsz * beam_size, 1), eos, dtype=torch.long)
+    bbsz_offsets = (torch.arange(bsz) * beam_size).unsqueeze(1)
+    incremental_state = {}
+    for _ in range(tgt_len):
+        if incremental:
+            lm_out = lm_decoder(tokens, incremental_state=incremental_state)
+        else:
+            lm_out = lm_decoder(tokens)
+        lprobs = lm_decoder.get_normalized_probs(lm_out, log_probs=True, sample=None)
+        next_tokens = lprobs[:, -1, :].argmax(dim=-1, keepdim=True)
+        # Continue every beam from a random beam of the same sentence
+        new_order = torch.randint(beam_size, (bsz, beam_size)).add(bbsz_offsets)
+        new_order = new_order.view(-1)
+        tokens = torch.cat([tokens[new_order], next_tokens[new_order]], dim=1)
+        if incremental:
+            lm_decoder.reorder_incremental_state_scripting(
+                incremental_state, new_order
+            )
+    return tokens
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    model = build_monotonic_model(
+        embed_dim=args.embed_dim,
+        ffn_embed_dim=args.ffn_embed_dim,
+        num_heads=args.attention_heads,
+        num_layers=args.layers,
+        vocab_size=1000,
+        max_positions=max(args.src_len, max(args.tgt_lens)) + 2,
+        add_language_model=True,
+    )
+    dictionary = model.decoder.dictionary
+    src_tokens = torch.randint(4, len(dictionary), (args.batch_size, args.src_len))
+    src_tokens[:, -1] = dictionary.eos()
+    sample = {
+        "net_input": {
+            "src_tokens": src_tokens,
+            "src_lengths": torch.full((args.batch_size,), args.src_len),
+        }
+    }
+
+    header = ["mode", "beam", "tgt_len", "full_ms/tok", "incr_ms/tok", "speedup"]
+    print(format_row(header))
+    with torch.no_grad():
+        for tgt_len in args.tgt_lens:
+            # Always generate tgt_len tokens
+            generator = SequenceGenerator(
+                [model],
+                dictionary,
+                beam_size=1,
+                max_len_a=0,
+                max_len_b=tgt_len,
+                min_len=tgt_len,
+                lm_model=model.lm_decoder,
+                lm_weight=args.lm_weight,
+            )
+            num_tokens = args.batch_size * (tgt_len + 1)
+            columns = ["generate", 1, tgt_len]
+            for incremental in [False, True]:
+                generator.lm_incremental = incremental
+                times = time_fn(
+                    lambda: generator.generate([model], sample), args.repeat, warmup=1
+                )
+                columns.append(summarize(times)["mean_ms"] / num_tokens)
+            columns.append(columns[-2] / columns[-1])
+            print(format_row(columns))
+
+        for beam_size in args.beams:
+            for tgt_len in args.tgt_lens:
+                num_tokens = args.batch_size * beam_size * tgt_len
+                columns = ["lm", beam_size, tgt_len]
+                for incremental in [False, True]:
+                    times = time_fn(
+                        lambda: fused_lm_steps(
+                            model.lm_decoder,
+                            args.batch_size,
+                            beam_size,
+                            tgt_len,
+                            incremental,
+                        ),
+                        args.repeat,
+                        warmup=1,
+                    )
+                    columns.append(summarize(times)["mean_ms"] / num_tokens)
+                columns.append(columns[-2] / columns[-1])
+                print(format_row(columns))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
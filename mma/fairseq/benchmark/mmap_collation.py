@@ -0,0 +1,115 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Benchmark of the collation of LanguagePairDataset batches from memory-mapped
+source and target datasets, one sample at a time ("samples": __getitem__
+then collater, as before) or with one gather per side from the storage
+("fetch": __getitems__ then collater, as torch.utils.data.DataLoader does
+when the dataset has __getitems__).
+
+The datasets are written to a temporary directory, with random lengths,
+and batched by --max-tokens.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.mmap_collation --threads 1
+"""
+
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import torch
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from fairseq.data import Dictionary, LanguagePairDataset
+from fairseq.data.indexed_dataset import (
+    MMapIndexedDataset,
+    MMapIndexedDatasetBuilder,
+    best_fitting_int_dtype,
+    data_file_path,
+    index_file_path,
+)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-sentences", type=int, default=100000)
+    parser.add_argument("--min-len", type=int, default=5)
+    parser.add_argument("--max-len", type=int, default=100)
+    parser.add_argument("--vocab-size", type=int, default=10000)
+    parser.add_argument("--max-tokens", type=int, nargs="+", default=[1024, 4096])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def build_mmap(path, lengths, vocab_size, eos):
+    dtype = best_fitting_int_dtype(vocab_size)
+    builder = MMapIndexedDatasetBuilder(data_file_path(path), dtype=dtype)
+    rng = np.random.RandomState(len(lengths))
+    for length in lengths:
+        item = rng.randint(4, vocab_size, size=length)
+        item[-1] = eos
+        builder.add_item(torch.from_numpy(item))
+    builder.finalize(index_file_path(path))
+    return MMapIndexedDataset(path)
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    dictionary = Dictionary()
+    rng = np.random.RandomState(1)
+    src_lengths = rng.randint(args.min_len, args.max_len + 1, args.num_sentences)
+    tgt_lengths = np.maximum(
+        (src_lengths * rng.uniform(0.7, 1.3, args.num_sentences)).astype(np.int64), 2
+    )
+
+    with tempfile.TemporaryDirectory() as dirname:
+        src = build_mmap(
+            os.path.join(dirname, "src"), src_lengths, args.vocab_size, dictionary.eos()
+        )
+        tgt = build_mmap(
+            os.path.join(dirname, "tgt"), tgt_lengths, args.vocab_size, dictionary.eos()
+        )
+        dataset = LanguagePairDataset(
+            src, src.sizes, dictionary, tgt, tgt.sizes, dictionary
+        )
+        assert dataset.supports_fetch_batch
+
+        header = ["max_tokens", "batches", "samples/s", "fetch/s", "speedup"]
+        print(format_row(header))
+        for max_tokens in args.max_tokens:
+            batches = dataset.batch_by_size(
+                dataset.ordered_indices(), max_tokens=max_tokens
+            )
+
+            def samples():
+                for batch in batches:
+                    dataset.collater([dataset[i] for i in batch])
+
+            def fetch():
+                for batch in batches:
+                    dataset.collater(dataset.__getitems__(batch))
+
+            columns = [max_tokens, len(batches)]
+            rates = []
+            for fn in [samples, fetch]:
+                times = time_fn(fn, args.repeat, warmup=1)
+                rates.append(len(dataset) / summarize(times)["mean_ms"] * 1000)
+            print(format_row(columns + rates + [rates[1] / rates[0]]))
+        del src, tgt, dataset
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
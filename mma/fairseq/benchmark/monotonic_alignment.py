@@ -0,0 +1,71 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU microbenchmark of the expected alignment used to train MMA models,
+comparing the per-target-step loop with the fused recurrence.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.monotonic_alignment --threads 1
+"""
+
+import argparse
+import itertools
+
+import torch
+from examples.simultaneous_translation.modules import build_monotonic_attention
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from tests.utils import build_monotonic_attention_args
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bsz-heads", type=int, nargs="+", default=[64, 256])
+    parser.add_argument("--tgt-lens", type=int, nargs="+", default=[20, 50, 100])
+    parser.add_argument("--src-lens", type=int, nargs="+", default=[20, 50, 100])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--forward-only", action="store_true")
+    return parser
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    attention = build_monotonic_attention(build_monotonic_attention_args())
+
+    header = ["bsz*heads", "tgt_len", "src_len", "loop_ms", "fused_ms", "speedup"]
+    print(format_row(header))
+    for bsz_heads, tgt_len, src_len in itertools.product(
+        args.bsz_heads, args.tgt_lens, args.src_lens
+    ):
+        p_choose = torch.rand(bsz_heads, tgt_len, src_len)
+
+        def run(impl):
+            attention.alignment_train_impl = impl
+            p = p_choose.clone().requires_grad_(not args.forward_only)
+            alpha = attention.expected_alignment_train(p, None)
+            if not args.forward_only:
+                alpha.sum().backward()
+
+        loop_ms = summarize(time_fn(lambda: run("loop"), args.repeat))["mean_ms"]
+        fused_ms = summarize(time_fn(lambda: run("fused"), args.repeat))["mean_ms"]
+        print(
+            format_row(
+                [bsz_heads, tgt_len, src_len, loop_ms, fused_ms, loop_ms / fused_ms]
+            )
+        )
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
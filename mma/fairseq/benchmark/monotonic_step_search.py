@@ -0,0 +1,89 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU microbenchmark of the greedy monotonic step search run at every
+target token during MMA inference, comparing the one-step-at-a-time
+loop with the vectorized search.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.monotonic_step_search --threads 1
+"""
+
+import argparse
+import itertools
+
+import torch
+from examples.simultaneous_translation.utils.functions import monotonic_step_search
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+
+
+def step_search_loop(p_choose, prev_step, max_steps, step_offset):
+    """The step search as originally written in expected_alignment_infer"""
+    bsz, num_heads, src_len = p_choose.size()
+    new_step = prev_step.clone()
+    finish_read = new_step.eq(max_steps)
+    p_choose_i = torch.tensor(1)
+    while finish_read.sum().item() < bsz * num_heads:
+        p_choose_i = p_choose.gather(
+            2, (step_offset + new_step).unsqueeze(2).clamp(0, src_len - 1)
+        ).squeeze(2)
+        action = (p_choose_i < 0.5).type_as(new_step).masked_fill(finish_read, 0)
+        new_step += action
+        finish_read = new_step.eq(max_steps) | (action == 0)
+    return new_step, new_step.eq(max_steps) & (p_choose_i < 0.5)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bsz", type=int, nargs="+", default=[1, 50])
+    parser.add_argument("--num-heads", type=int, default=4)
+    parser.add_argument("--src-lens", type=int, nargs="+", default=[20, 50, 100, 200])
+    parser.add_argument(
+        "--sparsity",
+        type=float,
+        default=0.9,
+        help="fraction of p_choose zeroed out, higher means longer moves",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    header = ["bsz", "src_len", "loop_ms/tok", "vector_ms/tok", "speedup"]
+    print(format_row(header))
+    for bsz, src_len in itertools.product(args.bsz, args.src_lens):
+        # Decode as many target tokens as source tokens
+        p_choose = torch.rand(src_len, bsz, args.num_heads, src_len)
+        p_choose = p_choose.masked_fill(p_choose < args.sparsity, 0)
+        max_steps = torch.full([bsz, args.num_heads], src_len - 1).long()
+
+        def decode(search):
+            prev_step = torch.zeros(bsz, args.num_heads).long()
+            for p_choose_t in p_choose:
+                prev_step, _ = search(p_choose_t, prev_step, max_steps, 0)
+
+        loop_ms = summarize(time_fn(lambda: decode(step_search_loop), args.repeat))
+        vector_ms = summarize(
+            time_fn(lambda: decode(monotonic_step_search), args.repeat)
+        )
+        loop_ms = loop_ms["mean_ms"] / src_len
+        vector_ms = vector_ms["mean_ms"] / src_len
+        print(format_row([bsz, src_len, loop_ms, vector_ms, loop_ms / vector_ms]))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU load generator for the multi-stream simultaneous translation
+scheduler. Concurrent streams are fed one source unit every time they
+read, and are served one by one or in batched decoder steps.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.multi_stream_serving --threads 4
+"""
+
+import argparse
+import time
+
+import torch
+from fairseq.benchmark.utils import format_row, summarize
+from tests.utils import build_monotonic_model
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-streams", type=int, nargs="+", default=[8, 32, 64])
+    parser.add_argument(
+        "--max-batch-sizes",
+        type=int,
+        nargs="+",
+        default=[1, 64],
+        help="1 serves the streams one by one",
+    )
+    parser.add_argument("--min-src-len", type=int, default=10)
+    parser.add_argument("--max-src-len", type=int, default=40)
+    parser.add_argument("--max-len", type=int, default=40)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser
+
+
+def serve(model, sources, max_batch_size, max_len):
+    """
+    Serve all the *sources* until every stream is finished.
+    Returns the wall-clock seconds, and the latency of every action,
+    that is the duration of the scheduler step it was taken in.
+    """
+    from examples.simultaneous_translation.utils.stream_scheduler import (
+        READ_ACTION,
+        MultiStreamScheduler,
+    )
+
+    scheduler = MultiStreamScheduler(
+        model, max_len=max_len, max_batch_size=max_batch_size
+    )
+    stream_ids = [scheduler.add_stream() for _ in sources]
+    num_read = {stream_id: 0 for stream_id in stream_ids}
+    latencies = []
+
+    start = time.perf_counter()
+    while not all(scheduler.streams[i].finished for i in stream_ids):
+        step_start = time.perf_counter()
+        actions = scheduler.step()
+        latencies.extend([time.perf_counter() - step_start] * len(actions))
+        for stream_id, action in actions.items():
+            if action.action == READ_ACTION:
+                source = sources[stream_id]
+                scheduler.push_source(
+                    stream_id,
+                    source[num_read[stream_id] : num_read[stream_id] + 1],
+                    finished=num_read[stream_id] + 1 >= len(source),
+                )
+                num_read[stream_id] += 1
+    return time.perf_counter() - start, latencies
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+
+    model = build_monotonic_model(
+        embed_dim=args.embed_dim,
+        ffn_embed_dim=1024,
+        num_layers=args.layers,
+        vocab_size=1000,
+        max_positions=1024,
+    )
+    vocab_size = len(model.encoder.dictionary)
+
+    header = ["streams", "batch", "streams/s", "p50_ms", "p99_ms", "actions"]
+    print(format_row(header))
+    for num_streams in args.num_streams:
+        sources = [
+            torch.randint(
+                model.encoder.dictionary.nspecial,
+                vocab_size,
+                (int(torch.randint(args.min_src_len, args.max_src_len + 1, (1,))),),
+            ).tolist()
+            for _ in range(num_streams)
+        ]
+        for max_batch_size in args.max_batch_sizes:
+            seconds, latencies = serve(model, sources, max_batch_size, args.max_len)
+            stats = summarize(latencies)
+            print(
+                format_row(
+                    [
+                        num_streams,
+                        max_batch_size,
+                        num_streams / seconds,
+                        stats["p50_ms"],
+                        stats["p99_ms"],
+                        len(latencies),
+                    ]
+                )
+            )
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
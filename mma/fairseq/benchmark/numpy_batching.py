@@ -0,0 +1,136 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Benchmark of the NumPy fallbacks of the Cython batching helpers
+(data_utils_numpy, token_block_utils_numpy) against the Cython versions,
+on synthetic sentence lengths. The batches are checked to be identical.
+
+The "by_size" rows batch the indices sorted by length, as
+FairseqDataset.ordered_indices does, and the "by_size_shuffled" rows in
+random order. The "by_size_fn" rows go through a num_tokens_fn on a tenth
+of the sentences.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.numpy_batching --threads 1
+"""
+
+import argparse
+
+import numpy as np
+import torch
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from fairseq.data import data_utils_numpy, token_block_utils_numpy
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-sentences", type=int, default=10000000)
+    parser.add_argument("--max-len", type=int, default=250)
+    parser.add_argument("--max-tokens", type=int, default=4096)
+    parser.add_argument("--max-sentences", type=int, default=0)
+    parser.add_argument("--required-batch-size-multiple", type=int, default=8)
+    parser.add_argument("--tokens-per-block", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def same_batches(batches, expected):
+    return len(batches) == len(expected) and all(
+        np.array_equal(a, b) for a, b in zip(batches, expected)
+    )
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    try:
+        from fairseq.data import data_utils_fast, token_block_utils_fast
+    except ImportError:
+        data_utils_fast = token_block_utils_fast = None
+        print("Cython components are not built, timing the NumPy versions only")
+
+    rng = np.random.RandomState(1)
+    sizes = rng.randint(1, args.max_len + 1, size=args.num_sentences).astype(np.int64)
+    sorted_indices = np.argsort(sizes, kind="mergesort")
+    shuffled_indices = rng.permutation(args.num_sentences)
+    fn_indices = shuffled_indices[: args.num_sentences // 10]
+    batching_args = (
+        args.max_tokens,
+        args.max_sentences,
+        args.required_batch_size_multiple,
+    )
+
+    benches = []
+    for name, indices in [
+        ("by_size", sorted_indices),
+        ("by_size_shuffled", shuffled_indices),
+    ]:
+        benches.append(
+            (
+                name,
+                lambda module, indices=indices: module.batch_by_size_vec(
+                    indices, sizes[indices], *batching_args
+                ),
+            )
+        )
+    benches.append(
+        (
+            "by_size_fn",
+            lambda module: module.batch_by_size_fn(
+                fn_indices, sizes.__getitem__, *batching_args
+            ),
+        )
+    )
+    for break_mode in ["none", "complete", "complete_doc"]:
+
+        def token_blocks(module, break_mode=break_mode):
+            slice_indices = module._get_slice_indices_fast(
+                sizes, break_mode, args.tokens_per_block, 1
+            )
+            return [
+                slice_indices,
+                module._get_block_to_dataset_index_fast(sizes, slice_indices),
+            ]
+
+        benches.append(("blocks_" + break_mode, token_blocks))
+
+    header = ["bench", "cython_ms", "numpy_ms", "identical"]
+    widths = [22, 12, 12, 12]
+    print(format_row(header, widths))
+    for name, bench in benches:
+        if name.startswith("blocks"):
+            fast, fallback = token_block_utils_fast, token_block_utils_numpy
+        else:
+            fast, fallback = data_utils_fast, data_utils_numpy
+        columns = [name]
+        results = {}
+        for module in [fast, fallback]:
+            if module is None:
+                columns.append("-")
+                continue
+            times = time_fn(
+                lambda: results.__setitem__(module, bench(module)),
+                args.repeat,
+                warmup=0,
+            )
+            columns.append(summarize(times)["mean_ms"])
+        if fast is None:
+            columns.append("-")
+        else:
+            columns.append(same_batches(results[fallback], results[fast]))
+        print(format_row(columns, widths))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
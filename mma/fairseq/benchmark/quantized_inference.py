@@ -0,0 +1,171 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Drift and CPU latency of a simultaneous translation checkpoint with its
+linear layers quantized to int8 (dynamic quantization), against the fp32
+model, on a validation set.
+
+For both models, the table lists the BLEU and latency scores of greedy
+decoding and the decoding time per generated token. The last rows give
+the share of identical hypotheses, and the share of p_choose >= 0.5
+decisions that flip with quantization, with the model forced on the
+reference targets.
+
+Linear layers matching one of the --keep-fp32 regular expressions stay
+in full precision, e.g. the monotonic energy of the first decoder layer,
+which all the layers share:
+
+    --keep-fp32 'decoder\\.layers\\.0\\.encoder_attn\\.[qk]_proj'
+
+Any argument that is not listed below is passed on to fairseq-generate,
+and --cpu is always set. Run from the repository root:
+
+    python -m fairseq.benchmark.quantized_inference data-bin \
+        --path checkpoint.pt --user-dir examples/simultaneous_translation \
+        --batch-size 16 --cpu-threads 1
+"""
+
+import argparse
+import ast
+import copy
+import re
+import time
+
+import torch
+import torch.nn as nn
+from fairseq import checkpoint_utils, options, scoring, tasks, utils
+from fairseq.benchmark.utils import format_row
+from fairseq.dataclass.utils import convert_namespace_to_omegaconf
+from fairseq.quantization_utils import quantize_model_dynamic
+from fairseq.scoring.latency import LatencyScorer
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--keep-fp32",
+        nargs="+",
+        default=[],
+        metavar="REGEX",
+        help="names of linear layers kept in full precision",
+    )
+    return parser
+
+
+def load_batches(cfg, task, model):
+    itr = task.get_batch_iterator(
+        dataset=task.dataset(cfg.dataset.gen_subset),
+        max_tokens=cfg.dataset.max_tokens,
+        max_sentences=cfg.dataset.batch_size,
+        max_positions=utils.resolve_max_positions(
+            task.max_positions(), model.max_positions()
+        ),
+        ignore_invalid_inputs=cfg.dataset.skip_invalid_size_inputs_valid_test,
+        required_batch_size_multiple=cfg.dataset.required_batch_size_multiple,
+        seed=cfg.common.seed,
+    ).next_epoch_itr(shuffle=False)
+    return list(itr)
+
+
+def decode(cfg, task, model, batches):
+    """Hypotheses, BLEU, latency scores and decoding time per token"""
+    tgt_dict = task.target_dictionary
+    generator = task.build_generator([model], cfg.generation)
+    scorer = scoring.build_scorer(cfg.scoring, tgt_dict)
+    latency_scorer = LatencyScorer()
+    # Leave out lazy initializations
+    task.inference_step(generator, [model], batches[0])
+
+    hypotheses, seconds, num_tokens = {}, 0.0, 0
+    for sample in batches:
+        start = time.perf_counter()
+        hypos, delays, src_lens = task.inference_step(generator, [model], sample)
+        seconds += time.perf_counter() - start
+        latency_scorer.add(delays, src_lens)
+        for i, sample_id in enumerate(sample["id"].tolist()):
+            hypo_tokens = hypos[i][0]["tokens"].int().cpu()
+            num_tokens += len(hypo_tokens)
+            hypotheses[sample_id] = hypo_tokens.tolist()
+            target_tokens = utils.strip_pad(sample["target"][i], tgt_dict.pad())
+            target_tokens = target_tokens.int().cpu()
+            if hasattr(scorer, "add_string"):
+                scorer.add_string(
+                    tgt_dict.string(target_tokens), tgt_dict.string(hypo_tokens)
+                )
+            else:
+                scorer.add(target_tokens, hypo_tokens)
+    scores = latency_scorer.score()
+    scores["BLEU"] = scorer.score()
+    scores["ms/tok"] = 1000 * seconds / num_tokens
+    return hypotheses, scores
+
+
+def p_choose_decisions(model, sample, pad):
+    """The p_choose >= 0.5 decisions of the model forced on the targets"""
+    net_input = sample["net_input"]
+    encoder_out = model.encoder(net_input["src_tokens"], net_input["src_lengths"])
+    _, extra = model.decoder(net_input["prev_output_tokens"], encoder_out=encoder_out)
+    p_choose = extra["attn_list"][0]["p_choose"]
+    mask = (
+        sample["target"].ne(pad)[:, None, :, None]
+        & net_input["src_tokens"].ne(pad)[:, None, None, :]
+    )
+    return (p_choose >= 0.5)[mask.expand_as(p_choose)]
+
+
+def main(args, generate_args):
+    parser = options.get_generation_parser()
+    gen_args = options.parse_args_and_arch(parser, generate_args + ["--cpu"])
+    cfg = convert_namespace_to_omegaconf(gen_args)
+    utils.import_user_module(cfg.common)
+    if cfg.generation.cpu_threads is not None:
+        torch.set_num_threads(cfg.generation.cpu_threads)
+
+    task = tasks.setup_task(cfg.task)
+    models, saved_cfg = checkpoint_utils.load_model_ensemble(
+        utils.split_paths(cfg.common_eval.path),
+        arg_overrides=ast.literal_eval(cfg.common_eval.model_overrides),
+        task=task,
+    )
+    task.load_dataset(cfg.dataset.gen_subset, task_cfg=saved_cfg.task)
+    model = models[0]
+    model.prepare_for_inference_(cfg)
+    keep_fp32 = [
+        name
+        for name, module in model.named_modules()
+        if isinstance(module, nn.Linear)
+        and any(re.search(pattern, name) for pattern in args.keep_fp32)
+    ]
+    quantized = quantize_model_dynamic(copy.deepcopy(model), keep_fp32)
+    batches = load_batches(cfg, task, model)
+
+    header = ["model", "BLEU", "CW", "AP", "AL", "DAL", "ms/tok"]
+    print(format_row(header))
+    with torch.no_grad():
+        results = {}
+        for name, m in [("fp32", model), ("int8", quantized)]:
+            results[name], scores = decode(cfg, task, m, batches)
+            print(format_row([name] + [float(scores[key]) for key in header[1:]]))
+
+        same = sum(results["int8"][i] == hypo for i, hypo in results["fp32"].items())
+        flips, total = 0, 0
+        pad = task.target_dictionary.pad()
+        for sample in batches:
+            decisions = p_choose_decisions(model, sample, pad)
+            flips += (decisions != p_choose_decisions(quantized, sample, pad)).sum()
+            total += decisions.numel()
+    print("identical hypotheses: {:.2%}".format(same / len(results["fp32"])))
+    print("flipped p_choose decisions: {:.3%}".format(int(flips) / max(total, 1)))
+
+
+def cli_main():
+    parser = get_parser()
+    args, generate_args = parser.parse_known_args()
+    main(args, generate_args)
+
+
+if __name__ == "__main__":
+    cli_main()
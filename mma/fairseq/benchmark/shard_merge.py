@@ -0,0 +1,164 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+Benchmark of the two ways fairseq-preprocess assembles the output of its
+workers into a MMapIndexedDataset, on a synthetic corpus of --size-gb
+gigabytes of tokens:
+
+- "merge_file": each worker writes its own temporary dataset, which is
+  then appended to the output with merge_file_ (a copy of the data);
+- "in_place": the output data file is sized ahead with reserve_shard_, the
+  workers write their shard in place with a MMapIndexedDatasetShardBuilder,
+  and merge_shard_ only concatenates the sizes of the items.
+
+The workers generate their tokens --block-elements at a time, so the
+corpus is never held in memory. The output files are checked to be
+identical.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.shard_merge --workers 4
+"""
+
+import argparse
+import filecmp
+import os
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from fairseq.benchmark.utils import format_row
+from fairseq.data.indexed_dataset import (
+    MMapIndexedDatasetBuilder,
+    MMapIndexedDatasetShardBuilder,
+    best_fitting_int_dtype,
+    data_file_path,
+    index_file_path,
+)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-gb", type=float, default=2.0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--vocab-size", type=int, default=30000)
+    parser.add_argument("--min-len", type=int, default=5)
+    parser.add_argument("--max-len", type=int, default=100)
+    parser.add_argument("--block-elements", type=int, default=10000000)
+    parser.add_argument("--tmpdir", default=None, help="where to write the datasets")
+    return parser
+
+
+def generate_blocks(seed, num_elements, args):
+    """Yield the (tokens, sizes) of the items of a shard, block by block"""
+    rng = np.random.RandomState(seed)
+    remaining = num_elements
+    while remaining > 0:
+        block = min(args.block_elements, remaining)
+        lengths = rng.randint(args.min_len, args.max_len + 1, block // args.min_len + 1)
+        ends = np.cumsum(lengths)
+        last = np.searchsorted(ends, block)
+        lengths = lengths[: last + 1]
+        lengths[-1] -= ends[last] - block
+        yield rng.randint(4, args.vocab_size, size=block), lengths
+        remaining -= block
+
+
+def write_temp(prefix, seed, num_elements, args):
+    builder = MMapIndexedDatasetBuilder(
+        data_file_path(prefix), dtype=best_fitting_int_dtype(args.vocab_size)
+    )
+    for tokens, sizes in generate_blocks(seed, num_elements, args):
+        builder.add_items(tokens, sizes)
+    builder.finalize(index_file_path(prefix))
+
+
+def write_shard(shard, seed, args):
+    builder = MMapIndexedDatasetShardBuilder(*shard)
+    for tokens, sizes in generate_blocks(seed, shard[3], args):
+        builder.add_items(tokens, sizes)
+    return builder.finalize()
+
+
+def merge_file(dirname, num_elements, args):
+    prefix = os.path.join(dirname, "merge_file")
+    temp_prefixes = [
+        "{}{}".format(prefix, worker_id) for worker_id in range(len(num_elements))
+    ]
+    start = time.perf_counter()
+    with Pool(processes=args.workers) as pool:
+        pool.starmap(
+            write_temp,
+            [
+                (temp_prefix, seed, n, args)
+                for seed, (temp_prefix, n) in enumerate(zip(temp_prefixes, num_elements))
+            ],
+        )
+    written = time.perf_counter()
+    builder = MMapIndexedDatasetBuilder(
+        data_file_path(prefix), dtype=best_fitting_int_dtype(args.vocab_size)
+    )
+    for temp_prefix in temp_prefixes:
+        builder.merge_file_(temp_prefix)
+        os.remove(data_file_path(temp_prefix))
+        os.remove(index_file_path(temp_prefix))
+    builder.finalize(index_file_path(prefix))
+    return prefix, written - start, time.perf_counter() - written
+
+
+def in_place(dirname, num_elements, args):
+    prefix = os.path.join(dirname, "in_place")
+    start = time.perf_counter()
+    builder = MMapIndexedDatasetBuilder(
+        data_file_path(prefix), dtype=best_fitting_int_dtype(args.vocab_size)
+    )
+    shards = [
+        (data_file_path(prefix), builder.dtype, builder.reserve_shard_(n), n)
+        for n in num_elements
+    ]
+    with Pool(processes=args.workers) as pool:
+        sizes = pool.starmap(
+            write_shard, [(shard, seed, args) for seed, shard in enumerate(shards)]
+        )
+    written = time.perf_counter()
+    for shard_sizes in sizes:
+        builder.merge_shard_(shard_sizes)
+    builder.finalize(index_file_path(prefix))
+    return prefix, written - start, time.perf_counter() - written
+
+
+def main(args):
+    itemsize = best_fitting_int_dtype(args.vocab_size)().itemsize
+    total = int(args.size_gb * 2 ** 30) // itemsize
+    num_elements = [total // args.workers] * args.workers
+    num_elements[-1] += total - sum(num_elements)
+
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as dirname:
+        header = ["assembly", "GB", "write_s", "merge_s", "total_s"]
+        print(format_row(header))
+        prefixes = []
+        for name, fn in [("merge_file", merge_file), ("in_place", in_place)]:
+            prefix, write_seconds, merge_seconds = fn(dirname, num_elements, args)
+            prefixes.append(prefix)
+            size = os.path.getsize(data_file_path(prefix)) / 2 ** 30
+            columns = [name, size, write_seconds, merge_seconds]
+            print(format_row(columns + [write_seconds + merge_seconds]))
+        identical = all(
+            filecmp.cmp(path(prefixes[0]), path(prefixes[1]), shallow=False)
+            for path in [index_file_path, data_file_path]
+        )
+        print("identical: {}".format(identical))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
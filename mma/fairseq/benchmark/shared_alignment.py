@@ -0,0 +1,157 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU benchmark of a single path training step (forward, label smoothed
+loss and backward) of the monotonic transformer in its 6 layer IWSLT
+configuration. The "stacked" columns also stack the expected attention
+of every decoder layer and average it, as the decoder used to do on
+every training step.
+
+The peak memory is the peak resident set size increase of a training
+step in a fresh process, so it needs Linux.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.shared_alignment --threads 1
+"""
+
+import argparse
+import multiprocessing
+import os
+
+import torch
+from fairseq.benchmark.single_path_training import build_sample
+from fairseq.benchmark.utils import (
+    format_row,
+    proc_status,
+    reset_peak_rss,
+    summarize,
+    time_fn,
+)
+from fairseq.criterions.label_smoothed_cross_entropy import (
+    LabelSmoothedCrossEntropyCriterion,
+)
+from tests.utils import build_monotonic_model
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--simul-types",
+        nargs="+",
+        default=["hard_aligned", "infinite_lookback"],
+    )
+    parser.add_argument("--lens", type=int, nargs="+", default=[25, 50])
+    parser.add_argument("--max-tokens", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def build_training_step(simul_type, length, max_tokens, stacked):
+    """A training step function of transformer_monotonic_iwslt_de_en"""
+    torch.manual_seed(1)
+    model = build_monotonic_model(
+        embed_dim=512,
+        ffn_embed_dim=1024,
+        num_heads=4,
+        num_layers=6,
+        vocab_size=1000,
+        max_positions=1024,
+        simul_type=simul_type,
+    ).train()
+    dictionary = model.decoder.dictionary
+    task = argparse.Namespace(target_dictionary=dictionary)
+    criterion = LabelSmoothedCrossEntropyCriterion(
+        task, sentence_avg=False, label_smoothing=0.1, dual_weight=0.0
+    )
+    sample = build_sample(dictionary, max(max_tokens // length, 1), length, length)
+
+    betas, averages = [], []
+    if stacked:
+        for layer in model.decoder.layers:
+            layer.register_forward_hook(
+                lambda module, inputs, output: betas.append(output[1]["beta"])
+            )
+
+        def average(module, inputs, output):
+            averages.append(torch.mean(torch.stack(betas), 0))
+
+        model.decoder.register_forward_hook(average)
+
+    def train_step():
+        loss, _, _ = criterion(model, sample)
+        loss.backward()
+        model.zero_grad()
+        betas.clear()
+        averages.clear()
+
+    return train_step
+
+
+def _peak_memory(simul_type, length, max_tokens, stacked, queue):
+    train_step = build_training_step(simul_type, length, max_tokens, stacked)
+    # Leave out the gradients and lazy initializations of the first step
+    train_step()
+    rss = proc_status("VmRSS")
+    reset_peak_rss()
+    train_step()
+    queue.put(proc_status("VmHWM") - rss)
+
+
+def peak_memory(*args):
+    """Peak memory increase in MB of one training step in a fresh process"""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_peak_memory, args=args + (queue,))
+    # Large buffers are mapped and unmapped by malloc instead of being
+    # kept in the heap, so that the peak resident set size follows the
+    # live tensors
+    mmap_threshold = os.environ.get("MALLOC_MMAP_THRESHOLD_")
+    os.environ["MALLOC_MMAP_THRESHOLD_"] = str(2 ** 17)
+    try:
+        process.start()
+    finally:
+        if mmap_threshold is None:
+            del os.environ["MALLOC_MMAP_THRESHOLD_"]
+        else:
+            os.environ["MALLOC_MMAP_THRESHOLD_"] = mmap_threshold
+    peak = queue.get()
+    process.join()
+    return peak / 2 ** 20
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    header = ["simul_type", "len", "stacked_ms", "shared_ms", "stacked_MB", "shared_MB"]
+    widths = [18] + [12] * (len(header) - 1)
+    print(format_row(header, widths))
+    for simul_type in args.simul_types:
+        for length in args.lens:
+            columns = [simul_type, length]
+            for stacked in [True, False]:
+                train_step = build_training_step(
+                    simul_type, length, args.max_tokens, stacked
+                )
+                times = time_fn(train_step, args.repeat, warmup=1)
+                columns.append(summarize(times)["mean_ms"])
+            for stacked in [True, False]:
+                columns.append(
+                    peak_memory(simul_type, length, args.max_tokens, stacked)
+                )
+            print(format_row(columns, widths))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
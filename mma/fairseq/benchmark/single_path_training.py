@@ -0,0 +1,118 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU microbenchmark of a single path training step (forward, label smoothed
+loss and backward) of a monotonic transformer. The "legacy" column also
+builds the backward model data on every step, as the forward pass used
+to do even when the dual path loss was off.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.single_path_training --threads 4
+"""
+
+import argparse
+
+import torch
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from fairseq.criterions.label_smoothed_cross_entropy import (
+    LabelSmoothedCrossEntropyCriterion,
+)
+from fairseq.modules.dual_path import process_back_data
+from tests.utils import build_monotonic_model
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 64])
+    parser.add_argument("--src-len", type=int, default=40)
+    parser.add_argument("--tgt-len", type=int, default=40)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def build_sample(dictionary, bsz, src_len, tgt_len):
+    target = torch.randint(dictionary.nspecial, len(dictionary), (bsz, tgt_len))
+    target[:, -1] = dictionary.eos()
+    prev_output_tokens = torch.cat(
+        [torch.full((bsz, 1), dictionary.eos(), dtype=torch.long), target[:, :-1]],
+        dim=1,
+    )
+    src_tokens = torch.randint(dictionary.nspecial, len(dictionary), (bsz, src_len))
+    src_tokens[:, -1] = dictionary.eos()
+    return {
+        "id": torch.arange(bsz),
+        "nsentences": bsz,
+        "ntokens": target.numel(),
+        "net_input": {
+            "src_tokens": src_tokens,
+            "src_lengths": torch.full((bsz,), src_len, dtype=torch.long),
+            "prev_output_tokens": prev_output_tokens,
+        },
+        "target": target,
+    }
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    model = build_monotonic_model(
+        embed_dim=args.embed_dim,
+        ffn_embed_dim=1024,
+        num_layers=args.layers,
+        vocab_size=1000,
+        max_positions=1024,
+    )
+    model.train()
+    dictionary = model.decoder.dictionary
+    task = argparse.Namespace(target_dictionary=dictionary)
+    criterion = LabelSmoothedCrossEntropyCriterion(
+        task, sentence_avg=False, label_smoothing=0.1, dual_weight=0.0
+    )
+
+    header = ["bsz", "legacy_ms", "single_ms", "back_data_ms", "speedup"]
+    print(format_row(header))
+    for bsz in args.batch_sizes:
+        sample = build_sample(dictionary, bsz, args.src_len, args.tgt_len)
+
+        def back_data():
+            process_back_data(**sample["net_input"])
+
+        def train_step(legacy):
+            if legacy:
+                back_data()
+            loss, _, _ = criterion(model, sample)
+            loss.backward()
+            model.zero_grad()
+
+        legacy = summarize(time_fn(lambda: train_step(True), args.repeat, warmup=2))
+        single = summarize(time_fn(lambda: train_step(False), args.repeat, warmup=2))
+        back = summarize(time_fn(back_data, args.repeat, warmup=2))
+        print(
+            format_row(
+                [
+                    bsz,
+                    legacy["mean_ms"],
+                    single["mean_ms"],
+                    back["mean_ms"],
+                    legacy["mean_ms"] / single["mean_ms"],
+                ]
+            )
+        )
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
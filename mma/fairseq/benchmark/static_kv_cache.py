@@ -0,0 +1,99 @@
+#!/usr/bin/env python3 -u
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+CPU benchmark of batched greedy incremental decoding with the monotonic
+decoder, comparing the projection of the encoder states by the
+encoder-decoder attention on every step with the static key/value cache
+kept in the incremental state.
+
+Run from the repository root:
+
+    python -m fairseq.benchmark.static_kv_cache --threads 1
+"""
+
+import argparse
+
+import torch
+from fairseq.benchmark.utils import format_row, summarize, time_fn
+from tests.utils import build_monotonic_model
+
+
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--src-lens", type=int, nargs="+", default=[20, 50, 100])
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--embed-dim", type=int, default=256)
+    parser.add_argument("--ffn-embed-dim", type=int, default=1024)
+    parser.add_argument("--attention-heads", type=int, default=4)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    return parser
+
+
+def greedy_decode(model, src_tokens, max_len, cached):
+    """Greedy decoding of a batch, with the whole source already read"""
+    decoder = model.decoder
+    encoder_out = model.encoder(src_tokens, src_lengths=None)
+    bsz = src_tokens.size(0)
+    tokens = src_tokens.new_full((bsz, 1), decoder.dictionary.eos())
+    incremental_state = {
+        "online": {"only": torch.tensor(False)},
+        "steps": {"src": src_tokens.size(1), "tgt": 1},
+    }
+    for _ in range(max_len):
+        if not cached:
+            # Project the encoder states again, as before the cache
+            for layer in decoder.layers:
+                layer.encoder_attn._set_input_buffer(incremental_state, {})
+        x, _ = decoder(tokens, encoder_out=encoder_out, incremental_state=incremental_state)
+        tokens = torch.cat([tokens, x[:, -1:].argmax(dim=-1)], dim=1)
+    return tokens
+
+
+def main(args):
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    model = build_monotonic_model(
+        embed_dim=args.embed_dim,
+        ffn_embed_dim=args.ffn_embed_dim,
+        num_heads=args.attention_heads,
+        num_layers=args.layers,
+        vocab_size=1000,
+        max_positions=1024,
+    )
+
+    header = ["src_len", "uncached_tok/s", "cached_tok/s", "speedup"]
+    print(format_row(header, [12, 16, 16, 12]))
+    for src_len in args.src_lens:
+        src_tokens = torch.randint(
+            4, len(model.decoder.dictionary), (args.batch_size, src_len)
+        )
+        src_tokens[:, -1] = model.decoder.dictionary.eos()
+        num_tokens = args.batch_size * src_len
+
+        columns = [src_len]
+        with torch.no_grad():
+            for cached in [False, True]:
+                times = time_fn(
+                    lambda: greedy_decode(model, src_tokens, src_len, cached),
+                    args.repeat,
+                    warmup=1,
+                )
+                columns.append(num_tokens / summarize(times)["mean_ms"] * 1000)
+        columns.append(columns[2] / columns[1])
+        print(format_row(columns, [12, 16, 16, 12]))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == "__main__":
+    cli_main()
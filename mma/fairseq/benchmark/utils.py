@@ -0,0 +1,66 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Small helpers shared by the CPU microbenchmarks in this directory.
+"""
+
+import time
+
+import numpy as np
+import torch
+
+
+def time_fn(fn, repeat: int = 10, warmup: int = 2):
+    """
+    Call *fn* *warmup* times, then *repeat* times,
+    and return the wall-clock seconds of the timed calls.
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        fn()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(times):
+    """Mean, p50 and p99 of a list of timings, in milliseconds."""
+    times = np.asarray(times) * 1000.0
+    return {
+        "mean_ms": float(times.mean()),
+        "p50_ms": float(np.percentile(times, 50)),
+        "p99_ms": float(np.percentile(times, 99)),
+    }
+
+
+def format_row(columns, widths=None):
+    widths = widths or [12] * len(columns)
+    return " ".join(
+        "{:>{}}".format(
+            "{:.3f}".format(col) if isinstance(col, float) else str(col), width
+        )
+        for col, width in zip(columns, widths)
+    )
+
+
+def proc_status(key):
+    """A memory entry of /proc/self/status, such as VmRSS, in bytes (Linux)"""
+    with open("/proc/self/status") as h:
+        for line in h:
+            if line.startswith(key + ":"):
+                return int(line.split()[1]) * 1024
+
+
+def reset_peak_rss():
+    """Reset the peak resident set size (VmHWM) to the current one (Linux)"""
+    with open("/proc/self/clear_refs", "w") as h:
+        h.write("5")
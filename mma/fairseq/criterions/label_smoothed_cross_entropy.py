@@ -88,10 +88,18 @@ class LabelSmoothedCrossEntropyCriterion(FairseqCriterion):
         2) the sample size, which is used as the denominator for the gradient
         3) logging outputs to display while training
         """
-        dual_path = True if self.dual_weight == 1.0 else False
+        # --dual-weight 1.0 requests the dual path loss, unless the model
+        # is built with --single-path, without a backward model: the
+        # backward data and dual loss are then skipped altogether
+        single_path = getattr(getattr(model, "args", None), "single_path", False)
+        dual_path = self.dual_weight == 1.0 and not single_path
+        if dual_path:
+            assert getattr(model, "back_encoder", None) is not None, (
+                "The dual path loss needs a backward model. "
+                "Train with --single-path, or with a --dual-weight other than 1.0."
+            )
 
-        # if dual_path is False, dual_loss will be None
-        # TODO: handle this to avoid malicious behaviour
+        # if dual_path is False, dual_loss and back_data will be None
         net_output, back_net_output, dual_loss, back_data, lm_net_output = model(**sample["net_input"], dual=dual_path)
 
         # get forward model loss
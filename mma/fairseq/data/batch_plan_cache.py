@@ -0,0 +1,139 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+On-disk cache of the batches of a dataset (its "batch plan"), so that the
+next runs with the same data and batching options load them instead of
+computing the ordered indices, filtering them by size and batching them
+again. The batches of a plan are stored flattened in ``<key>.indices.npy``,
+with their boundaries in ``<key>.offsets.npy``, and loaded memory-mapped.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+import numpy as np
+import torch
+from fairseq.data import indexed_dataset
+
+
+logger = logging.getLogger(__name__)
+
+
+_SCALAR_TYPES = (bool, int, float, str, type(None))
+
+
+def _walk_datasets(dataset):
+    """Yield *dataset* and the datasets it wraps, once each"""
+    seen = set()
+    stack = [dataset]
+    while len(stack) > 0:
+        ds = stack.pop()
+        if id(ds) in seen:
+            continue
+        seen.add(id(ds))
+        yield ds
+        for value in vars(ds).values():
+            if isinstance(value, dict):
+                value = list(value.values())
+            if isinstance(value, torch.utils.data.Dataset):
+                stack.append(value)
+            elif (
+                isinstance(value, (list, tuple))
+                and len(value) > 0
+                and isinstance(value[0], torch.utils.data.Dataset)
+            ):
+                stack.extend(
+                    v for v in value if isinstance(v, torch.utils.data.Dataset)
+                )
+
+
+def _index_file(ds):
+    if isinstance(ds, indexed_dataset.MMapIndexedDataset):
+        return indexed_dataset.index_file_path(ds._path)
+    if isinstance(ds, indexed_dataset.IndexedDataset):
+        return indexed_dataset.index_file_path(ds.path)
+    return None
+
+
+def fingerprint(dataset, **batching_args):
+    """Key of the batch plan of *dataset* with the given *batching_args*,
+    or None if the dataset has no ``sizes`` to tell its data apart.
+
+    The key covers the index files of the indexed datasets *dataset* is
+    built on (path, size and modification time), the scalar attributes of
+    every dataset it wraps (e.g. ``shuffle``, ``left_pad_source``), the
+    sizes of its examples and the *batching_args*."""
+    try:
+        sizes = dataset.sizes
+    except NotImplementedError:
+        return None
+    if sizes is None:
+        return None
+
+    h = hashlib.sha1()
+    for ds in _walk_datasets(dataset):
+        scalars = sorted(
+            (name, value)
+            for name, value in vars(ds).items()
+            if isinstance(value, _SCALAR_TYPES)
+        )
+        h.update(repr((type(ds).__qualname__, scalars)).encode("utf-8"))
+        index_file = _index_file(ds)
+        if index_file is not None:
+            stat = os.stat(index_file)
+            h.update(
+                repr(
+                    (os.path.abspath(index_file), stat.st_size, stat.st_mtime_ns)
+                ).encode("utf-8")
+            )
+    sizes = sizes if isinstance(sizes, (list, tuple)) else [sizes]
+    for s in sizes:
+        s = np.ascontiguousarray(s)
+        h.update(repr((s.dtype.str, s.shape)).encode("utf-8"))
+        h.update(s.data)
+    h.update(repr(sorted(batching_args.items())).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _paths(cache_dir, key):
+    return (
+        os.path.join(cache_dir, "{}.indices.npy".format(key)),
+        os.path.join(cache_dir, "{}.offsets.npy".format(key)),
+    )
+
+
+def load(cache_dir, key):
+    """Return the batches cached under *key* in *cache_dir*, as views of the
+    memory-mapped indices, or None if there are none"""
+    indices_path, offsets_path = _paths(cache_dir, key)
+    if not (os.path.exists(indices_path) and os.path.exists(offsets_path)):
+        return None
+    indices = np.asarray(np.load(indices_path, mmap_mode="r"))
+    offsets = np.load(offsets_path)
+    logger.info("loaded {} cached batches from {}".format(len(offsets) - 1, cache_dir))
+    if len(offsets) == 1:
+        return []
+    return np.split(indices, offsets[1:-1])
+
+
+def save(cache_dir, key, batches):
+    """Cache the *batches* under *key* in *cache_dir*. The files are written
+    under temporary names then renamed, so that concurrent runs (e.g. the
+    workers of a distributed training) never read partial files."""
+    os.makedirs(cache_dir, exist_ok=True)
+    offsets = np.zeros(len(batches) + 1, dtype=np.int64)
+    np.cumsum([len(batch) for batch in batches], out=offsets[1:])
+    if len(batches) > 0:
+        indices = np.concatenate(batches).astype(np.int64, copy=False)
+    else:
+        indices = np.zeros(0, dtype=np.int64)
+    for path, array in zip(_paths(cache_dir, key), [indices, offsets]):
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    logger.info("cached {} batches in {}".format(len(batches), cache_dir))
@@ -279,6 +279,20 @@ def filter_paired_dataset_indices_by_size(src_sizes, tgt_sizes, indices, max_siz
     return indices, ignored.tolist()
 
 
+_cython_fallbacks = set()
+
+
+def warn_cython_fallback(module):
+    """Warn once that the NumPy version of a Cython *module* is used"""
+    if module not in _cython_fallbacks:
+        _cython_fallbacks.add(module)
+        logger.warning(
+            "fairseq.data.{} is not built for this interpreter, using its slower "
+            "NumPy version. Build the Cython components with: "
+            "`python setup.py build_ext --inplace`".format(module)
+        )
+
+
 def batch_by_size(
     indices,
     num_tokens_fn,
@@ -314,14 +328,12 @@ def batch_by_size(
             batch_by_size_vec,
             batch_fixed_shapes_fast,
         )
-    except ImportError:
-        raise ImportError(
-            "Please build Cython components with: "
-            "`python setup.py build_ext --inplace`"
-        )
-    except ValueError:
-        raise ValueError(
-            "Please build (or rebuild) Cython components with `python setup.py build_ext --inplace`."
+    except (ImportError, ValueError):
+        warn_cython_fallback("data_utils_fast")
+        from fairseq.data.data_utils_numpy import (
+            batch_by_size_fn,
+            batch_by_size_vec,
+            batch_fixed_shapes_fast,
         )
 
     # added int() to avoid TypeError: an integer is required
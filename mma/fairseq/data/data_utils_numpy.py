@@ -0,0 +1,147 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+NumPy implementations of the batching functions of data_utils_fast, used
+when the Cython extensions are not built for the running interpreter.
+They return the same batches as data_utils_fast.
+"""
+
+import numpy as np
+
+
+def _last_valid_size(num_sentences, min_sentences, bsz_mult):
+    """The largest batch size up to *num_sentences* that is smaller than or
+    a multiple of *bsz_mult*, or 0 if it is smaller than *min_sentences*"""
+    if num_sentences >= bsz_mult:
+        num_sentences -= num_sentences % bsz_mult
+    return num_sentences if num_sentences >= min_sentences else 0
+
+
+def batch_by_size_vec(indices, num_tokens_vec, max_tokens, max_sentences, bsz_mult):
+    if indices.shape[0] == 0:
+        return []
+
+    assert max_tokens <= 0 or np.max(num_tokens_vec) <= max_tokens, (
+        f"Sentences lengths should not exceed max_tokens={max_tokens}"
+    )
+
+    num_tokens_vec = np.asarray(num_tokens_vec, dtype=np.int64)
+    indices_len = indices.shape[0]
+    # Same bookkeeping as data_utils_fast: the current batch is
+    # [batch_start, batch_end), and every batch end is a split point. The
+    # batch grows (while its size is smaller than or a multiple of bsz_mult)
+    # up to the first position that overflows max_tokens or max_sentences,
+    # found on a window of positions at a time.
+    batches_ends = []
+    batch_start = 0
+    batch_end = 0
+    batch_max_tokens = 0
+    window = max(bsz_mult, 64)
+    # batch sizes of every position, sliced from the batch start
+    sizes_from_start = np.arange(1, indices_len + 1, dtype=np.int64)
+    while True:
+        overflow_pos = -1
+        while True:
+            stop = min(batch_end + window, indices_len)
+            if max_sentences > 0:
+                stop = min(stop, max(batch_start + max_sentences, batch_end))
+            running_max = np.maximum.accumulate(num_tokens_vec[batch_end:stop])
+            if batch_max_tokens > 0:
+                np.maximum(running_max, batch_max_tokens, out=running_max)
+            if max_tokens > 0 and stop > batch_end:
+                num_tokens = running_max * sizes_from_start[
+                    batch_end - batch_start : stop - batch_start
+                ]
+                # num_tokens only grows with the position
+                if num_tokens[-1] > max_tokens:
+                    overflow_pos = batch_end + int(
+                        num_tokens.searchsorted(max_tokens, side="right")
+                    )
+                    break
+            if stop == indices_len:
+                break
+            if max_sentences > 0 and stop - batch_start >= max_sentences:
+                overflow_pos = stop
+                break
+            window *= 2
+
+        # Sentences [batch_end, pos) join the batch if its size then is valid
+        pos = indices_len if overflow_pos < 0 else overflow_pos
+        valid_size = _last_valid_size(
+            pos - batch_start, batch_end + 1 - batch_start, bsz_mult
+        )
+        if valid_size > 0:
+            new_batch_end = batch_start + valid_size
+            batch_max_tokens = int(running_max[new_batch_end - 1 - batch_end])
+            batch_end = new_batch_end
+
+        if overflow_pos < 0:
+            if batch_end != indices_len:
+                batches_ends.append(batch_end)
+            break
+
+        # The batch is complete; the tail [batch_end, pos] starts the next one,
+        # unless it overflows max_tokens itself, in which case it is a batch
+        # without pos.
+        batches_ends.append(batch_end)
+        tail_max_tokens = int(num_tokens_vec[batch_end : pos + 1].max())
+        if tail_max_tokens * (pos + 1 - batch_end) > max_tokens > 0:
+            batches_ends.append(pos)
+            batch_start = pos
+            batch_max_tokens = int(num_tokens_vec[pos])
+        else:
+            batch_start = batch_end
+            batch_max_tokens = tail_max_tokens
+        batch_end = pos + 1
+        window = max(window // 2, bsz_mult, 64)
+
+    return np.split(indices, np.array(batches_ends, dtype=np.int32))
+
+
+def batch_by_size_fn(indices, num_tokens_fn, max_tokens, max_sentences, bsz_mult):
+    num_tokens_vec = np.fromiter(
+        (num_tokens_fn(idx) for idx in indices.tolist()),
+        dtype=np.int64,
+        count=len(indices),
+    )
+    return batch_by_size_vec(
+        indices, num_tokens_vec, max_tokens, max_sentences, bsz_mult
+    )
+
+
+def _find_valid_shape(shapes, num_sentences, num_tokens):
+    """Return index of first valid shape of -1 if none is found."""
+    for i, (shape_sentences, shape_tokens) in enumerate(shapes):
+        if num_sentences <= shape_sentences and num_tokens <= shape_tokens:
+            return i
+    return -1
+
+
+def batch_fixed_shapes_fast(indices, num_tokens_fn, fixed_shapes_sorted):
+    fixed_shapes_sorted = fixed_shapes_sorted.tolist()
+    sample_len = 0
+    batch = []
+    batches = []
+    shapes = fixed_shapes_sorted
+    for idx in indices.tolist():
+        num_tokens = num_tokens_fn(idx)
+        sample_len = max(sample_len, num_tokens)
+
+        shape_idx = _find_valid_shape(shapes, len(batch) + 1, sample_len)
+        if shape_idx == -1:
+            batches.append(batch)
+            batch = []
+            sample_len = 0
+            shapes = fixed_shapes_sorted
+        elif shape_idx > 0:
+            # small optimization for the next call to _find_valid_shape
+            shapes = shapes[shape_idx:]
+
+        batch.append(idx)
+
+    if len(batch) > 0:
+        batches.append(batch)
+
+    return batches
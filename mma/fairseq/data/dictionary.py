@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import itertools
 import os
 from collections import Counter
 from multiprocessing import Pool
@@ -334,18 +335,89 @@ class Dictionary:
         eos_word,
         start_offset,
         end_offset,
+        max_types=None,
+        chunk_size=10000,
     ):
+        """Count the words of the lines of *filename* between *start_offset*
+        and *end_offset*, *chunk_size* lines at a time.
+
+        Returns a ``(counter, floor)`` pair. The counts are exact, with a
+        *floor* of 0, unless *max_types* bounds the number of words kept:
+        the counter is then a space-saving summary of at most
+        ``2 * max_types`` words, whose counts exceed the true ones by at most
+        *floor* (see :func:`_prune_counts`)."""
+        if tokenize is tokenize_line:
+            # str.split() splits on the same whitespace as tokenize_line
+            tokenize = str.split
         counter = Counter()
+        floor = 0
         with Chunker(filename, start_offset, end_offset) as line_iterator:
-            for line in line_iterator:
-                for word in tokenize(line):
-                    counter.update([word])
-                counter.update([eos_word])
-        return counter
+            line_iterator = iter(line_iterator)
+            while True:
+                lines = list(itertools.islice(line_iterator, chunk_size))
+                if len(lines) == 0:
+                    break
+                words = itertools.chain.from_iterable(map(tokenize, lines))
+                if max_types is None:
+                    counter.update(words)
+                    counter[eos_word] += len(lines)
+                    continue
+                chunk = Counter(words)
+                chunk[eos_word] += len(lines)
+                counter, floor = Dictionary._merge_counts(
+                    (counter, floor), (chunk, 0), max_types
+                )
+        return counter, floor
+
+    @staticmethod
+    def _prune_counts(counter, floor, max_types):
+        """Keep the *max_types* most frequent words of *counter* once it holds
+        twice as many. A dropped word which occurs again is counted from the
+        largest dropped count, the new *floor*, so that the counts never
+        underestimate the true ones (space-saving): every word more frequent
+        than the floor is kept."""
+        if len(counter) <= 2 * max_types:
+            return counter, floor
+        kept = counter.most_common(max_types + 1)
+        floor = max(floor, kept.pop()[1])
+        return Counter(dict(kept)), floor
+
+    @staticmethod
+    def _merge_counts(counts, other_counts, max_types=None):
+        """Merge two ``(counter, floor)`` pairs of
+        :func:`_add_file_to_dictionary_single_worker`. A word missing from
+        a bounded counter may have been dropped from it, with a count of up
+        to its floor."""
+        (counter, floor), (other, other_floor) = counts, other_counts
+        if len(counter) < len(other):
+            (counter, floor), (other, other_floor) = other_counts, counts
+        if floor == other_floor == 0:
+            counter.update(other)
+        else:
+            for word, count in other.items():
+                counter[word] = counter.get(word, floor) + count
+            if other_floor > 0:
+                for word in counter.keys() - other.keys():
+                    counter[word] += other_floor
+        floor += other_floor
+        if max_types is not None:
+            counter, floor = Dictionary._prune_counts(counter, floor, max_types)
+        return counter, floor
 
     @staticmethod
-    def add_file_to_dictionary(filename, dict, tokenize, num_workers):
-        def merge_result(counter):
+    def add_file_to_dictionary(filename, dict, tokenize, num_workers, max_types=None):
+        """Add the words of *filename* to *dict* with their counts, split
+        across *num_workers* processes whose counts are merged in the
+        parent process.
+
+        With *max_types*, the workers keep bounded space-saving counts of at
+        most ``2 * max_types`` words instead of exact ones: the counts may be
+        overestimated, by up to the counts of the words dropped along the
+        way, but no word more frequent than those is missed. This bounds the
+        memory when the dictionary is thresholded anyway."""
+
+        def merge_result(counts):
+            counter, _ = counts
             for w, c in sorted(counter.items()):
                 dict.add_symbol(w, c)
 
@@ -354,28 +426,37 @@ class Dictionary:
         if num_workers > 1:
             chunks = zip(offsets, offsets[1:])
             pool = Pool(processes=num_workers)
-            results = []
-            for (start_offset, end_offset) in chunks:
-                results.append(
-                    pool.apply_async(
-                        Dictionary._add_file_to_dictionary_single_worker,
-                        (
-                            local_file,
-                            tokenize,
-                            dict.eos_word,
-                            start_offset,
-                            end_offset,
-                        ),
+            results = pool.starmap(
+                Dictionary._add_file_to_dictionary_single_worker,
+                [
+                    (
+                        local_file,
+                        tokenize,
+                        dict.eos_word,
+                        start_offset,
+                        end_offset,
+                        max_types,
                     )
-                )
+                    for (start_offset, end_offset) in chunks
+                ],
+            )
             pool.close()
             pool.join()
-            for r in results:
-                merge_result(r.get())
+            # merge in the parent: one update per worker, without sending
+            # the counters back through the pool
+            counts = results[0]
+            for other_counts in results[1:]:
+                counts = Dictionary._merge_counts(counts, other_counts, max_types)
+            merge_result(counts)
         else:
             merge_result(
                 Dictionary._add_file_to_dictionary_single_worker(
-                    local_file, tokenize, dict.eos_word, offsets[0], offsets[1]
+                    local_file,
+                    tokenize,
+                    dict.eos_word,
+                    offsets[0],
+                    offsets[1],
+                    max_types,
                 )
             )
 
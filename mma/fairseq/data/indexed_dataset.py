@@ -3,6 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
+import os
 import shutil
 import struct
 from functools import lru_cache
@@ -396,13 +397,11 @@ class MMapIndexedDataset(torch.utils.data.Dataset):
                 @staticmethod
                 def _get_pointers(sizes):
                     dtype_size = dtype().itemsize
-                    address = 0
-                    pointers = []
-
-                    for size in sizes:
-                        pointers.append(address)
-                        address += size * dtype_size
-
+                    pointers = np.zeros(len(sizes), dtype=np.int64)
+                    np.cumsum(
+                        np.asarray(sizes[:-1], dtype=np.int64) * dtype_size,
+                        out=pointers[1:],
+                    )
                     return pointers
 
                 def write(self, sizes):
@@ -466,6 +465,10 @@ class MMapIndexedDataset(torch.utils.data.Dataset):
         def sizes(self):
             return self._sizes
 
+        @property
+        def pointers(self):
+            return self._pointers
+
         @lru_cache(maxsize=8)
         def __getitem__(self, i):
             return self._pointers[i], self._sizes[i]
@@ -517,6 +520,27 @@ class MMapIndexedDataset(torch.utils.data.Dataset):
 
         return torch.from_numpy(np_array)
 
+    def get_padded_batch(self, indices, pad_idx, left_pad=False, pad_to_length=None):
+        """Return the items at *indices* as a single LongTensor of shape
+        ``(len(indices), max(max_size, pad_to_length))``, padded with
+        *pad_idx*. The tokens of all the items are read with one gather
+        through the pointers of the index."""
+        indices = np.asarray(indices, dtype=np.int64)
+        sizes = self._index.sizes[indices].astype(np.int64)
+        starts = self._index.pointers[indices] // self._index.dtype().itemsize
+        width = int(sizes.max()) if len(sizes) > 0 else 0
+        if pad_to_length is not None:
+            width = max(width, pad_to_length)
+
+        columns = np.arange(width, dtype=np.int64)[None, :]
+        if left_pad:
+            columns = columns - (width - sizes)[:, None]
+        mask = (columns >= 0) & (columns < sizes[:, None])
+        positions = np.where(mask, starts[:, None] + columns, 0)
+        tokens = np.frombuffer(self._bin_buffer, dtype=self._index.dtype)
+        batch = np.where(mask, tokens[positions], pad_idx).astype(np.int64)
+        return torch.from_numpy(batch)
+
     @property
     def sizes(self):
         return self._index.sizes
@@ -551,13 +575,53 @@ class MMapIndexedDatasetBuilder:
         self._data_file = open(out_file, "wb")
         self._dtype = dtype
         self._sizes = []
+        # number of elements of the shards reserved and not merged yet
+        self._reserved = []
+
+    @property
+    def dtype(self):
+        return self._dtype
 
     def add_item(self, tensor):
+        assert len(self._reserved) == 0, "merge the reserved shards first"
         np_array = np.array(tensor.numpy(), dtype=self._dtype)
         self._data_file.write(np_array.tobytes(order="C"))
         self._sizes.append(np_array.size)
 
+    def add_items(self, array, sizes):
+        """Add the items laid out one after the other in a flat *array*,
+        of the given *sizes*, with a single write"""
+        assert len(self._reserved) == 0, "merge the reserved shards first"
+        np_array = np.asarray(array).astype(self._dtype, copy=False)
+        self._data_file.write(np_array.tobytes(order="C"))
+        self._sizes.extend(np.asarray(sizes).tolist())
+
+    def reserve_shard_(self, num_elements):
+        """Extend the data file by *num_elements* elements, to be written
+        in place by a :class:`MMapIndexedDatasetShardBuilder` (possibly in
+        another process), and return the offset of the shard in elements.
+        The shards are merged into the index with :func:`merge_shard_`, in
+        the order of their reservation."""
+        offset = self._data_file.seek(0, os.SEEK_END) // self._dtype().itemsize
+        self._data_file.truncate((offset + num_elements) * self._dtype().itemsize)
+        self._data_file.seek(0, os.SEEK_END)
+        self._reserved.append(num_elements)
+        return offset
+
+    def merge_shard_(self, sizes):
+        """Add the items of the first reserved shard not merged yet to the
+        index, given their *sizes*: the data is already in place."""
+        num_elements = self._reserved.pop(0)
+        sizes = np.asarray(sizes, dtype=np.int64)
+        assert sizes.sum() == num_elements, (
+            "the shard holds {} elements, {} were reserved".format(
+                sizes.sum(), num_elements
+            )
+        )
+        self._sizes.extend(sizes.tolist())
+
     def merge_file_(self, another_file):
+        assert len(self._reserved) == 0, "merge the reserved shards first"
         # Concatenate index
         index = MMapIndexedDataset.Index(index_file_path(another_file))
         assert index.dtype == self._dtype
@@ -570,7 +634,55 @@ class MMapIndexedDatasetBuilder:
             shutil.copyfileobj(f, self._data_file)
 
     def finalize(self, index_file):
+        assert len(self._reserved) == 0, "merge the reserved shards first"
         self._data_file.close()
 
         with MMapIndexedDataset.Index.writer(index_file, self._dtype) as index:
             index.write(self._sizes)
+
+
+class MMapIndexedDatasetShardBuilder:
+    """Writes items in place into a shard of the data file of a
+    :class:`MMapIndexedDatasetBuilder`, reserved with
+    :func:`MMapIndexedDatasetBuilder.reserve_shard_` at element *offset*
+    for *num_elements* elements, through a memory map. :func:`finalize`
+    returns the sizes of the items, for
+    :func:`MMapIndexedDatasetBuilder.merge_shard_`."""
+
+    def __init__(self, out_file, dtype, offset, num_elements):
+        self._dtype = dtype
+        self._buffer = None
+        if num_elements > 0:
+            self._buffer = np.memmap(
+                out_file,
+                dtype=dtype,
+                mode="r+",
+                offset=offset * dtype().itemsize,
+                shape=(num_elements,),
+            )
+        self._num_elements = num_elements
+        self._position = 0
+        self._sizes = []
+
+    def add_items(self, array, sizes):
+        array = np.asarray(array)
+        end = self._position + len(array)
+        assert end <= self._num_elements, "the items overflow the shard"
+        self._buffer[self._position : end] = array
+        self._position = end
+        self._sizes.extend(np.asarray(sizes).tolist())
+
+    def add_item(self, tensor):
+        np_array = tensor.numpy()
+        self.add_items(np_array, [np_array.size])
+
+    def finalize(self):
+        assert self._position == self._num_elements, (
+            "{} of the {} elements of the shard were written".format(
+                self._position, self._num_elements
+            )
+        )
+        if self._buffer is not None:
+            self._buffer.flush()
+            del self._buffer
+        return np.array(self._sizes, dtype=np.int64)
@@ -8,6 +8,7 @@ import logging
 import numpy as np
 import torch
 from fairseq.data import FairseqDataset, data_utils
+from fairseq.data.indexed_dataset import MMapIndexedDataset
 
 
 logger = logging.getLogger(__name__)
@@ -341,6 +342,28 @@ class LanguagePairDataset(FairseqDataset):
     def __len__(self):
         return len(self.src)
 
+    @property
+    def supports_fetch_batch(self):
+        """Whether batches can be read straight from the memory-mapped source
+        and target, which holds when the items are not modified on access."""
+        return (
+            isinstance(self.src, MMapIndexedDataset)
+            and (self.tgt is None or isinstance(self.tgt, MMapIndexedDataset))
+            and not self.append_eos_to_target
+            and not self.append_bos
+            and not self.remove_eos_from_source
+            and self.align_dataset is None
+            and self.constraints is None
+        )
+
+    def __getitems__(self, indices):
+        """Batched fetch of torch.utils.data.DataLoader. When
+        :attr:`supports_fetch_batch`, the samples only hold their id, and
+        :func:`collater` reads the batch from the storage in bulk."""
+        if not self.supports_fetch_batch:
+            return [self[index] for index in indices]
+        return [{"id": index} for index in indices]
+
     def collater(self, samples, pad_to_length=None):
         """Merge a list of samples to form a mini-batch.
 
@@ -377,16 +400,19 @@ class LanguagePairDataset(FairseqDataset):
                 - `tgt_lang_id` (LongTensor): a long Tensor which contains target language
                    IDs of each sample in the batch
         """
-        res = collate(
-            samples,
-            pad_idx=self.src_dict.pad(),
-            eos_idx=self.eos,
-            left_pad_source=self.left_pad_source,
-            left_pad_target=self.left_pad_target,
-            input_feeding=self.input_feeding,
-            pad_to_length=pad_to_length,
-            pad_to_multiple=self.pad_to_multiple,
-        )
+        if len(samples) > 0 and "source" not in samples[0]:
+            res = self.fetch_batch([s["id"] for s in samples], pad_to_length)
+        else:
+            res = collate(
+                samples,
+                pad_idx=self.src_dict.pad(),
+                eos_idx=self.eos,
+                left_pad_source=self.left_pad_source,
+                left_pad_target=self.left_pad_target,
+                input_feeding=self.input_feeding,
+                pad_to_length=pad_to_length,
+                pad_to_multiple=self.pad_to_multiple,
+            )
         if self.src_lang_id is not None or self.tgt_lang_id is not None:
             src_tokens = res["net_input"]["src_tokens"]
             bsz = src_tokens.size(0)
@@ -400,6 +426,77 @@ class LanguagePairDataset(FairseqDataset):
                 )
         return res
 
+    def _padded_length(self, sizes, pad_to_length):
+        size = int(sizes.max())
+        size = size if pad_to_length is None else max(size, pad_to_length)
+        if self.pad_to_multiple != 1 and size % self.pad_to_multiple != 0:
+            size = int(
+                ((size - 0.1) // self.pad_to_multiple + 1) * self.pad_to_multiple
+            )
+        return size
+
+    def fetch_batch(self, indices, pad_to_length=None):
+        """Read the mini-batch of the samples at *indices* straight from the
+        memory-mapped source and target (see :attr:`supports_fetch_batch`),
+        with one gather per side instead of a tensor per sample. Returns the
+        same batch as :func:`collater` on these samples, without the
+        alignments and constraints."""
+        assert self.supports_fetch_batch
+        pad_idx = self.src_dict.pad()
+        # sort by descending source length
+        src_lengths, sort_order = torch.LongTensor(
+            self.src_sizes[indices].astype(np.int64)
+        ).sort(descending=True)
+        indices = np.asarray(indices, dtype=np.int64)[sort_order.numpy()]
+        src_tokens = self.src.get_padded_batch(
+            indices,
+            pad_idx,
+            left_pad=self.left_pad_source,
+            pad_to_length=self._padded_length(
+                self.src_sizes[indices],
+                pad_to_length["source"] if pad_to_length is not None else None,
+            ),
+        )
+        batch = {
+            "id": torch.from_numpy(indices),
+            "nsentences": len(indices),
+            "ntokens": src_lengths.sum().item(),
+            "net_input": {
+                "src_tokens": src_tokens,
+                "src_lengths": src_lengths,
+            },
+            "target": None,
+        }
+        if self.tgt is None:
+            return batch
+
+        tgt_sizes = torch.from_numpy(self.tgt_sizes[indices].astype(np.int64))
+        target = self.tgt.get_padded_batch(
+            indices,
+            pad_idx,
+            left_pad=self.left_pad_target,
+            pad_to_length=self._padded_length(
+                self.tgt_sizes[indices],
+                pad_to_length["target"] if pad_to_length is not None else None,
+            ),
+        )
+        batch["target"] = target
+        batch["ntokens"] = tgt_sizes.sum().item()
+        if self.input_feeding:
+            # shift the targets right by one position, with eos first
+            if self.left_pad_target:
+                first = target.size(1) - tgt_sizes
+            else:
+                first = torch.zeros_like(tgt_sizes)
+            columns = torch.arange(target.size(1)).unsqueeze(0)
+            padding = (columns < first.unsqueeze(1)) | (
+                columns >= (first + tgt_sizes).unsqueeze(1)
+            )
+            prev_output_tokens = target.roll(1, dims=1).masked_fill_(padding, pad_idx)
+            prev_output_tokens[torch.arange(len(indices)), first] = self.eos
+            batch["net_input"]["prev_output_tokens"] = prev_output_tokens
+        return batch
+
     def num_tokens(self, index):
         """Return the number of tokens in a sample. This value is used to
         enforce ``--max-tokens`` during batching."""
@@ -416,6 +513,35 @@ class LanguagePairDataset(FairseqDataset):
             sizes = np.maximum(sizes, self.tgt_sizes[indices])
         return sizes
 
+    def batch_by_area(
+        self,
+        indices,
+        max_token_area,
+        max_sentences=None,
+        required_batch_size_multiple=1,
+    ):
+        """
+        Given a set of indices, return batches of at most *max_token_area*
+        padded source by target cells, the batch size times the longest
+        source and the longest target, instead of a number of tokens: the
+        attention tensors grow with this area. The target length is the
+        reference length if there is a target, else the source length.
+
+        The indices are sorted by :func:`num_tokens` (the longer of the
+        source and target) first, which bounds both lengths of a batch.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        num_tokens = self.num_tokens_vec(indices).astype(np.int64)
+        order = np.argsort(num_tokens, kind="mergesort")
+        return data_utils.batch_by_size(
+            indices[order],
+            num_tokens_fn=self.num_tokens,
+            num_tokens_vec=num_tokens[order] ** 2,
+            max_tokens=max_token_area,
+            max_sentences=max_sentences,
+            required_batch_size_multiple=required_batch_size_multiple,
+        )
+
     def size(self, index):
         """Return an example's size as a float or tuple. This value is used when
         filtering a dataset with ``--max-positions``."""
@@ -5,7 +5,7 @@
 
 import numpy as np
 import torch
-from fairseq.data import FairseqDataset, plasma_utils
+from fairseq.data import FairseqDataset, data_utils, plasma_utils
 from fairseq.data.indexed_dataset import best_fitting_int_dtype
 from typing import Tuple
 
@@ -91,10 +91,11 @@ class TokenBlockDataset(FairseqDataset):
                 _get_slice_indices_fast,
                 _get_block_to_dataset_index_fast,
             )
-        except ImportError:
-            raise ImportError(
-                "Please build Cython components with: `pip install --editable .` "
-                "or `python setup.py build_ext --inplace`"
+        except (ImportError, ValueError):
+            data_utils.warn_cython_fallback("token_block_utils_fast")
+            from fairseq.data.token_block_utils_numpy import (
+                _get_slice_indices_fast,
+                _get_block_to_dataset_index_fast,
             )
 
         if isinstance(sizes, list):
@@ -0,0 +1,99 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""
+NumPy implementations of the functions of token_block_utils_fast, used when
+the Cython extensions are not built for the running interpreter. They
+return the same arrays as token_block_utils_fast.
+"""
+
+import math
+
+import numpy as np
+
+DTYPE = np.int64
+
+
+def _get_slice_indices_none_mode(sizes, block_size):
+    total_size = int(sizes.sum())
+    length = math.ceil(total_size / block_size)
+    starts = np.arange(length, dtype=DTYPE) * block_size
+    return np.stack([starts, np.minimum(starts + block_size, total_size)], axis=1)
+
+
+def _get_slice_indices_complete(sizes, block_size, document_sep_len=None):
+    """Blocks of whole sentences of at most *block_size* tokens (or a single
+    longer sentence). With a *document_sep_len*, the sentences of that size
+    end a document: blocks do not cross them, and blocks of less than two
+    tokens are dropped."""
+    num_sizes = len(sizes)
+    offsets = np.zeros(num_sizes + 1, dtype=DTYPE)
+    np.cumsum(sizes, out=offsets[1:])
+    # The block starting at a sentence ends at the last sentence that fits,
+    # or at the first non-empty one if that does not fit.
+    block_ends = np.maximum(
+        np.searchsorted(offsets, offsets[:-1] + block_size, side="right") - 1,
+        np.minimum(np.searchsorted(offsets, offsets[:-1], side="right"), num_sizes),
+    )
+    if document_sep_len is not None:
+        is_sep = sizes == document_sep_len
+        # index of the next document separator, from every sentence
+        sep_positions = np.append(np.flatnonzero(is_sep), num_sizes)
+        next_sep = sep_positions[np.searchsorted(sep_positions, np.arange(num_sizes))]
+        block_ends = np.minimum(block_ends, next_sep)
+        is_sep = is_sep.tolist()
+    min_size = 1 if document_sep_len is None else 2
+
+    block_ends = block_ends.tolist()
+    starts = []
+    i = 0
+    while i < num_sizes:
+        if document_sep_len is not None and is_sep[i]:
+            i += 1
+            continue
+        starts.append(i)
+        i = block_ends[i]
+    starts = np.array(starts, dtype=DTYPE)
+    ends = np.array(block_ends, dtype=DTYPE)[starts]
+    slice_indices = np.stack([offsets[starts], offsets[ends]], axis=1)
+    return slice_indices[slice_indices[:, 1] - slice_indices[:, 0] >= min_size]
+
+
+def _get_slice_indices_fast(sizes, break_mode, block_size, document_sep_len):
+    if break_mode is None or break_mode == "none":
+        slice_indices = _get_slice_indices_none_mode(sizes, block_size)
+    elif break_mode == "complete":
+        slice_indices = _get_slice_indices_complete(sizes, block_size)
+    elif break_mode == "complete_doc":
+        slice_indices = _get_slice_indices_complete(
+            sizes, block_size, document_sep_len
+        )
+    elif break_mode == "eos":
+        slice_indices = np.zeros((len(sizes), 2), dtype=DTYPE)
+        cumsum = sizes.cumsum(axis=0)
+        slice_indices[1:, 0] = cumsum[: cumsum.shape[0] - 1]
+        slice_indices[:, 1] = cumsum
+    else:
+        raise ValueError("Invalid break_mode: " + break_mode)
+    return slice_indices
+
+
+def _seek(offsets, positions):
+    """Index in the dataset and offset within it of "flat" token positions.
+    A position at the start of a sentence maps to the first sentence that
+    starts there, empty or not."""
+    index = np.searchsorted(offsets, positions, side="left")
+    at_start = offsets[np.minimum(index, len(offsets) - 1)] == positions
+    index = np.where(at_start, index, index - 1)
+    return index, positions - offsets[index]
+
+
+def _get_block_to_dataset_index_fast(sizes, slice_indices):
+    offsets = np.zeros(len(sizes) + 1, dtype=DTYPE)
+    np.cumsum(sizes, out=offsets[1:])
+    starts, ends = slice_indices[:, 0], slice_indices[:, 1]
+    start_ds_idx, start_offset = _seek(offsets, starts)
+    end_ds_idx, _ = _seek(offsets, np.maximum(ends - 1, starts))
+    end_ds_idx = np.where(ends <= starts, start_ds_idx, end_ds_idx)
+    return np.stack([start_ds_idx, start_offset, end_ds_idx], axis=1).astype(DTYPE)
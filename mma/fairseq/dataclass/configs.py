@@ -451,6 +451,13 @@ class DatasetConfig(FairseqDataclass):
     data_buffer_size: int = field(
         default=10, metadata={"help": "Number of batches to preload"}
     )
+    batch_plan_cache_dir: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "cache the batches of the datasets in this directory, and load "
+            "them in the next runs with the same data and batching options"
+        },
+    )
     train_subset: str = field(
         default="train",
         metadata={"help": "data subset to use for training (e.g. train, valid, test)"},
@@ -865,7 +872,10 @@ class GenerationConfig(FairseqDataclass):
     )
     lm_weight: float = field(
         default=0.0,
-        metadata={"help": "weight for lm probs for lm fusion"},
+        metadata={
+            "help": "weight for lm probs for lm fusion, with the model trained with "
+            "--add-language-model providing the lm if --lm-path is not set"
+        },
     )
 
     # arguments for iterative refinement generator
@@ -923,6 +933,35 @@ class GenerationConfig(FairseqDataclass):
         default=False,
         metadata={"help": "if set, dont use seed for initializing random generators"},
     )
+    cpu_threads: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "number of intra-op threads when generating on CPU "
+            "(default: torch's default)"
+        },
+    )
+    max_token_area: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "batch by padded area (batch size x source length x target "
+            "length, the reference length if any) with at most this many "
+            "cells per batch, and print the outputs in the order of the dataset"
+        },
+    )
+    compact_threshold: float = field(
+        default=0.0,
+        metadata={
+            "help": "remove the finished sentences from the batch only once they "
+            "are at least this fraction of it (0 removes them as they finish)"
+        },
+    )
+    quantize_dynamic: bool = field(
+        default=False,
+        metadata={
+            "help": "quantize the linear layers of the model(s) to int8 with "
+            "dynamic quantization, for generation on CPU"
+        },
+    )
 
 
 @dataclass
@@ -296,6 +296,7 @@ class TransformerModel(FairseqEncoderDecoderModel):
         # auxuliary LM for adaptive training
         lm_decoder = None
         if args.add_language_model:
+            lm_decoder_softmax_weight = None
             if args.share_transformer_lm_decoder_embed:
                 lm_decoder_embed_tokens = decoder_embed_tokens
                 lm_decoder_softmax_weight = nn.Linear(
@@ -326,14 +327,19 @@ class TransformerModel(FairseqEncoderDecoderModel):
                     bias=False,
                 )
                 lm_decoder_softmax_weight.weight = lm_decoder_embed_tokens.weight
-            
-            lm_decoder = TransformerOriginalDecoder(
-                                            args,
-                                            tgt_dict,
-                                            lm_decoder_embed_tokens,
-                                            no_encoder_attn=True,
-                                            output_projection=lm_decoder_softmax_weight
-                                            )
+
+            else:
+                lm_decoder_embed_tokens = cls.build_embedding(
+                    args, tgt_dict, args.decoder_embed_dim, args.decoder_embed_path
+                )
+
+            lm_decoder = TransformerDecoder(
+                args,
+                tgt_dict,
+                lm_decoder_embed_tokens,
+                no_encoder_attn=True,
+                output_projection=lm_decoder_softmax_weight,
+            )
 
         return cls(args, encoder, decoder, back_encoder, back_decoder, lm_decoder)
 
@@ -394,17 +400,18 @@ class TransformerModel(FairseqEncoderDecoderModel):
             return_all_hiddens=return_all_hiddens,
         )
 
-        back_data = process_back_data(src_tokens, src_lengths, prev_output_tokens)
-
+        back_data = None
         back_decoder_out = []
         dual_path_dist = None
 
         # dual is True by default
-        # if dual is False, this will be a single model
+        # if dual is False, this will be a single model and none of the
+        # backward data is built
         if dual:
             assert self.back_encoder is not None and self.back_decoder is not None, \
             "Trying to compute backward_model loss but Backward Enc/Dec is None."
 
+            back_data = process_back_data(src_tokens, src_lengths, prev_output_tokens)
             back_encoder_out = self.back_encoder(
                 back_data["src_tokens"],
                 src_lengths=back_data["src_lengths"],
@@ -977,6 +984,7 @@ class TransformerDecoder(FairseqIncrementalDecoder):
         full_context_alignment: bool = False,
         alignment_layer: Optional[int] = None,
         alignment_heads: Optional[int] = None,
+        pre_alpha=None,  # unused
     ):
         return self.extract_features_scriptable(
             prev_output_tokens,
@@ -1,52 +1,54 @@
 import torch
+from fairseq.utils import buffered_arange
 
 # Core code for ACL 2022 paper "Modeling Dual Read/Write Paths for Simultaneous Machine Translation"
 
 
+@torch.no_grad()
 def generate_dual_path(alpha):
-    # Generate Dual Path (GDP fuction)
+    """
+    Generate Dual Path (GDP function).
+
+    Given the alignment *alpha* of shape `(bsz, tgt_len, src_len)`, return
+    the one-hot read/write path of the opposite direction, of shape
+    `(bsz, src_len, tgt_len)`. The path only serves as a target, so no
+    gradient flows through it.
+
+    The path is computed from the argmax index of each row of *alpha*,
+    without building `(bsz, tgt_len, src_len)` segment masks:
+      - target step t covers the source segment [min_idx[t], max_idx[t]]
+      - source step s is covered by cover[s] target steps, the first of
+        which is first[s]
+      - source step s then reads first[s] + cover[s] target steps,
+        or a single one if no target step covers it
+      - the path is kept monotonic with a running max over source steps
+    """
     bsz, tgt_len, src_len = alpha.size()
 
     # Segment
-    max_idx = alpha.max(dim=-1, keepdim=True)[1]
-    inn = torch.cat(
-        (
-            torch.full((max_idx.size(0), 1, max_idx.size(2)), -1, device=alpha.device),
-            max_idx[:, :-1, :],
-        ),
-        dim=1,
-    )
-    min_idx = (max_idx > inn).int()
-    inn += 1
-    min_idx = min_idx * inn
-    min_idx = torch.cummax(min_idx, dim=1)[0]
-    tmp = (
-        torch.arange(0, src_len, device=alpha.device)
-        .unsqueeze(0)
-        .unsqueeze(0)
-        .repeat(bsz, tgt_len, 1)
-    )
-    mask1 = (tmp <= max_idx).int()
-    mask2 = (tmp >= min_idx).int()
-    mask = mask1 * mask2
+    max_idx = alpha.max(dim=-1)[1]
+    prev_idx = torch.cat((max_idx.new_full((bsz, 1), -1), max_idx[:, :-1]), dim=1)
+    min_idx = ((max_idx > prev_idx).long() * (prev_idx + 1)).cummax(dim=1)[0]
+    not_empty = (min_idx <= max_idx).long()
 
-    # Transpose
-    mask = mask.transpose(1, 2)
+    # Number of segments covering each source step
+    cover = max_idx.new_zeros(bsz, src_len + 1)
+    cover.scatter_add_(1, min_idx.clamp(max=src_len), not_empty)
+    cover.scatter_add_(1, max_idx + 1, -not_empty)
+    cover = cover[:, :-1].cumsum(dim=1)
 
-    # Merge
-    tmp = (
-        torch.arange(0, tgt_len, device=alpha.device)
-        .unsqueeze(0)
-        .unsqueeze(0)
-        .repeat(bsz, src_len, 1)
+    # First segment covering each source step. The segment starts are
+    # sorted, so it is the first segment ending at or after the step
+    src_steps = buffered_arange(src_len, alpha.device).unsqueeze(0).expand(bsz, -1)
+    first = torch.searchsorted(
+        max_idx.cummax(dim=1)[0].contiguous(), src_steps.contiguous()
     )
-    mask = (tmp <= mask.max(dim=-1, keepdim=True)[1]).int() + mask
-    mask = mask.bool().int()
-    # Ensure the read/write path is monotonic and valid
-    src_lens = mask.sum(dim=2, keepdim=True)
+
+    # Merge
+    src_lens = torch.where(cover > 0, first + cover, torch.ones_like(cover))
     src_lens = torch.cummax(src_lens, dim=1)[0]
-    dual_path = (tmp == src_lens - 1).int()
-    dual_path = dual_path / dual_path.sum(dim=-1, keepdim=True)
+    dual_path = torch.zeros(bsz, src_len, tgt_len, device=alpha.device)
+    dual_path.scatter_(2, (src_lens - 1).unsqueeze(2), 1.0)
 
     return dual_path
 
@@ -55,11 +57,12 @@ def process_back_data(src_tokens, src_lengths, prev_output_tokens):
     # prepare the data for the target-to-source SiMT
     back_data = {}
     bsz = src_tokens.size(0)
+    device = src_tokens.device
     src_padding_num = (prev_output_tokens == 1).sum(dim=1)
     tgt_padding_num = (src_tokens == 1).sum(dim=1)
 
     src_tmp = (
-        torch.arange(0, prev_output_tokens.size(1), device="cuda")
+        buffered_arange(prev_output_tokens.size(1), device)
         .unsqueeze(0)
         .repeat(bsz, 1)
     )
@@ -68,7 +71,7 @@ def process_back_data(src_tokens, src_lengths, prev_output_tokens):
     ).type_as(src_tokens)
 
     tgt_tmp = (
-        torch.arange(0, src_tokens.size(1), device="cuda").unsqueeze(0).repeat(bsz, 1)
+        buffered_arange(src_tokens.size(1), device).unsqueeze(0).repeat(bsz, 1)
     )
     tgt_tmp = (tgt_tmp == tgt_padding_num.unsqueeze(1)).type_as(src_tokens)
 
@@ -77,18 +80,18 @@ def process_back_data(src_tokens, src_lengths, prev_output_tokens):
         torch.cat(
             (
                 prev_output_tokens[:, 1:],
-                torch.ones((bsz, 1), device="cuda", dtype=torch.long),
+                torch.ones((bsz, 1), device=device, dtype=torch.long),
             ),
             dim=1,
         )
-        + torch.ones(prev_output_tokens.size(), device="cuda", dtype=torch.long)
+        + torch.ones(prev_output_tokens.size(), device=device, dtype=torch.long)
         * src_tmp
     )
 
     _src_tokens = src_tokens[:, :-1].contiguous()
     _src_tokens[_src_tokens == 2] = 1
     back_data["prev_output_tokens"] = torch.cat(
-        (torch.full((bsz, 1), 2, device="cuda", dtype=torch.long), _src_tokens),
+        (torch.full((bsz, 1), 2, device=device, dtype=torch.long), _src_tokens),
         dim=1,
     )
 
@@ -169,6 +169,8 @@ class MultiheadAttention(nn.Module):
             # A workaround for quantization to work. Otherwise JIT compilation
             # treats bias in linear module as method.
             and not torch.jit.is_scripting()
+            # The weights of dynamically quantized projections are packed
+            and isinstance(self.q_proj, nn.Linear)
         ):
             assert key is not None and value is not None
             return F.multi_head_attention_forward(
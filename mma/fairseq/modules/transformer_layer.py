@@ -109,6 +109,7 @@ class TransformerEncoderLayer(nn.Module):
         x,
         encoder_padding_mask: Optional[Tensor],
         attn_mask: Optional[Tensor] = None,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None,
     ):
         """
         Args:
@@ -121,10 +122,29 @@ class TransformerEncoderLayer(nn.Module):
                 `attn_mask[tgt_i, src_j] = 1` means that when calculating the
                 embedding for `tgt_i`, we exclude (mask out) `src_j`. This is
                 useful for strided self-attention.
+            incremental_state (dict, optional): cache of the self attention
+                keys and values, for encoders reading their input
+                incrementally: *x* then only holds the new positions, and
+                `src_len` also counts the cached ones.
 
         Returns:
             encoded output of shape `(seq_len, batch, embed_dim)`
         """
+        return self.forward_scriptable(
+            x, encoder_padding_mask, attn_mask, incremental_state
+        )
+
+    # TorchScript doesn't support super() method so that the scriptable Subclass
+    # can't access the base class model in Torchscript.
+    # Current workaround is to add a helper function with different name and
+    # call the helper function from scriptable Subclass.
+    def forward_scriptable(
+        self,
+        x,
+        encoder_padding_mask: Optional[Tensor],
+        attn_mask: Optional[Tensor] = None,
+        incremental_state: Optional[Dict[str, Dict[str, Optional[Tensor]]]] = None,
+    ):
         # anything in original attn_mask = 1, becomes -1e8
         # anything in original attn_mask = 0, becomes 0
         # Note that we cannot use -inf here, because at some edge cases,
@@ -144,6 +164,7 @@ class TransformerEncoderLayer(nn.Module):
             key=x,
             value=x,
             key_padding_mask=encoder_padding_mask,
+            incremental_state=incremental_state,
             need_weights=False,
             attn_mask=attn_mask,
         )
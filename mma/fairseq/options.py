@@ -288,6 +288,10 @@ def add_preprocess_args(parser):
                        help="number of parallel workers")
     group.add_argument("--dict-only", action='store_true',
                        help="if true, only builds a dictionary and then exits")
+    group.add_argument("--dict-max-types", metavar="N", default=None, type=int,
+                       help="count at most 2N words per worker to build the "
+                            "dictionaries, with approximate counts which are never "
+                            "below the true ones")
     # fmt: on
     return parser
 
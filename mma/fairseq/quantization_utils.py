@@ -5,6 +5,8 @@
 
 import logging
 
+import torch
+import torch.nn as nn
 from fairseq.modules.quantization import pq, quantization_options, scalar
 from omegaconf import DictConfig
 
@@ -20,6 +22,27 @@ def quantize_model_scalar(model, model_cfg: DictConfig):
     return model
 
 
+def quantize_model_dynamic(model, skip_modules=None):
+    """
+    Post-training dynamic int8 quantization of the linear layers of a
+    model, for inference on CPU: the weights are stored in int8 and the
+    activations are quantized on the fly for every batch.
+
+    Args:
+        model: the model, quantized in place
+        skip_modules (List[str], optional): names of linear layers kept
+            in full precision, e.g. ``decoder.layers.0.encoder_attn.k_proj``
+
+    Returns the quantized model.
+    """
+    qconfig_spec = {nn.Linear: torch.quantization.default_dynamic_qconfig}
+    for name in skip_modules or []:
+        qconfig_spec[name] = None
+    return torch.quantization.quantize_dynamic(
+        model, qconfig_spec, dtype=torch.qint8, inplace=True
+    )
+
+
 class Quantizer(object):
     def __init__(self, config_path, max_epoch, max_update):
         try:
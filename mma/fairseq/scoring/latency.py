@@ -0,0 +1,146 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+METRICS = ["CW", "AP", "AL", "DAL"]
+
+
+def read_counts(delays: Sequence[Sequence[int]], src_lens: Sequence[int]):
+    """
+    Convert the delays of a batch of hypotheses into numbers of source
+    tokens read, as the read/write sequences of generate.d201 do.
+
+    *delays* holds, for every hypothesis, the source position read up to
+    when each target token was written.
+
+    Returns:
+        reads (np.ndarray): source tokens read before each target token,
+            of shape `(bsz, max_tgt_len)`, zero padded
+        tgt_lens (np.ndarray): number of target tokens, of shape `(bsz,)`
+        src_read (np.ndarray): number of source tokens read in the whole
+            sequence, of shape `(bsz,)`
+    """
+    bsz = len(delays)
+    tgt_lens = np.array([len(d) for d in delays], dtype=np.int64)
+    max_tgt_len = int(tgt_lens.max()) if bsz > 0 else 0
+    mask = np.arange(max_tgt_len)[None, :] < tgt_lens[:, None]
+    d = np.zeros((bsz, max_tgt_len), dtype=np.int64)
+    d[mask] = np.concatenate([np.asarray(x, dtype=np.int64) for x in delays])
+    src_lens = np.asarray(src_lens, dtype=np.int64)
+
+    # The first write comes after d_0 + 1 reads, the next ones after the
+    # increase of the delay clamped to the source, if any
+    steps = np.diff(np.minimum(d, src_lens[:, None] - 1), axis=1)
+    steps = np.concatenate([d[:, :1] + 1, steps], axis=1).clip(min=0)
+    reads = np.where(mask, steps.cumsum(axis=1), 0)
+
+    last = np.arange(bsz), tgt_lens - 1
+    src_read = reads[last] + (src_lens - d[last] - 1).clip(min=0)
+    return reads, tgt_lens, src_read
+
+
+def latency_metrics(
+    delays: Sequence[Sequence[int]], src_lens: Sequence[int]
+) -> Dict[str, np.ndarray]:
+    """
+    Consecutive wait (CW), average proportion (AP), average lagging (AL)
+    and differentiable average lagging (DAL) of a batch of hypotheses,
+    computed from their delays (see read_counts).
+
+    The values match generate.compute_delay on the read/write sequences
+    of generate.d201, with the sums accumulated in the same order, up to
+    rounding for DAL.
+
+    Returns a dict of arrays of shape `(bsz,)` keyed by metric name, and
+    the number of source tokens read under "src_len".
+    """
+    reads, tgt_lens, src_read = read_counts(delays, src_lens)
+    bsz, max_tgt_len = reads.shape
+    # The metrics are 0 without any read or write
+    valid = (src_read > 0) & (tgt_lens > 0)
+    x = np.where(valid, src_read, 1)
+    y = np.where(valid, tgt_lens, 1)
+    mask = np.arange(max_tgt_len)[None, :] < tgt_lens[:, None]
+    last = np.arange(bsz), y - 1
+
+    # Number of read segments followed by a write
+    prev_reads = np.concatenate([np.zeros((bsz, 1), dtype=np.int64), reads[:, :-1]], 1)
+    num_segments = ((reads > prev_reads) & mask).sum(axis=1)
+    cw = np.where(num_segments > 0, x / np.maximum(num_segments, 1), 0.0)
+
+    ap = reads.sum(axis=1) / x / y
+
+    # Source tokens the ideal policy would have read at each step
+    rate = y / x
+    diag = np.arange(max_tgt_len)[None, :] / rate[:, None]
+
+    # AL stops at the first write after the whole source is read
+    full = (reads == x[:, None]) & mask
+    al_lens = np.where(full.any(axis=1), full.argmax(axis=1) + 1, y)
+    al_mask = np.arange(max_tgt_len)[None, :] < al_lens[:, None]
+    al = np.where(al_mask, reads - diag, 0.0).cumsum(axis=1)
+    al = al[np.arange(bsz), al_lens - 1] / al_lens
+
+    # DAL delays each write by at least 1 / rate after the previous one:
+    # dal_reads[i] = max(reads[i], dal_reads[i - 1] + 1 / rate)
+    #              = max_{j <= i}(reads[j] - j / rate) + i / rate
+    offsets = np.arange(max_tgt_len)[None, :] * (1 / rate)[:, None]
+    dal_reads = np.maximum.accumulate(reads - offsets, axis=1) + offsets
+    dal = np.where(mask, dal_reads - diag, 0.0).cumsum(axis=1)[last] / y
+
+    return {
+        "CW": np.where(valid, cw, 0.0),
+        "AP": np.where(valid, ap, 0.0),
+        "AL": np.where(valid, al, 0.0),
+        "DAL": np.where(valid, dal, 0.0),
+        "src_len": src_read,
+    }
+
+
+class LatencyScorer(object):
+    """
+    Accumulate the latency metrics of simultaneous translation hypotheses
+    batch by batch, from the delays returned by the sequence generator.
+
+    Args:
+        weight_by_src_len (bool): average the metrics over sentences
+            weighted by source length instead of uniformly
+    """
+
+    def __init__(self, weight_by_src_len: bool = False):
+        self.weight_by_src_len = weight_by_src_len
+        self.reset()
+
+    def reset(self):
+        self.stats: Dict[str, List[np.ndarray]] = {
+            name: [] for name in METRICS + ["src_len"]
+        }
+
+    def add(self, delays: Sequence[Sequence[int]], src_lens: Sequence[int]):
+        if len(delays) == 0:
+            return
+        for name, values in latency_metrics(delays, src_lens).items():
+            self.stats[name].append(values)
+
+    def score(self) -> Dict[str, float]:
+        weights = None
+        if self.weight_by_src_len:
+            weights = np.concatenate(self.stats["src_len"])
+        return {
+            name: np.average(
+                np.concatenate(self.stats[name]) if self.stats[name] else [],
+                weights=weights,
+            )
+            for name in METRICS
+        }
+
+    def result_string(self) -> str:
+        return " ".join(
+            "{}: {:.4f}".format(name, value) for name, value in self.score().items()
+        )
@@ -7,7 +7,6 @@ import math
 from typing import Dict, List, Optional
 import sys
 
-import pdb
 import torch
 import torch.nn as nn
 from fairseq import search, utils
@@ -38,6 +37,7 @@ class SequenceGenerator(nn.Module):
         symbols_to_strip_from_output=None,
         lm_model=None,
         lm_weight=1.0,
+        compact_threshold=0.0,
     ):
         """Generates translations of a given source sentence.
 
@@ -62,6 +62,17 @@ class SequenceGenerator(nn.Module):
                 sharper samples (default: 1.0)
             match_source_len (bool, optional): outputs should match the source
                 length (default: False)
+            lm_model (~fairseq.models.FairseqLanguageModel or
+                ~fairseq.models.FairseqDecoder, optional): language model for
+                shallow fusion, either a language model or a decoder without
+                encoder attention, such as the auxiliary LM decoder of
+                TransformerModel (default: None)
+            lm_weight (float, optional): weight of the language model log
+                probabilities in shallow fusion (default: 1.0)
+            compact_threshold (float, optional): remove the finished sentences
+                from the batch once they are at least this fraction of it;
+                until then they are carried along without being finalized
+                again (default: 0.0, remove them as soon as they finish)
         """
         super().__init__()
         if isinstance(models, EnsembleModel):
@@ -91,6 +102,7 @@ class SequenceGenerator(nn.Module):
         self.unk_penalty = unk_penalty
         self.temperature = temperature
         self.match_source_len = match_source_len
+        self.compact_threshold = compact_threshold
 
         if no_repeat_ngram_size > 0:
             self.repeat_ngram_blocker = NGramRepeatBlock(no_repeat_ngram_size)
@@ -113,9 +125,17 @@ class SequenceGenerator(nn.Module):
 
         self.lm_model = lm_model
         self.lm_weight = lm_weight
+        # The language model is run through its decoder, incrementally if
+        # it supports it
+        self.lm_decoder = getattr(lm_model, "decoder", lm_model)
+        self.lm_incremental = isinstance(self.lm_decoder, FairseqIncrementalDecoder)
         if self.lm_model is not None:
             self.lm_model.eval()
 
+        # Number of explicit copies from the device to the host while
+        # generating the last batch, for benchmarks
+        self.num_host_syncs = 0
+
     def cuda(self):
         self.model.cuda()
         return self
@@ -203,9 +223,11 @@ class SequenceGenerator(nn.Module):
                 for i in range(self.model.models_size)
             ],
         )
+        lm_incremental_state = torch.jit.annotate(
+            Dict[str, Dict[str, Optional[Tensor]]], {}
+        )
         net_input = sample["net_input"]
-
-        padding_length = net_input["src_tokens"].size(1) - net_input["src_lengths"]
+        self.num_host_syncs = 0
 
         if "src_tokens" in net_input:
             src_tokens = net_input["src_tokens"]
@@ -319,10 +341,17 @@ class SequenceGenerator(nn.Module):
         else:
             original_batch_idxs = torch.arange(0, bsz).type_as(tokens)
 
-        reads = None
-        finalized_rw = []
-        src_lens = []
-        source_length = net_input["src_lengths"]
+        # source position read up to before each target step
+        reads = torch.zeros(bsz * beam_size, max_len + 1).to(src_tokens).long()
+        # the reads of the finalized sentences, by index in the original
+        # batch, copied to the host once the whole batch is finalized
+        finalized_reads = torch.zeros(bsz, max_len + 1).to(reads)
+        finalized_read_lens = [0 for i in range(bsz)]
+        # index in the original batch of the sentences left
+        sent_idxs = list(range(bsz))
+        # sentences of the batch finished but not removed from it yet
+        finished_rows: List[int] = []
+        finished_mask: Optional[Tensor] = None
 
         for step in range(max_len + 1):  # one extra step for EOS marker
             # reorder decoder internal states based on the prev choice of beams
@@ -336,15 +365,18 @@ class SequenceGenerator(nn.Module):
                         corr.unsqueeze(-1) * beam_size
                     )
                     original_batch_idxs = original_batch_idxs[batch_idxs]
+                    # the beams of a sentence share its encoder output
+                    encoder_outs = self.model.reorder_encoder_out(
+                        encoder_outs, reorder_state
+                    )
                 self.model.reorder_incremental_state(incremental_states, reorder_state)
-                encoder_outs = self.model.reorder_encoder_out(
-                    encoder_outs, reorder_state
-                )
+                if self.lm_decoder is not None and self.lm_incremental:
+                    self.lm_decoder.reorder_incremental_state_scripting(
+                        lm_incremental_state, reorder_state
+                    )
 
-            if reads is not None:
+            if reorder_state is not None:
                 reads = reads.index_select(0, reorder_state)
-                padding_length = padding_length.index_select(0, reorder_state)
-                source_length = source_length.index_select(0, reorder_state)
 
             lprobs, avg_attn_scores, states = self.model.forward_decoder(
                 tokens[:, : step + 1],
@@ -357,16 +389,17 @@ class SequenceGenerator(nn.Module):
             ]
             alpha = torch.cat(attn_list, dim=1)
 
-            read = alpha[:, :, -1, :].max(dim=-1, keepdim=True)[1]
-            read = read.max(dim=1, keepdim=False)[0]
-            if reads is None:
-                reads = read
-            else:
-                reads = torch.cat((reads, read), dim=1)
+            read = alpha[:, :, -1, :].max(dim=-1)[1]
+            reads[:, step] = read.max(dim=1)[0]
 
-            if self.lm_model is not None:
-                lm_out = self.lm_model(tokens[:, : step + 1])
-                probs = self.lm_model.get_normalized_probs(
+            if self.lm_decoder is not None:
+                if self.lm_incremental:
+                    lm_out = self.lm_decoder(
+                        tokens[:, : step + 1], incremental_state=lm_incremental_state
+                    )
+                else:
+                    lm_out = self.lm_decoder(tokens[:, : step + 1])
+                probs = self.lm_decoder.get_normalized_probs(
                     lm_out, log_probs=True, sample=None
                 )
                 probs = probs[:, -1, :] * self.lm_weight
@@ -435,6 +468,9 @@ class SequenceGenerator(nn.Module):
             # Shape of eos_mask: (batch size, beam size)
             eos_mask = cand_indices.eq(self.eos) & cand_scores.ne(-math.inf)
             eos_mask[:, :beam_size][cands_to_ignore] = torch.tensor(0).to(eos_mask)
+            if finished_mask is not None:
+                # finished sentences left in the batch are not finalized again
+                eos_mask[finished_mask] = torch.tensor(0).to(eos_mask)
 
             # only consider eos when it's among the top beam_size indices
             # Now we know what beam item(s) to finish
@@ -461,17 +497,16 @@ class SequenceGenerator(nn.Module):
                     attn,
                     src_lengths,
                     max_len,
+                    sent_idxs,
                 )
-                finalized_reads = reads.cpu().index_select(
-                    0, torch.LongTensor(finalized_sents)
-                )
-                finalized_rw.extend(finalized_reads.numpy().tolist())
-                src_lens.extend(
-                    source_length.cpu()
-                    .index_select(0, torch.LongTensor(finalized_sents))
-                    .numpy()
-                    .tolist()
-                )
+                if len(finalized_sents) > 0:
+                    # the reads of the first beam of each sentence
+                    sents = [sent_idxs[i] for i in finalized_sents]
+                    finalized_reads[sents, : step + 1] = reads.view(
+                        bsz, beam_size, -1
+                    )[finalized_sents, 0, : step + 1]
+                    for sent in sents:
+                        finalized_read_lens[sent] = step + 1
                 num_remaining_sent -= len(finalized_sents)
 
             assert num_remaining_sent >= 0
@@ -482,19 +517,32 @@ class SequenceGenerator(nn.Module):
             assert step < max_len, f"{step} < {max_len}"
 
             # Remove finalized sentences (ones for which {beam_size}
-            # finished hypotheses have been generated) from the batch.
-            if len(finalized_sents) > 0:
-                new_bsz = bsz - len(finalized_sents)
+            # finished hypotheses have been generated) from the batch, once
+            # they are compact_threshold of it: every removal reindexes the
+            # whole decoder state.
+            finished_rows.extend(finalized_sents)
+            if (
+                len(finished_rows) > 0
+                and len(finished_rows) >= self.compact_threshold * bsz
+            ):
+                new_bsz = bsz - len(finished_rows)
 
                 # construct batch_idxs which holds indices of batches to keep for the next pass
                 batch_mask = torch.ones(
                     bsz, dtype=torch.bool, device=cand_indices.device
                 )
-                batch_mask[finalized_sents] = False
+                batch_mask[finished_rows] = False
                 # TODO replace `nonzero(as_tuple=False)` after TorchScript supports it
                 batch_idxs = torch.arange(
                     bsz, device=cand_indices.device
                 ).masked_select(batch_mask)
+                sent_idxs = [
+                    sent
+                    for i, sent in enumerate(sent_idxs)
+                    if i not in finished_rows
+                ]
+                finished_rows = []
+                finished_mask = None
 
                 # Choose the subset of the hypothesized constraints that will continue
                 self.search.prune_sentences(batch_idxs)
@@ -520,6 +568,11 @@ class SequenceGenerator(nn.Module):
                 bsz = new_bsz
             else:
                 batch_idxs = None
+                if len(finalized_sents) > 0:
+                    finished_mask = torch.zeros(
+                        bsz, dtype=torch.bool, device=cand_indices.device
+                    )
+                    finished_mask[finished_rows] = True
 
             # Set active_mask so that values > cand_size indicate eos hypos
             # and values < cand_size indicate candidate active hypos.
@@ -584,8 +637,12 @@ class SequenceGenerator(nn.Module):
                     attn[:, :, : step + 2], dim=0, index=active_bbsz_idx
                 )
 
-            # reorder incremental state in decoder
-            reorder_state = active_bbsz_idx
+            # reorder incremental state in decoder, unless every hypothesis
+            # continues from its own row: a single beam and no sentence removed
+            if beam_size > 1 or batch_idxs is not None:
+                reorder_state = active_bbsz_idx
+            else:
+                reorder_state = None
 
         # sort by score descending
         for sent in range(len(finalized)):
@@ -597,8 +654,20 @@ class SequenceGenerator(nn.Module):
             finalized[sent] = torch.jit.annotate(
                 List[Dict[str, Tensor]], finalized[sent]
             )
+
+        finalized_reads = self._to_host(finalized_reads)
+        finalized_rw = [
+            finalized_reads[sent, : finalized_read_lens[sent]].tolist()
+            for sent in range(len(finalized))
+        ]
+        src_lens = self._to_host(net_input["src_lengths"]).tolist()
         return finalized, finalized_rw, src_lens
 
+    def _to_host(self, x: Tensor) -> Tensor:
+        """Copy *x* to the CPU, counted in num_host_syncs"""
+        self.num_host_syncs += 1
+        return x.cpu()
+
     def _prefix_tokens(
         self, step: int, lprobs, scores, tokens, prefix_tokens, beam_size: int
     ):
@@ -646,6 +715,7 @@ class SequenceGenerator(nn.Module):
         attn: Optional[Tensor],
         src_lengths,
         max_len: int,
+        sent_idxs: List[int],
     ):
         """Finalize hypothesis, store finalized information in `finalized`, and change `finished` accordingly.
         A sentence is finalized when {beam_size} finished items have been collected for it.
@@ -654,6 +724,8 @@ class SequenceGenerator(nn.Module):
         These will be removed from the batch and not processed further.
         Args:
             bbsz_idx (Tensor):
+            sent_idxs (List[int]): index in the original batch of every
+                sentence of the current batch
         """
         assert bbsz_idx.numel() == eos_scores.numel()
 
@@ -681,18 +753,6 @@ class SequenceGenerator(nn.Module):
         if self.normalize_scores:
             eos_scores /= (step + 1) ** self.len_penalty
 
-        # cum_unfin records which sentences in the batch are finished.
-        # It helps match indexing between (a) the original sentences
-        # in the batch and (b) the current, possibly-reduced set of
-        # sentences.
-        cum_unfin: List[int] = []
-        prev = 0
-        for f in finished:
-            if f:
-                prev += 1
-            else:
-                cum_unfin.append(prev)
-
         # The keys here are of the form "{sent}_{unfin_idx}", where
         # "unfin_idx" is the index in the current (possibly reduced)
         # list of sentences, and "sent" is the index in the original,
@@ -700,17 +760,19 @@ class SequenceGenerator(nn.Module):
         # set() is not supported in script export
         sents_seen: Dict[str, Optional[Tensor]] = {}
 
+        # sentence index in the current (possibly reduced) batch of every
+        # finished beam item, copied at once
+        unfin_idxs: List[int] = self._to_host(bbsz_idx // beam_size).tolist()
+
         # For every finished beam item
         for i in range(bbsz_idx.size()[0]):
-            idx = bbsz_idx[i]
             score = eos_scores[i]
-            # sentence index in the current (possibly reduced) batch
-            unfin_idx = idx // beam_size
+            unfin_idx = unfin_idxs[i]
             # sentence index in the original (unreduced) batch
-            sent = unfin_idx + cum_unfin[unfin_idx]
+            sent = sent_idxs[unfin_idx]
             # Cannot create dict for key type '(int, int)' in torchscript.
             # The workaround is to cast int to string
-            seen = str(sent.item()) + "_" + str(unfin_idx.item())
+            seen = str(sent) + "_" + str(unfin_idx)
             if seen not in sents_seen:
                 sents_seen[seen] = None
 
@@ -829,7 +891,14 @@ class EnsembleModel(nn.Module):
                 encoder_out = encoder_outs[i]
             # decode each model
             if hasattr(model, "decoder"):
-                decoder_out = model.decoder.forward(tokens, encoder_out=encoder_out)
+                if self.has_incremental_states():
+                    decoder_out = model.decoder.forward(
+                        tokens,
+                        encoder_out=encoder_out,
+                        incremental_state=incremental_states[i],
+                    )
+                else:
+                    decoder_out = model.decoder.forward(tokens, encoder_out=encoder_out)
                 # decoder_out = model.back_decoder.forward(tokens, encoder_out=encoder_out)
             else:
                 decoder_out = model.forward(tokens)
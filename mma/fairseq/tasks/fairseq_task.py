@@ -11,7 +11,14 @@ from typing import Any, Callable, Dict, List
 
 import torch
 from fairseq import metrics, search, tokenizer, utils
-from fairseq.data import Dictionary, FairseqDataset, data_utils, encoders, iterators
+from fairseq.data import (
+    Dictionary,
+    FairseqDataset,
+    batch_plan_cache,
+    data_utils,
+    encoders,
+    iterators,
+)
 from fairseq.dataclass import FairseqDataclass
 from fairseq.dataclass.utils import gen_parser_from_dataclass
 from fairseq.optim.amp_optimizer import AMPOptimizer
@@ -100,7 +107,13 @@ class FairseqTask(object):
 
     @classmethod
     def build_dictionary(
-        cls, filenames, workers=1, threshold=-1, nwords=-1, padding_factor=8
+        cls,
+        filenames,
+        workers=1,
+        threshold=-1,
+        nwords=-1,
+        padding_factor=8,
+        max_types=None,
     ):
         """Build the dictionary
 
@@ -113,11 +126,13 @@ class FairseqTask(object):
             padding_factor (int): can be used to pad the dictionary size to be a
                 multiple of 8, which is important on some hardware (e.g., Nvidia
                 Tensor Cores).
+            max_types (int, optional): bounds the number of words counted by
+                each worker, see :func:`Dictionary.add_file_to_dictionary`
         """
         d = Dictionary()
         for filename in filenames:
             Dictionary.add_file_to_dictionary(
-                filename, d, tokenizer.tokenize_line, workers
+                filename, d, tokenizer.tokenize_line, workers, max_types=max_types
             )
         d.finalize(threshold=threshold, nwords=nwords, padding_factor=padding_factor)
         return d
@@ -224,6 +239,8 @@ class FairseqTask(object):
         epoch=1,
         data_buffer_size=0,
         disable_iterator_cache=False,
+        max_token_area=None,
+        batch_plan_cache_dir=None,
     ):
         """
         Get an iterator that yields batches of data from the given dataset.
@@ -256,6 +273,14 @@ class FairseqTask(object):
             disable_iterator_cache (bool, optional): don't cache the
                 EpochBatchIterator (ignores `FairseqTask::can_reuse_epoch_itr`)
                 (default: False).
+            max_token_area (int, optional): batch by the source length times
+                the target length of the examples instead of their number of
+                tokens, with at most this many cells in each batch (the
+                dataset must implement ``batch_by_area``) (default: None).
+            batch_plan_cache_dir (str, optional): load the batches from this
+                directory if they were cached there by a previous run with the
+                same data and batching options, else compute and cache them
+                (see :mod:`fairseq.data.batch_plan_cache`) (default: None).
         Returns:
             ~fairseq.iterators.EpochBatchIterator: a batched iterator over the
                 given dataset split
@@ -272,23 +297,55 @@ class FairseqTask(object):
         # initialize the dataset with the correct starting epoch
         dataset.set_epoch(epoch)
 
-        # get indices ordered by example size
-        with data_utils.numpy_seed(seed):
-            indices = dataset.ordered_indices()
-
-        # filter examples that are too large
-        if max_positions is not None:
-            indices = self.filter_indices_by_size(
-                indices, dataset, max_positions, ignore_invalid_inputs
+        # load the batches cached by a previous run, if any
+        batch_sampler, batch_plan_key = None, None
+        if batch_plan_cache_dir is not None and self.can_reuse_epoch_itr(dataset):
+            batch_plan_key = batch_plan_cache.fingerprint(
+                dataset,
+                task=type(self).__qualname__,
+                max_tokens=max_tokens,
+                max_sentences=max_sentences,
+                max_positions=max_positions,
+                ignore_invalid_inputs=ignore_invalid_inputs,
+                required_batch_size_multiple=required_batch_size_multiple,
+                seed=seed,
+                max_token_area=max_token_area,
             )
+            if batch_plan_key is not None:
+                batch_sampler = batch_plan_cache.load(
+                    batch_plan_cache_dir, batch_plan_key
+                )
 
-        # create mini-batches with given size constraints
-        batch_sampler = dataset.batch_by_size(
-            indices,
-            max_tokens=max_tokens,
-            max_sentences=max_sentences,
-            required_batch_size_multiple=required_batch_size_multiple,
-        )
+        if batch_sampler is None:
+            # get indices ordered by example size
+            with data_utils.numpy_seed(seed):
+                indices = dataset.ordered_indices()
+
+            # filter examples that are too large
+            if max_positions is not None:
+                indices = self.filter_indices_by_size(
+                    indices, dataset, max_positions, ignore_invalid_inputs
+                )
+
+            # create mini-batches with given size constraints
+            if max_token_area is not None:
+                batch_sampler = dataset.batch_by_area(
+                    indices,
+                    max_token_area=max_token_area,
+                    max_sentences=max_sentences,
+                    required_batch_size_multiple=required_batch_size_multiple,
+                )
+            else:
+                batch_sampler = dataset.batch_by_size(
+                    indices,
+                    max_tokens=max_tokens,
+                    max_sentences=max_sentences,
+                    required_batch_size_multiple=required_batch_size_multiple,
+                )
+            if batch_plan_key is not None and not callable(batch_sampler):
+                batch_plan_cache.save(
+                    batch_plan_cache_dir, batch_plan_key, batch_sampler
+                )
 
         # return a reusable, sharded iterator
         epoch_iter = iterators.EpochBatchIterator(
@@ -475,6 +532,7 @@ class FairseqTask(object):
             match_source_len=getattr(args, "match_source_len", False),
             no_repeat_ngram_size=getattr(args, "no_repeat_ngram_size", 0),
             search_strategy=search_strategy,
+            compact_threshold=getattr(args, "compact_threshold", 0.0),
             **extra_gen_cls_kwargs,
         )
 
@@ -349,6 +349,7 @@ class TranslationMultiSimpleEpochTask(LegacyFairseqTask):
         epoch=1,
         data_buffer_size=0,
         disable_iterator_cache=False,
+        batch_plan_cache_dir=None,
     ):
         """
         Get an iterator that yields batches of data from the given dataset.
@@ -381,6 +382,9 @@ class TranslationMultiSimpleEpochTask(LegacyFairseqTask):
             disable_iterator_cache (bool, optional): don't cache the
                 EpochBatchIterator (ignores `FairseqTask::can_reuse_epoch_itr`)
                 (default: False).
+            batch_plan_cache_dir (str, optional): cache the batches in this
+                directory, with the RoundRobin sampling method only
+                (default: None).
         Returns:
             ~fairseq.iterators.EpochBatchIterator: a batched iterator over the
                 given dataset split
@@ -404,6 +408,7 @@ class TranslationMultiSimpleEpochTask(LegacyFairseqTask):
                 epoch=epoch,
                 data_buffer_size=data_buffer_size,
                 disable_iterator_cache=disable_iterator_cache,
+                batch_plan_cache_dir=batch_plan_cache_dir,
             )
             self.dataset_to_epoch_iter[dataset] = batch_iter
             return batch_iter
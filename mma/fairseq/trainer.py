@@ -615,6 +615,7 @@ class Trainer(object):
             epoch=epoch,
             data_buffer_size=self.cfg.dataset.data_buffer_size,
             disable_iterator_cache=disable_iterator_cache,
+            batch_plan_cache_dir=self.cfg.dataset.batch_plan_cache_dir,
         )
         self.reset_dummy_batch(batch_iterator.first_batch)
         return batch_iterator
@@ -644,6 +645,7 @@ class Trainer(object):
             epoch=1,
             data_buffer_size=self.cfg.dataset.data_buffer_size,
             disable_iterator_cache=disable_iterator_cache,
+            batch_plan_cache_dir=self.cfg.dataset.batch_plan_cache_dir,
         )
         self.reset_dummy_batch(batch_iterator.first_batch)
         return batch_iterator
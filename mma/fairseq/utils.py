@@ -263,13 +263,29 @@ def strip_pad(tensor, pad):
     return tensor[tensor.ne(pad)]
 
 
-def buffered_arange(max):
-    if not hasattr(buffered_arange, "buf"):
-        buffered_arange.buf = torch.LongTensor()
-    if max > buffered_arange.buf.numel():
-        buffered_arange.buf.resize_(max)
-        torch.arange(max, out=buffered_arange.buf)
-    return buffered_arange.buf[:max]
+def buffered_arange(max, device=None):
+    """
+    Return ``torch.arange(max)`` on *device* (CPU by default), sliced from a
+    buffer kept per device, so that it is not allocated on every call.
+    The result must not be modified in place.
+    """
+    if not hasattr(buffered_arange, "bufs"):
+        buffered_arange.bufs = {}
+    device = torch.device("cpu") if device is None else torch.device(device)
+    buf = buffered_arange.bufs.get(device)
+    if buf is None or max > buf.numel():
+        # The buffer outlives the inference mode it may be created in
+        with inference_mode(False):
+            buf = torch.arange(max, device=device)
+        buffered_arange.bufs[device] = buf
+    return buf[:max]
+
+
+def inference_mode(mode: bool = True):
+    """torch.inference_mode if available, or torch.no_grad / a no-op otherwise."""
+    if hasattr(torch, "inference_mode"):
+        return torch.inference_mode(mode)
+    return torch.no_grad() if mode else contextlib.ExitStack()
 
 
 def convert_padding_direction(
@@ -8,6 +8,7 @@ Translate pre-processed data with a trained model.
 """
 
 import ast
+import io
 import logging
 import math
 import os
@@ -17,10 +18,11 @@ from itertools import chain
 
 import numpy as np
 import torch
-from fairseq import checkpoint_utils, options, scoring, tasks, utils
+from fairseq import checkpoint_utils, options, quantization_utils, scoring, tasks, utils
 from fairseq.dataclass.utils import convert_namespace_to_omegaconf
 from fairseq.logging import progress_bar
 from fairseq.logging.meters import StopwatchMeter, TimeMeter
+from fairseq.scoring.latency import LatencyScorer
 from omegaconf import DictConfig
 
 import pdb
@@ -58,6 +60,9 @@ def get_symbols_to_strip_from_output(generator):
         return {generator.eos}
 
 
+# Nothing in generation needs autograd: run it all in inference mode,
+# so that no tensor made here is used outside of it
+@utils.inference_mode()
 def _main(cfg: DictConfig, output_file):
     logging.basicConfig(
         format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
@@ -79,6 +84,8 @@ def _main(cfg: DictConfig, output_file):
         utils.set_torch_seed(cfg.common.seed)
 
     use_cuda = torch.cuda.is_available() and not cfg.common.cpu
+    if not use_cuda and cfg.generation.cpu_threads is not None:
+        torch.set_num_threads(cfg.generation.cpu_threads)
 
     # Load dataset splits
     task = tasks.setup_task(cfg.task)
@@ -133,6 +140,20 @@ def _main(cfg: DictConfig, output_file):
         if use_cuda and not cfg.distributed_training.pipeline_model_parallel:
             model.cuda()
         model.prepare_for_inference_(cfg)
+        if cfg.generation.quantize_dynamic:
+            assert not use_cuda and not cfg.common.fp16, (
+                "--quantize-dynamic is only supported with --cpu"
+            )
+            quantization_utils.quantize_model_dynamic(model)
+
+    if (
+        lms[0] is None
+        and cfg.generation.lm_weight != 0
+        and getattr(models[0], "lm_decoder", None) is not None
+    ):
+        # Shallow fusion with the auxiliary LM decoder of the model,
+        # trained with --add-language-model
+        lms = [models[0].lm_decoder]
 
     # Load alignment dictionary for unknown word replacement
     # (None if no unknown word replacement, empty if no path to align dictionary)
@@ -153,6 +174,8 @@ def _main(cfg: DictConfig, output_file):
         shard_id=cfg.distributed_training.distributed_rank,
         num_workers=cfg.dataset.num_workers,
         data_buffer_size=cfg.dataset.data_buffer_size,
+        max_token_area=cfg.generation.max_token_area,
+        batch_plan_cache_dir=cfg.dataset.batch_plan_cache_dir,
     ).next_epoch_itr(shuffle=False)
     progress = progress_bar.progress_bar(
         itr,
@@ -191,7 +214,10 @@ def _main(cfg: DictConfig, output_file):
     num_sentences = 0
     has_target = True
     wps_meter = TimeMeter()
-    rws = []
+    # Same metrics as compute_delay(..., is_weight_ave=True) on the d201
+    # read/write sequences, without building them
+    latency_scorer = LatencyScorer()
+    sentence_outputs = {}
     for sample in progress:
         sample = utils.move_to_cuda(sample) if use_cuda else sample
         if "net_input" not in sample:
@@ -219,10 +245,11 @@ def _main(cfg: DictConfig, output_file):
             ):
                 back_data = {}
                 bsz = src_tokens.size(0)
+                device = src_tokens.device
                 src_padding_num = (prev_output_tokens == 1).sum(dim=1)
                 tgt_padding_num = (src_tokens == 1).sum(dim=1)
                 src_tmp = (
-                    torch.arange(0, prev_output_tokens.size(1), device="cuda")
+                    torch.arange(0, prev_output_tokens.size(1), device=device)
                     .unsqueeze(0)
                     .repeat(bsz, 1)
                 )
@@ -232,7 +259,7 @@ def _main(cfg: DictConfig, output_file):
                 ).type_as(src_tokens)
 
                 tgt_tmp = (
-                    torch.arange(0, src_tokens.size(1), device="cuda")
+                    torch.arange(0, src_tokens.size(1), device=device)
                     .unsqueeze(0)
                     .repeat(bsz, 1)
                 )
@@ -243,12 +270,12 @@ def _main(cfg: DictConfig, output_file):
                     torch.cat(
                         (
                             prev_output_tokens[:, 1:],
-                            torch.ones((bsz, 1), device="cuda", dtype=torch.long),
+                            torch.ones((bsz, 1), device=device, dtype=torch.long),
                         ),
                         dim=1,
                     )
                     + torch.ones(
-                        prev_output_tokens.size(), device="cuda", dtype=torch.long
+                        prev_output_tokens.size(), device=device, dtype=torch.long
                     )
                     * src_tmp
                 )
@@ -256,7 +283,7 @@ def _main(cfg: DictConfig, output_file):
                 _src_tokens[_src_tokens == 2] = 1
                 back_data["prev_output_tokens"] = torch.cat(
                     (
-                        torch.full((bsz, 1), 2, device="cuda", dtype=torch.long),
+                        torch.full((bsz, 1), 2, device=device, dtype=torch.long),
                         _src_tokens,
                     ),
                     dim=1,
@@ -282,10 +309,14 @@ def _main(cfg: DictConfig, output_file):
         )
         num_generated_tokens = sum(len(h[0]["tokens"]) for h in hypos)
         gen_timer.stop(num_generated_tokens)
-        rws.extend([d201(g[i], src_lens[i]) for i in range(len(g))])
+        latency_scorer.add(g, src_lens)
 
         for i, sample_id in enumerate(sample["id"].tolist()):
             has_target = sample["target"] is not None
+            sentence_file = output_file
+            if cfg.generation.max_token_area is not None:
+                # Batches are not in the order of the dataset
+                sentence_file = sentence_outputs[sample_id] = io.StringIO()
 
             # Remove padding
             if "src_tokens" in sample["net_input"]:
@@ -330,9 +361,9 @@ def _main(cfg: DictConfig, output_file):
 
             if not cfg.common_eval.quiet:
                 if src_dict is not None:
-                    print("S-{}\t{}".format(sample_id, src_str), file=output_file)
+                    print("S-{}\t{}".format(sample_id, src_str), file=sentence_file)
                 if has_target:
-                    print("T-{}\t{}".format(sample_id, target_str), file=output_file)
+                    print("T-{}\t{}".format(sample_id, target_str), file=sentence_file)
 
             # Process top predictions
             for j, hypo in enumerate(hypos[i][: cfg.generation.nbest]):
@@ -352,12 +383,12 @@ def _main(cfg: DictConfig, output_file):
                     # original hypothesis (after tokenization and BPE)
                     print(
                         "H-{}\t{}\t{}".format(sample_id, score, hypo_str),
-                        file=output_file,
+                        file=sentence_file,
                     )
                     # detokenized hypothesis
                     print(
                         "D-{}\t{}\t{}".format(sample_id, score, detok_hypo_str),
-                        file=output_file,
+                        file=sentence_file,
                     )
                     print(
                         "P-{}\t{}".format(
@@ -372,7 +403,7 @@ def _main(cfg: DictConfig, output_file):
                                 )
                             ),
                         ),
-                        file=output_file,
+                        file=sentence_file,
                     )
 
                     if cfg.generation.print_alignment == "hard":
@@ -386,7 +417,7 @@ def _main(cfg: DictConfig, output_file):
                                     ]
                                 ),
                             ),
-                            file=output_file,
+                            file=sentence_file,
                         )
                     if cfg.generation.print_alignment == "soft":
                         print(
@@ -396,13 +427,13 @@ def _main(cfg: DictConfig, output_file):
                                     [",".join(src_probs) for src_probs in alignment]
                                 ),
                             ),
-                            file=output_file,
+                            file=sentence_file,
                         )
 
                     if cfg.generation.print_step:
                         print(
                             "I-{}\t{}".format(sample_id, hypo["steps"]),
-                            file=output_file,
+                            file=sentence_file,
                         )
 
                     if cfg.generation.retain_iter_history:
@@ -417,7 +448,7 @@ def _main(cfg: DictConfig, output_file):
                             )
                             print(
                                 "E-{}_{}\t{}".format(sample_id, step, h_str),
-                                file=output_file,
+                                file=sentence_file,
                             )
 
                 # Score only the top hypothesis
@@ -444,6 +475,9 @@ def _main(cfg: DictConfig, output_file):
             sample["nsentences"] if "nsentences" in sample else sample["id"].numel()
         )
 
+    for sample_id in sorted(sentence_outputs):
+        output_file.write(sentence_outputs[sample_id].getvalue())
+
     logger.info("NOTE: hypothesis and token scores are output in base 2")
     logger.info(
         "Translated {:,} sentences ({:,} tokens) in {:.1f}s ({:.2f} sentences/s, {:.2f} tokens/s)".format(
@@ -472,7 +506,8 @@ def _main(cfg: DictConfig, output_file):
             file=output_file,
         )
 
-    cw, ap, al, dal = compute_delay(rws, is_weight_ave=True)
+    latency = latency_scorer.score()
+    cw, ap, al, dal = latency["CW"], latency["AP"], latency["AL"], latency["DAL"]
     print("CW score: ", cw)
     print("AP score: ", ap)
     print("AL score: ", al)
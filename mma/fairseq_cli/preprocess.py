@@ -66,6 +66,7 @@ def main(args):
             threshold=args.thresholdsrc if src else args.thresholdtgt,
             nwords=args.nwordssrc if src else args.nwordstgt,
             padding_factor=args.padding_factor,
+            max_types=args.dict_max_types,
         )
 
     target = not args.only_source
@@ -134,53 +135,62 @@ def main(args):
             input_prefix, ("." + lang) if lang is not None else ""
         )
         offsets = find_offsets(input_file, num_workers)
-        (first_chunk, *more_chunks) = zip(offsets, offsets[1:])
-        pool = None
-        if num_workers > 1:
-            pool = Pool(processes=num_workers - 1)
-            for worker_id, (start_offset, end_offset) in enumerate(
-                more_chunks, start=1
-            ):
-                prefix = "{}{}".format(output_prefix, worker_id)
-                pool.apply_async(
-                    binarize,
-                    (
-                        args,
-                        input_file,
-                        vocab,
-                        prefix,
-                        lang,
-                        start_offset,
-                        end_offset,
-                    ),
-                    callback=merge_result,
+        if (
+            args.dataset_impl == "mmap"
+            and num_workers > 1
+            and Binarizer.has_fast_path(vocab)
+        ):
+            binarize_in_place(
+                vocab, input_file, output_prefix, lang, offsets, merge_result
+            )
+        else:
+            (first_chunk, *more_chunks) = zip(offsets, offsets[1:])
+            pool = None
+            if num_workers > 1:
+                pool = Pool(processes=num_workers - 1)
+                for worker_id, (start_offset, end_offset) in enumerate(
+                    more_chunks, start=1
+                ):
+                    prefix = "{}{}".format(output_prefix, worker_id)
+                    pool.apply_async(
+                        binarize,
+                        (
+                            args,
+                            input_file,
+                            vocab,
+                            prefix,
+                            lang,
+                            start_offset,
+                            end_offset,
+                        ),
+                        callback=merge_result,
+                    )
+                pool.close()
+
+            ds = indexed_dataset.make_builder(
+                dataset_dest_file(args, output_prefix, lang, "bin"),
+                impl=args.dataset_impl,
+                vocab_size=len(vocab),
+            )
+            merge_result(
+                Binarizer.binarize_fast(
+                    input_file,
+                    vocab,
+                    ds,
+                    offset=first_chunk[0],
+                    end=first_chunk[1],
                 )
-            pool.close()
-
-        ds = indexed_dataset.make_builder(
-            dataset_dest_file(args, output_prefix, lang, "bin"),
-            impl=args.dataset_impl,
-            vocab_size=len(vocab),
-        )
-        merge_result(
-            Binarizer.binarize(
-                input_file,
-                vocab,
-                lambda t: ds.add_item(t),
-                offset=first_chunk[0],
-                end=first_chunk[1],
             )
-        )
-        if num_workers > 1:
-            pool.join()
-            for worker_id in range(1, num_workers):
-                prefix = "{}{}".format(output_prefix, worker_id)
-                temp_file_path = dataset_dest_prefix(args, prefix, lang)
-                ds.merge_file_(temp_file_path)
-                os.remove(indexed_dataset.data_file_path(temp_file_path))
-                os.remove(indexed_dataset.index_file_path(temp_file_path))
+            if num_workers > 1:
+                pool.join()
+                for worker_id in range(1, num_workers):
+                    prefix = "{}{}".format(output_prefix, worker_id)
+                    temp_file_path = dataset_dest_prefix(args, prefix, lang)
+                    ds.merge_file_(temp_file_path)
+                    os.remove(indexed_dataset.data_file_path(temp_file_path))
+                    os.remove(indexed_dataset.index_file_path(temp_file_path))
 
-        ds.finalize(dataset_dest_file(args, output_prefix, lang, "idx"))
+            ds.finalize(dataset_dest_file(args, output_prefix, lang, "idx"))
 
         logger.info(
             "[{}] {}: {} sents, {} tokens, {:.3}% replaced by {}".format(
@@ -193,6 +203,44 @@ def main(args):
             )
         )
 
+    def binarize_in_place(vocab, input_file, output_prefix, lang, offsets, merge_result):
+        """Every worker writes its chunk of the input in place into the data
+        file, at an offset known from a first pass counting the tokens of
+        the chunks: merging the chunks only concatenates the item sizes.
+        The counts are only exact when Binarizer.has_fast_path(vocab)."""
+        chunks = list(zip(offsets, offsets[1:]))
+        pool = Pool(processes=len(chunks) - 1)
+        more_counts = pool.starmap_async(
+            Binarizer.count_tokens,
+            [(input_file, True, start, end) for start, end in chunks[1:]],
+        )
+        num_elements = [
+            Binarizer.count_tokens(input_file, offset=chunks[0][0], end=chunks[0][1])
+        ] + more_counts.get()
+
+        data_file = dataset_dest_file(args, output_prefix, lang, "bin")
+        ds = indexed_dataset.make_builder(
+            data_file, impl=args.dataset_impl, vocab_size=len(vocab)
+        )
+        shards = [
+            (data_file, ds.dtype, ds.reserve_shard_(n), n) for n in num_elements
+        ]
+        more_results = [
+            pool.apply_async(
+                binarize_shard, (input_file, vocab, shard, start_offset, end_offset)
+            )
+            for shard, (start_offset, end_offset) in zip(shards[1:], chunks[1:])
+        ]
+        pool.close()
+        results = [binarize_shard(input_file, vocab, shards[0], *chunks[0])]
+        results.extend(result.get() for result in more_results)
+        pool.join()
+
+        for result in results:
+            ds.merge_shard_(result.pop("sizes"))
+            merge_result(result)
+        ds.finalize(dataset_dest_file(args, output_prefix, lang, "idx"))
+
     def make_binary_alignment_dataset(input_prefix, output_prefix, num_workers):
         nseq = [0]
 
@@ -353,16 +401,26 @@ def binarize(args, filename, vocab, output_prefix, lang, offset, end, append_eos
         vocab_size=len(vocab),
     )
 
-    def consumer(tensor):
-        ds.add_item(tensor)
-
-    res = Binarizer.binarize(
-        filename, vocab, consumer, append_eos=append_eos, offset=offset, end=end
+    res = Binarizer.binarize_fast(
+        filename, vocab, ds, append_eos=append_eos, offset=offset, end=end
     )
     ds.finalize(dataset_dest_file(args, output_prefix, lang, "idx"))
     return res
 
 
+def binarize_shard(filename, vocab, shard, offset, end, append_eos=True):
+    """Binarize the lines of *filename* between *offset* and *end* in place
+    into a *shard* ``(data_file, dtype, shard_offset, num_elements)`` of a
+    MMapIndexedDatasetBuilder, and return the sizes of the items with the
+    statistics."""
+    ds = indexed_dataset.MMapIndexedDatasetShardBuilder(*shard)
+    res = Binarizer.binarize_fast(
+        filename, vocab, ds, append_eos=append_eos, offset=offset, end=end
+    )
+    res["sizes"] = ds.finalize()
+    return res
+
+
 def binarize_alignments(args, filename, parse_alignment, output_prefix, offset, end):
     ds = indexed_dataset.make_builder(
         dataset_dest_file(args, output_prefix, None, "bin"),
@@ -105,6 +105,7 @@ def main(cfg: DictConfig, override_args=None):
             shard_id=data_parallel_rank,
             num_workers=cfg.dataset.num_workers,
             data_buffer_size=cfg.dataset.data_buffer_size,
+            batch_plan_cache_dir=cfg.dataset.batch_plan_cache_dir,
         ).next_epoch_itr(shuffle=False)
         progress = progress_bar.progress_bar(
             itr,
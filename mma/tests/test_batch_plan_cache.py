@@ -0,0 +1,97 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import torch
+from fairseq.data import LanguagePairDataset, batch_plan_cache
+from fairseq.data.indexed_dataset import (
+    MMapIndexedDataset,
+    MMapIndexedDatasetBuilder,
+    data_file_path,
+    index_file_path,
+)
+from fairseq.tasks.fairseq_task import FairseqTask
+from tests.test_train import mock_dict
+
+
+class TestBatchPlanCache(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.dirname, "cache")
+        self.dictionary = mock_dict()
+        rng = np.random.RandomState(0)
+        self.src_lengths = rng.randint(2, 30, 100)
+        self.tgt_lengths = rng.randint(2, 30, 100)
+
+    def tearDown(self):
+        for dirname, _, names in os.walk(self.dirname, topdown=False):
+            for name in names:
+                os.remove(os.path.join(dirname, name))
+            os.rmdir(dirname)
+
+    def build_mmap(self, name, lengths):
+        path = os.path.join(self.dirname, name)
+        builder = MMapIndexedDatasetBuilder(data_file_path(path), dtype=np.uint16)
+        for length in lengths:
+            builder.add_item(torch.full((length,), 4, dtype=torch.int64))
+        builder.finalize(index_file_path(path))
+        return MMapIndexedDataset(path)
+
+    def build_dataset(self, **kwargs):
+        src = self.build_mmap("src", self.src_lengths)
+        tgt = self.build_mmap("tgt", self.tgt_lengths)
+        return LanguagePairDataset(
+            src, src.sizes, self.dictionary, tgt, tgt.sizes, self.dictionary, **kwargs
+        )
+
+    def batches(self, dataset, **kwargs):
+        itr = FairseqTask(None).get_batch_iterator(
+            dataset,
+            max_tokens=100,
+            max_positions=(25, 25),
+            ignore_invalid_inputs=True,
+            batch_plan_cache_dir=self.cache_dir,
+            **kwargs
+        )
+        return [list(batch) for batch in itr.frozen_batches]
+
+    def cached_keys(self):
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_cached_batches(self):
+        dataset = self.build_dataset()
+        expected = self.batches(dataset)
+        self.assertEqual(len(self.cached_keys()), 2)
+        # the batches are loaded from the cache, not recomputed
+        with patch.object(LanguagePairDataset, "ordered_indices") as ordered_indices:
+            self.assertEqual(self.batches(dataset), expected)
+            ordered_indices.assert_not_called()
+        self.assertEqual(len(self.cached_keys()), 2)
+
+        # other batching options, data or dataset options are other plans
+        self.batches(self.build_dataset(), seed=2)
+        self.assertEqual(len(self.cached_keys()), 4)
+        self.tgt_lengths[0] += 1
+        self.batches(self.build_dataset())
+        self.assertEqual(len(self.cached_keys()), 6)
+        self.batches(self.build_dataset(left_pad_source=False))
+        self.assertEqual(len(self.cached_keys()), 8)
+
+    def test_save_load(self):
+        batches = [np.array([3, 1]), np.array([], dtype=np.int64), np.array([2])]
+        for plan in [batches, []]:
+            batch_plan_cache.save(self.cache_dir, "key", plan)
+            loaded = batch_plan_cache.load(self.cache_dir, "key")
+            self.assertEqual([list(b) for b in loaded], [list(b) for b in plan])
+        self.assertIsNone(batch_plan_cache.load(self.cache_dir, "other"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import os
+import tempfile
+import unittest
+
+from fairseq.binarizer import Binarizer
+from fairseq.data import Dictionary
+from fairseq.data.indexed_dataset import (
+    MMapIndexedDatasetBuilder,
+    MMapIndexedDatasetShardBuilder,
+    best_fitting_int_dtype,
+    data_file_path,
+    index_file_path,
+)
+from fairseq.file_chunker_utils import find_offsets
+
+
+class TestBinarizer(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.dictionary = Dictionary()
+        for word in "a b c d e".split():
+            self.dictionary.add_symbol(word)
+        self.filename = os.path.join(self.dirname, "text")
+        with open(self.filename, "w", encoding="utf-8") as f:
+            f.write("a b  c\n\nd x e\t<unk> a\n  b y y   c d\n")
+            for i in range(20):
+                f.write(" ".join("abcdexyz"[(i * j) % 8] for j in range(i)) + "\n")
+
+    def tearDown(self):
+        for name in os.listdir(self.dirname):
+            os.remove(os.path.join(self.dirname, name))
+        os.rmdir(self.dirname)
+
+    def binarize(self, prefix, fast, **kwargs):
+        path = os.path.join(self.dirname, prefix)
+        builder = MMapIndexedDatasetBuilder(
+            data_file_path(path), dtype=best_fitting_int_dtype(len(self.dictionary))
+        )
+        if fast:
+            res = Binarizer.binarize_fast(
+                self.filename, self.dictionary, builder, chunk_size=3, **kwargs
+            )
+        else:
+            res = Binarizer.binarize(
+                self.filename, self.dictionary, builder.add_item, **kwargs
+            )
+        builder.finalize(index_file_path(path))
+        files = []
+        for name in [data_file_path(path), index_file_path(path)]:
+            with open(name, "rb") as f:
+                files.append(f.read())
+        return res, files
+
+    def test_binarize_fast_matches_binarize(self):
+        for kwargs in [
+            {},
+            {"reverse_order": True},
+            {"append_eos": False},
+            {"reverse_order": True, "append_eos": False},
+        ]:
+            expected_res, expected_files = self.binarize("slow", False, **kwargs)
+            res, files = self.binarize("fast", True, **kwargs)
+            self.assertEqual(res, expected_res)
+            self.assertEqual(files, expected_files)
+        self.assertEqual(set(res["replaced"]), {"x", "y", "z"})
+
+    def test_already_numberized(self):
+        with open(self.filename, "w", encoding="utf-8") as f:
+            f.write("4 5 6\n\n7 3 8\n")
+        expected_res, expected_files = self.binarize(
+            "slow", False, already_numberized=True, reverse_order=True
+        )
+        res, files = self.binarize(
+            "fast", True, already_numberized=True, reverse_order=True
+        )
+        self.assertEqual(res, expected_res)
+        self.assertEqual(files, expected_files)
+
+    def test_has_fast_path(self):
+        class BPEDictionary(Dictionary):
+            def encode_line(self, line, *args, **kwargs):
+                return super().encode_line(line.replace("@@ ", ""), *args, **kwargs)
+
+        self.assertTrue(Binarizer.has_fast_path(self.dictionary))
+        self.assertFalse(Binarizer.has_fast_path(BPEDictionary()))
+
+    def test_merge_shards_matches_sequential(self):
+        _, expected_files = self.binarize("sequential", True)
+        path = os.path.join(self.dirname, "sharded")
+        builder = MMapIndexedDatasetBuilder(
+            data_file_path(path), dtype=best_fitting_int_dtype(len(self.dictionary))
+        )
+        # more chunks than lines, some of them are empty
+        offsets = find_offsets(self.filename, 40)
+        chunks = list(zip(offsets, offsets[1:]))
+        num_elements = [
+            Binarizer.count_tokens(self.filename, offset=start, end=end)
+            for start, end in chunks
+        ]
+        self.assertIn(0, num_elements)
+        shards = [
+            (data_file_path(path), builder.dtype, builder.reserve_shard_(n), n)
+            for n in num_elements
+        ]
+        # the shards are written in any order, merged in order
+        sizes = {}
+        for i in reversed(range(len(chunks))):
+            shard_builder = MMapIndexedDatasetShardBuilder(*shards[i])
+            Binarizer.binarize_fast(
+                self.filename, self.dictionary, shard_builder, chunk_size=3,
+                offset=chunks[i][0], end=chunks[i][1],
+            )
+            sizes[i] = shard_builder.finalize()
+        for i in range(len(chunks)):
+            builder.merge_shard_(sizes[i])
+        builder.finalize(index_file_path(path))
+        files = []
+        for name in [data_file_path(path), index_file_path(path)]:
+            with open(name, "rb") as f:
+                files.append(f.read())
+        self.assertEqual(files, expected_files)
+
+
+if __name__ == "__main__":
+    unittest.main()
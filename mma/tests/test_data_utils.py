@@ -6,8 +6,15 @@
 import unittest
 
 import numpy as np
-from fairseq.data.data_utils_fast import batch_by_size_fn
-from fairseq.data.data_utils_fast import batch_by_size_vec
+from fairseq.data import data_utils_numpy
+
+
+def import_data_utils_fast():
+    try:
+        from fairseq.data import data_utils_fast
+    except ImportError:
+        raise unittest.SkipTest("Cython components are not built")
+    return data_utils_fast
 
 
 class TestBatchBySize(unittest.TestCase):
@@ -110,11 +117,14 @@ class TestBatchBySize(unittest.TestCase):
 
 class TestBatchBySizeVec(TestBatchBySize):
     def test_compare_with_baseline(self):
-        self._run_compare_with_baseline_sweep(batch_by_size_vec)
+        data_utils_fast = import_data_utils_fast()
+        self._run_compare_with_baseline_sweep(data_utils_fast.batch_by_size_vec)
 
 
 class TestBatchBySizeFn(TestBatchBySize):
     def test_compare_with_baseline(self):
+        data_utils_fast = import_data_utils_fast()
+
         def batch_by_size_fn_wrapper(
             indices,
             num_tokens_vec,
@@ -125,12 +135,55 @@ class TestBatchBySizeFn(TestBatchBySize):
             def num_tokens_fn(idx):
                 return num_tokens_vec[idx]
 
-            return batch_by_size_fn(
+            return data_utils_fast.batch_by_size_fn(
                 indices, num_tokens_fn, max_tokens, max_sentences, bsz_mult
             )
 
         self._run_compare_with_baseline_sweep(batch_by_size_fn_wrapper)
 
 
+class TestBatchBySizeNumpy(TestBatchBySize):
+    def test_compare_with_baseline(self):
+        self._run_compare_with_baseline_sweep(data_utils_numpy.batch_by_size_vec)
+
+    def test_matches_cython(self):
+        data_utils_fast = import_data_utils_fast()
+
+        rng = np.random.RandomState(0)
+        indices = rng.permutation(100000)
+        num_tokens_vec = np.sort(rng.randint(1, 200, size=len(indices)))
+        for max_tokens, max_sentences, bsz_mult in [
+            (4096, 0, 8),
+            (4096, 100, 8),
+            (0, 64, 1),
+            (2000, 30, 3),
+        ]:
+            expected = data_utils_fast.batch_by_size_vec(
+                indices, num_tokens_vec, max_tokens, max_sentences, bsz_mult
+            )
+            batches = data_utils_numpy.batch_by_size_vec(
+                indices, num_tokens_vec, max_tokens, max_sentences, bsz_mult
+            )
+            self.assertEqual(len(batches), len(expected))
+            for batch, expected_batch in zip(batches, expected):
+                self.assertTrue(np.array_equal(batch, expected_batch))
+
+    def test_batch_fixed_shapes(self):
+        data_utils_fast = import_data_utils_fast()
+
+        rng = np.random.RandomState(0)
+        indices = rng.permutation(1000)
+        num_tokens_vec = rng.randint(1, 50, size=len(indices))
+        fixed_shapes = np.array([[4, 50], [8, 30], [16, 12]], dtype=np.int64)
+        self.assertEqual(
+            data_utils_numpy.batch_fixed_shapes_fast(
+                indices, num_tokens_vec.__getitem__, fixed_shapes
+            ),
+            data_utils_fast.batch_fixed_shapes_fast(
+                indices, num_tokens_vec.__getitem__, fixed_shapes
+            ),
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -4,11 +4,22 @@
 # LICENSE file in the root directory of this source tree.
 
 import logging
+import os
+import tempfile
 import unittest
 from typing import Sequence
 
+import numpy as np
+import torch
 from fairseq.data import LanguagePairDataset, ListDataset, RoundRobinZipDatasets
+from fairseq.data.indexed_dataset import (
+    MMapIndexedDataset,
+    MMapIndexedDatasetBuilder,
+    data_file_path,
+    index_file_path,
+)
 from tests.test_train import mock_dict
+from tests.utils import dummy_dictionary
 
 
 def lang_pair_dataset(lengths: Sequence[int]) -> LanguagePairDataset:
@@ -64,3 +75,66 @@ class TestDataset(unittest.TestCase):
         self.assertEqual(dict(dataset[0]), {"a": sample(5, 7), "b": sample(2, 9)})
         self.assertEqual(dict(dataset[2]), {"a": sample(0, 10), "b": sample(2, 9)})
         self.assertEqual(dict(dataset[4]), {"a": sample(6, 12), "b": sample(2, 9)})
+
+    def test_batch_by_area(self):
+        src_lengths = [10, 20, 8, 11, 30, 7, 12, 4]
+        tgt_lengths = [12, 18, 9, 10, 35, 3, 15, 6]
+        tokens = [[i] * l for i, l in enumerate(src_lengths)]
+        dataset = LanguagePairDataset(
+            ListDataset(tokens),
+            src_lengths,
+            mock_dict(),
+            ListDataset(tokens),
+            tgt_lengths,
+            shuffle=False,
+        )
+        batches = dataset.batch_by_area(dataset.ordered_indices(), max_token_area=1500)
+        for batch in batches:
+            src_len = max(src_lengths[i] for i in batch)
+            tgt_len = max(tgt_lengths[i] for i in batch)
+            self.assertLessEqual(len(batch) * src_len * tgt_len, 1500)
+        # Short sentences are batched together, long ones alone
+        self.assertEqual([list(b) for b in batches], [[7, 5, 2, 3, 0, 6], [1], [4]])
+
+    def test_fetch_batch(self):
+        torch.manual_seed(0)
+        dictionary = dummy_dictionary(20)
+
+        def build_mmap(path, lengths):
+            builder = MMapIndexedDatasetBuilder(data_file_path(path), dtype=np.uint16)
+            for length in lengths:
+                item = torch.randint(4, len(dictionary), (length,))
+                item[-1] = dictionary.eos()
+                builder.add_item(item)
+            builder.finalize(index_file_path(path))
+            return MMapIndexedDataset(path)
+
+        src_lengths = [10, 20, 8, 11, 30, 7, 12, 4]
+        tgt_lengths = [12, 18, 9, 10, 35, 3, 15, 6]
+        with tempfile.TemporaryDirectory() as dirname:
+            src = build_mmap(os.path.join(dirname, "src"), src_lengths)
+            tgt = build_mmap(os.path.join(dirname, "tgt"), tgt_lengths)
+            for left_pad_source, left_pad_target, pad_to_multiple in [
+                (True, False, 1),
+                (False, True, 8),
+            ]:
+                dataset = LanguagePairDataset(
+                    src,
+                    src.sizes,
+                    dictionary,
+                    tgt,
+                    tgt.sizes,
+                    dictionary,
+                    left_pad_source=left_pad_source,
+                    left_pad_target=left_pad_target,
+                    pad_to_multiple=pad_to_multiple,
+                )
+                self.assertTrue(dataset.supports_fetch_batch)
+                indices = [3, 0, 6, 4, 1]
+                expected = dataset.collater([dataset[i] for i in indices])
+                batch = dataset.collater(dataset.__getitems__(indices))
+                self.assertEqual(batch["ntokens"], expected["ntokens"])
+                self.assertTrue(torch.equal(batch["id"], expected["id"]))
+                self.assertTrue(torch.equal(batch["target"], expected["target"]))
+                for key, value in expected["net_input"].items():
+                    self.assertTrue(torch.equal(batch["net_input"][key], value))
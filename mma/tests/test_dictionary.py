@@ -8,6 +8,7 @@ import os
 import string
 import tempfile
 import unittest
+from collections import Counter
 
 import torch
 from fairseq import tokenizer
@@ -140,6 +141,41 @@ class TestDictionary(unittest.TestCase):
                     counts[c], count, f"{c} count is {count} but should be {counts[c]}"
                 )
 
+    def test_add_file_to_dict_max_types(self):
+        with tempfile.TemporaryDirectory("test_max_types") as data_dir:
+            filename = os.path.join(data_dir, "dummy.txt")
+            counts = Counter()
+            with open(filename, "w", encoding="utf-8") as data:
+                for i in range(2000):
+                    # frequent words, then one-off words crowding the counts
+                    words = ["a", "a", "b", "c"][: i % 4 + 1] + ["w{}".format(i)]
+                    data.write(" ".join(words) + "\n")
+                    counts.update(words)
+
+            def build(num_workers, max_types=None):
+                d = Dictionary()
+                Dictionary.add_file_to_dictionary(
+                    filename, d, tokenizer.tokenize_line, num_workers, max_types
+                )
+                return d
+
+            exact = build(1)
+            for w, c in counts.items():
+                self.assertEqual(exact.get_count(exact.index(w)), c)
+            # one eos per line, on top of the count of the special symbol
+            self.assertEqual(exact.get_count(exact.eos()), 2000 + 1)
+            for num_workers in [1, 4]:
+                d = build(num_workers, max_types=10)
+                self.assertLessEqual(len(d), exact.nspecial + 2 * 10)
+                for w in ["a", "b", "c", exact.eos_word]:
+                    c = exact.get_count(exact.index(w))
+                    self.assertGreaterEqual(d.get_count(d.index(w)), c)
+                    self.assertLess(d.get_count(d.index(w)), 2 * c)
+                d.finalize(threshold=400, padding_factor=1)
+                exact_d = build(num_workers)
+                exact_d.finalize(threshold=400, padding_factor=1)
+                self.assertEqual(d.symbols, exact_d.symbols)
+
 
 if __name__ == "__main__":
     unittest.main()
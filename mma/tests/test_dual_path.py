@@ -0,0 +1,49 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+
+import torch
+from fairseq.modules.dual_path import generate_dual_path
+
+
+def generate_dual_path_baseline(alpha):
+    """The dense mask implementation generate_dual_path must match"""
+    bsz, tgt_len, src_len = alpha.size()
+    max_idx = alpha.max(dim=-1, keepdim=True)[1]
+    inn = torch.cat((torch.full((bsz, 1, 1), -1), max_idx[:, :-1, :]), dim=1)
+    min_idx = (max_idx > inn).int() * (inn + 1)
+    min_idx = torch.cummax(min_idx, dim=1)[0]
+    tmp = torch.arange(src_len).unsqueeze(0).unsqueeze(0).repeat(bsz, tgt_len, 1)
+    mask = ((tmp <= max_idx).int() * (tmp >= min_idx).int()).transpose(1, 2)
+    tmp = torch.arange(tgt_len).unsqueeze(0).unsqueeze(0).repeat(bsz, src_len, 1)
+    mask = ((tmp <= mask.max(dim=-1, keepdim=True)[1]).int() + mask).bool().int()
+    src_lens = torch.cummax(mask.sum(dim=2, keepdim=True), dim=1)[0]
+    dual_path = (tmp == src_lens - 1).int()
+    return dual_path / dual_path.sum(dim=-1, keepdim=True)
+
+
+class TestGenerateDualPath(unittest.TestCase):
+    def test_matches_baseline(self):
+        torch.manual_seed(0)
+        for _ in range(200):
+            bsz, tgt_len, src_len = torch.randint(1, 10, (3,)).tolist()
+            for alpha in [
+                torch.rand(bsz, tgt_len, src_len),
+                # Ties in the argmax of the rows
+                torch.randint(0, 3, (bsz, tgt_len, src_len)).float(),
+            ]:
+                expected = generate_dual_path_baseline(alpha)
+                dual_path = generate_dual_path(alpha)
+                self.assertEqual(dual_path.dtype, expected.dtype)
+                self.assertTrue(torch.equal(dual_path, expected))
+
+    def test_no_grad(self):
+        alpha = torch.rand(2, 4, 5, requires_grad=True)
+        self.assertFalse(generate_dual_path(alpha).requires_grad)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import random
+import unittest
+
+from fairseq.scoring.latency import LatencyScorer, latency_metrics
+from fairseq_cli.generate import RW2AL, RW2AP, RW2CW, RW2DAL, compute_delay, d201
+
+
+def random_delays(src_len, tgt_len, monotonic):
+    delays = [random.randint(0, src_len + 2) for _ in range(tgt_len)]
+    return sorted(delays) if monotonic else delays
+
+
+class TestLatencyScoring(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.batches = []
+        for _ in range(50):
+            src_lens = [random.randint(1, 20) for _ in range(random.randint(1, 8))]
+            delays = [
+                random_delays(src_len, random.randint(1, 20), random.random() < 0.7)
+                for src_len in src_lens
+            ]
+            self.batches.append((delays, src_lens))
+
+    def test_matches_read_write_sequences(self):
+        for delays, src_lens in self.batches:
+            metrics = latency_metrics(delays, src_lens)
+            for i, (d, src_len) in enumerate(zip(delays, src_lens)):
+                rw = d201(d, src_len).strip()
+                self.assertEqual(metrics["CW"][i], RW2CW(rw))
+                self.assertEqual(metrics["AP"][i], RW2AP(rw))
+                self.assertAlmostEqual(metrics["AL"][i], RW2AL(rw), places=12)
+                self.assertAlmostEqual(metrics["DAL"][i], RW2DAL(rw), places=12)
+
+    def test_scorer_matches_compute_delay(self):
+        for weight_by_src_len in [False, True]:
+            scorer = LatencyScorer(weight_by_src_len)
+            rws = []
+            for delays, src_lens in self.batches:
+                scorer.add(delays, src_lens)
+                rws.extend(d201(d, s) for d, s in zip(delays, src_lens))
+            expected = compute_delay(rws, is_weight_ave=not weight_by_src_len)
+            score = scorer.score()
+            for name, value in zip(["CW", "AP", "AL", "DAL"], expected):
+                self.assertAlmostEqual(score[name], value, places=12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,777 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import argparse
+import copy
+import unittest
+
+import torch
+import torch.nn as nn
+from examples.simultaneous_translation.models.transformer_monotonic_attention import (
+    TransformerModelSimulTrans,
+    TransformerMonotonicEncoder,
+    base_monotonic_architecture,
+)
+from examples.simultaneous_translation.modules.monotonic_multihead_attention import (
+    MonotonicMultiheadAttentionHardAligned,
+    MonotonicMultiheadAttentionInfiniteLookback,
+    MonotonicMultiheadAttentionWaitK,
+)
+from examples.simultaneous_translation.modules.monotonic_transformer_layer import (
+    TransformerMonotonicDecoderLayer,
+)
+from examples.simultaneous_translation.utils.decoder_state import DecoderStateManager
+from examples.simultaneous_translation.utils.functions import (
+    cached_arange,
+    lengths_to_mask,
+)
+from examples.simultaneous_translation.utils.latency import (
+    DifferentiableAverageLagging,
+)
+from fairseq.criterions.label_smoothed_cross_entropy import (
+    LabelSmoothedCrossEntropyCriterion,
+)
+from fairseq.models.transformer import TransformerDecoder, base_architecture
+from fairseq.quantization_utils import quantize_model_dynamic
+from fairseq.sequence_generator import SequenceGenerator
+from tests.test_sequence_generator import get_dummy_task_and_parser
+from tests.utils import (
+    build_monotonic_attention_args,
+    build_monotonic_model,
+    dummy_dictionary,
+)
+
+
+class TestExpectedAlignmentTrain(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.attention = MonotonicMultiheadAttentionHardAligned(
+            build_monotonic_attention_args()
+        )
+
+    def _alignment_and_grad(self, impl, p_choose, key_padding_mask):
+        self.attention.alignment_train_impl = impl
+        p_choose = p_choose.clone().requires_grad_(True)
+        alpha = self.attention.expected_alignment_train(p_choose, key_padding_mask)
+        # A non uniform upstream gradient to exercise every path
+        weights = torch.arange(alpha.numel()).view_as(alpha).type_as(alpha)
+        (alpha * weights.sin()).sum().backward()
+        return alpha.detach(), p_choose.grad
+
+    def _assert_parity(self, p_choose, key_padding_mask=None):
+        alpha_loop, grad_loop = self._alignment_and_grad(
+            "loop", p_choose, key_padding_mask
+        )
+        alpha_fused, grad_fused = self._alignment_and_grad(
+            "fused", p_choose, key_padding_mask
+        )
+        self.assertTrue(torch.allclose(alpha_loop, alpha_fused, atol=1e-10))
+        self.assertTrue(torch.allclose(grad_loop, grad_fused, atol=1e-8))
+
+    def test_fused_matches_loop(self):
+        for bsz, tgt_len, src_len in [(1, 1, 1), (2, 5, 7), (3, 17, 11)]:
+            p_choose = torch.rand(
+                bsz * 4, tgt_len, src_len, dtype=torch.double
+            )
+            self._assert_parity(p_choose)
+
+    def test_fused_matches_loop_saturated(self):
+        # p_choose close to 0 and 1 exercises the eps clamping of the cumprod
+        p_choose = torch.rand(8, 9, 13, dtype=torch.double).round()
+        p_choose = p_choose.clamp(1e-4, 1 - 1e-4)
+        self._assert_parity(p_choose)
+
+    def test_fused_matches_loop_right_padding(self):
+        bsz, tgt_len, src_len = 3, 6, 8
+        key_padding_mask = torch.zeros(bsz, src_len, dtype=torch.bool)
+        key_padding_mask[1, 5:] = True
+        key_padding_mask[2, 3:] = True
+        p_choose = torch.rand(bsz * 4, tgt_len, src_len, dtype=torch.double)
+        p_choose = p_choose.masked_fill(
+            key_padding_mask.repeat_interleave(4, dim=0).unsqueeze(1), 0
+        )
+        self._assert_parity(p_choose, key_padding_mask)
+
+
+def greedy_step_search_baseline(p_choose, prev_step, max_steps, step_offset):
+    """Step-by-step search, as in the original expected_alignment_infer"""
+    bsz, num_heads, src_len = p_choose.size()
+    new_step = prev_step.clone()
+    finish_read = new_step.eq(max_steps)
+    p_choose_i = torch.tensor(1)
+    while finish_read.sum().item() < bsz * num_heads:
+        p_choose_i = p_choose.gather(
+            2, (step_offset + new_step).unsqueeze(2).clamp(0, src_len - 1)
+        ).squeeze(2)
+        action = (p_choose_i < 0.5).type_as(new_step).masked_fill(finish_read, 0)
+        new_step += action
+        finish_read = new_step.eq(max_steps) | (action == 0)
+    return new_step, new_step.eq(max_steps) & (p_choose_i < 0.5)
+
+
+class TestExpectedAlignmentInfer(unittest.TestCase):
+    def _assert_matches_baseline(self, mass_preservation, left_pad, sparsity):
+        num_heads = 4
+        attention = MonotonicMultiheadAttentionHardAligned(
+            build_monotonic_attention_args(mass_preservation=mass_preservation)
+        )
+        bsz, src_len = 5, 12
+        src_lengths = torch.tensor([12, 9, 7, 12, 1])
+        key_padding_mask = (
+            torch.arange(src_len).unsqueeze(0) >= src_lengths.unsqueeze(1)
+        )
+        if left_pad:
+            key_padding_mask = key_padding_mask.flip(1)
+        step_offset = key_padding_mask.sum(dim=1, keepdim=True) if left_pad else 0
+        max_steps = (src_lengths - 1 if mass_preservation else src_lengths).view(
+            bsz, 1
+        ).expand(bsz, num_heads)
+
+        incremental_state = {}
+        prev_step = torch.zeros(bsz, num_heads).long()
+        for _ in range(8):
+            # Sparse p_choose so that heads move by several steps
+            p_choose = torch.rand(bsz * num_heads, 1, src_len).double()
+            p_choose = p_choose.masked_fill(p_choose < sparsity, 0)
+            attention.expected_alignment_infer(
+                p_choose, key_padding_mask, incremental_state
+            )
+            buffer = attention._get_monotonic_buffer(incremental_state)
+            expected_step, expected_read = greedy_step_search_baseline(
+                p_choose.view(bsz, num_heads, src_len), prev_step, max_steps, step_offset
+            )
+            self.assertTrue(torch.equal(buffer["head_step"], expected_step))
+            self.assertTrue(torch.equal(buffer["head_read"], expected_read))
+            prev_step = expected_step
+
+    def test_step_search_matches_baseline(self):
+        torch.manual_seed(0)
+        for mass_preservation in [True, False]:
+            for left_pad in [True, False]:
+                for sparsity in [0.0, 0.5, 0.9]:
+                    self._assert_matches_baseline(
+                        mass_preservation, left_pad, sparsity
+                    )
+
+
+class TestIncrementalEncoder(unittest.TestCase):
+    def _build_encoder(self, **kwargs):
+        args = argparse.Namespace(
+            encoder_embed_dim=16,
+            encoder_ffn_embed_dim=32,
+            encoder_attention_heads=4,
+            encoder_layers=2,
+            dropout=0.0,
+            max_source_positions=64,
+            **kwargs
+        )
+        base_monotonic_architecture(args)
+        dictionary = dummy_dictionary(20)
+        embed_tokens = nn.Embedding(len(dictionary), 16, dictionary.pad())
+        return TransformerMonotonicEncoder(args, dictionary, embed_tokens).eval()
+
+    def _assert_matches_full_encoding(self, encoder):
+        src_tokens = torch.randint(4, 24, (1, 12))
+        incremental_state = {}
+        src_len = 0
+        for num_units in [1, 3, 2, 1, 5]:
+            src_len += num_units
+            prefix = src_tokens[:, :src_len]
+            expected = encoder(prefix)
+            encoder_out = encoder(prefix, incremental_state=incremental_state)
+            self.assertEqual(encoder_out["encoder_out"][0].size(0), src_len)
+            for key in ["encoder_out", "encoder_embedding", "src_lengths"]:
+                self.assertTrue(
+                    torch.allclose(
+                        encoder_out[key][0], expected[key][0], atol=1e-5
+                    ),
+                    key,
+                )
+
+    def test_incremental_matches_full_encoding(self):
+        torch.manual_seed(0)
+        self._assert_matches_full_encoding(self._build_encoder())
+
+    def test_incremental_matches_full_encoding_normalize_before(self):
+        torch.manual_seed(0)
+        encoder = self._build_encoder(
+            encoder_normalize_before=True, layernorm_embedding=True
+        )
+        self._assert_matches_full_encoding(encoder)
+
+
+class TestDecoderStateManager(unittest.TestCase):
+    def setUp(self):
+        self.dictionary = dummy_dictionary(10)
+        self.manager = DecoderStateManager(self.dictionary, capacity=2)
+
+    def _indices(self, units):
+        return [self.dictionary.eos()] + [
+            self.dictionary.index(x) for x in units if x is not None
+        ]
+
+    def test_prefix_grows(self):
+        units = []
+        for unit in ["token_1", None, "token_2", "token_3", "token_4"]:
+            units.append(unit)
+            self.manager.update(units)
+            self.assertEqual(self.manager.prefix().tolist(), [self._indices(units)])
+
+    def test_rewritten_units_reset_the_states(self):
+        self.manager.update(["token_1", "token_2"])
+        self.manager.incremental_state["steps"] = {}
+        self.manager.update(["token_3"])
+        self.assertEqual(
+            self.manager.prefix().tolist(), [self._indices(["token_3"])]
+        )
+        self.assertNotIn("steps", self.manager.incremental_state)
+
+
+class TargetUnits(object):
+    """The target units of the simuleval agent states"""
+
+    def __init__(self):
+        self.value = []
+
+    def __len__(self):
+        return len(self.value)
+
+
+class TestAgentDecoderState(unittest.TestCase):
+    def setUp(self):
+        try:
+            import sentencepiece  # noqa
+            import simuleval  # noqa
+        except ImportError:
+            raise unittest.SkipTest("simuleval and sentencepiece are needed")
+        from examples.simultaneous_translation.eval.agents.simul_t2t_enja import (
+            SimulTransTextAgentJA,
+        )
+
+        torch.manual_seed(0)
+        self.dictionary = dummy_dictionary(20)
+        # The agent without its checkpoint and splitters
+        self.agent = SimulTransTextAgentJA.__new__(SimulTransTextAgentJA)
+        self.agent.model = build_monotonic_model(self.dictionary)
+        self.agent.dict = {"src": self.dictionary, "tgt": self.dictionary}
+
+    def _states(self):
+        states = argparse.Namespace(
+            units=argparse.Namespace(target=TargetUnits()),
+            finish_read=lambda: True,
+        )
+        src_tokens = torch.randint(4, len(self.dictionary), (1, 6))
+        src_tokens[:, -1] = self.dictionary.eos()
+        states.encoder_states = self.agent.model.encoder(src_tokens, None)
+        self.agent.initialize_states(states)
+        return states
+
+    def _cache_len(self, states):
+        layer = self.agent.model.decoder.layers[0]
+        buffer = layer.self_attn._get_input_buffer(
+            states.decoder_state.incremental_state
+        )
+        return buffer["prev_key"].size(2)
+
+    def test_rewritten_units_drop_the_cache(self):
+        states = self._states()
+        with torch.no_grad():
+            for units in [[], ["token_1"], ["token_1", "token_2"]]:
+                states.units.target.value = units
+                self.agent.policy(states)
+            self.assertEqual(self._cache_len(states), 3)
+
+            states.units.target.value = ["token_3"]
+            self.agent.policy(states)
+        # The decoder ran on the new, empty cache
+        self.assertEqual(self._cache_len(states), 1)
+
+
+class TestPruneIncrementalState(unittest.TestCase):
+    def setUp(self):
+        args = build_monotonic_attention_args(simul_type="hard_aligned")
+        base_architecture(args)
+        self.layer = TransformerMonotonicDecoderLayer(args)
+
+    def _cache_len(self, incremental_state):
+        buffer = self.layer.self_attn._get_input_buffer(incremental_state)
+        return buffer["prev_key"].size(2) if "prev_key" in buffer else 0
+
+    def test_prune_to_length(self):
+        incremental_state = {}
+        x = torch.rand(1, 2, 16)
+        for _ in range(3):
+            self.layer.self_attn(
+                query=x, key=x, value=x, incremental_state=incremental_state
+            )
+        self.assertEqual(self._cache_len(incremental_state), 3)
+
+        self.layer.prune_incremental_state(incremental_state)
+        self.assertEqual(self._cache_len(incremental_state), 2)
+        # Rolling back to the current length or beyond is a no-op
+        self.layer.prune_incremental_state(incremental_state, 2)
+        self.layer.prune_incremental_state(incremental_state, 5)
+        self.assertEqual(self._cache_len(incremental_state), 2)
+        self.layer.prune_incremental_state(incremental_state, 1)
+        self.assertEqual(self._cache_len(incremental_state), 1)
+        self.layer.prune_incremental_state(incremental_state, 0)
+        self.assertEqual(self._cache_len(incremental_state), 0)
+
+
+class TestStaticKeyValueCache(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        args = build_monotonic_attention_args(simul_type="infinite_lookback")
+        self.attention = MonotonicMultiheadAttentionInfiniteLookback(args).eval()
+
+    def _step(self, query, key, incremental_state, cached):
+        if not cached:
+            self.attention._set_input_buffer(incremental_state, {})
+        attn, _ = self.attention(
+            query=query, key=key, value=key, incremental_state=incremental_state
+        )
+        return attn
+
+    def _cache_len(self, incremental_state):
+        buffer = self.attention._get_input_buffer(incremental_state)
+        return buffer["prev_key"].size(2), buffer["prev_value"].size(2)
+
+    def test_cache_grows_with_the_source(self):
+        # Encoder states of the whole source, read a few at a time
+        encoder_out = torch.rand(8, 3, 16)
+        states = {True: {}, False: {}}
+        for step, src_len in enumerate([1, 1, 3, 4, 4, 8]):
+            query = torch.rand(1, 3, 16)
+            key = encoder_out[:src_len]
+            expected = self._step(query, key, states[False], cached=False)
+            attn = self._step(query, key, states[True], cached=True)
+            self.assertTrue(torch.allclose(attn, expected, atol=1e-6), step)
+            self.assertEqual(self._cache_len(states[True]), (src_len, src_len))
+
+    def test_reorder(self):
+        # Two sentences with two beams each: beams of the same sentence
+        # share their encoder states
+        encoder_out = torch.rand(5, 2, 16).repeat_interleave(2, dim=1)
+        incremental_state = {}
+        self._step(torch.rand(1, 4, 16), encoder_out, incremental_state, cached=True)
+
+        # Beams reordered, then the first sentence finished
+        for new_order in [torch.tensor([1, 1, 3, 2]), torch.tensor([2, 3])]:
+            encoder_out = encoder_out.index_select(1, new_order)
+            self.attention.reorder_incremental_state(incremental_state, new_order)
+            _, expected_k, expected_v = self.attention.input_projections(
+                None, encoder_out, encoder_out, "monotonic"
+            )
+            _, k, v = self.attention.input_projections(
+                None, encoder_out, encoder_out, "monotonic", incremental_state
+            )
+            self.assertTrue(torch.equal(k, expected_k))
+            self.assertTrue(torch.equal(v, expected_v))
+
+
+class TestIncrementalAlignment(unittest.TestCase):
+    def _assert_incremental_matches_full_prefix(self, **kwargs):
+        torch.manual_seed(0)
+        dictionary = dummy_dictionary(20)
+        model = build_monotonic_model(dictionary, **kwargs)
+        pad, eos = dictionary.pad(), dictionary.eos()
+        bsz, src_len = 4, 9
+        # Left padded sources, as in fairseq-generate
+        src_tokens = torch.randint(4, len(dictionary), (bsz, src_len))
+        src_lengths = torch.tensor([9, 5, 7, 2])
+        src_tokens[torch.arange(src_len) < src_len - src_lengths.unsqueeze(1)] = pad
+        src_tokens[:, -1] = eos
+
+        with torch.no_grad():
+            encoder_out = model.encoder(src_tokens, src_lengths=src_lengths)
+            tokens = torch.full((bsz, 1), eos)
+            incremental_state = {}
+            for step in range(8):
+                if step % 3 == 2:
+                    # Beams swap, and one hypothesis is dropped
+                    new_order = torch.randperm(tokens.size(0))[1:]
+                    tokens = tokens.index_select(0, new_order)
+                    encoder_out = model.encoder.reorder_encoder_out(encoder_out, new_order)
+                    model.decoder.reorder_incremental_state_scripting(
+                        incremental_state, new_order
+                    )
+                x, extra = model.decoder(
+                    tokens, encoder_out=encoder_out, incremental_state=incremental_state
+                )
+                expected_x, expected_extra = model.decoder(tokens, encoder_out=encoder_out)
+                self.assertTrue(torch.allclose(x[:, -1], expected_x[:, -1], atol=1e-5))
+                self.assertTrue(
+                    torch.equal(
+                        extra["attn_list"][0]["alpha"][:, :, -1],
+                        expected_extra["attn_list"][0]["alpha"][:, :, -1],
+                    )
+                )
+                tokens = torch.cat([tokens, x[:, -1:].argmax(dim=-1)], dim=1)
+
+    def test_incremental_matches_full_prefix(self):
+        self._assert_incremental_matches_full_prefix(simul_type="hard_aligned")
+
+    def test_incremental_matches_full_prefix_infinite_lookback(self):
+        # The layers above the first one take the steps of the first one
+        self._assert_incremental_matches_full_prefix(
+            simul_type="infinite_lookback", num_layers=3
+        )
+
+    def test_incremental_matches_full_prefix_waitk(self):
+        self._assert_incremental_matches_full_prefix(
+            simul_type="waitk", waitk_lagging=3, num_layers=3
+        )
+
+
+class TestTargetPositions(unittest.TestCase):
+    def test_left_padded_prefixes(self):
+        dictionary = dummy_dictionary(20)
+        model = build_monotonic_model(dictionary)
+        pad = dictionary.pad()
+        prefixes = [torch.randint(4, 20, (1, length)) for length in [3, 5, 1]]
+        prev_output_tokens = torch.full((3, 5), pad)
+        for i, prefix in enumerate(prefixes):
+            prev_output_tokens[i, 5 - prefix.size(1) :] = prefix
+        incremental_state = {"steps": {"tgt_lengths": torch.tensor([3, 5, 1])}}
+
+        positions = model.decoder.embed_target_positions(
+            prev_output_tokens, incremental_state
+        )
+        for i, prefix in enumerate(prefixes):
+            expected = model.decoder.embed_positions(prefix)[:, -1:]
+            self.assertTrue(torch.equal(positions[i : i + 1, -1:], expected))
+
+
+class TestSharedAlignment(unittest.TestCase):
+    def _forward(self, model):
+        torch.manual_seed(1)
+        src_tokens = torch.randint(4, 20, (2, 6))
+        prev_output_tokens = torch.randint(4, 20, (2, 5))
+        betas, alphas = [], []
+
+        def hook(module, inputs, output):
+            betas.append(output[1]["beta"])
+            alphas.append(output[1]["alpha"])
+
+        for layer in model.decoder.layers:
+            layer.register_forward_hook(hook)
+        encoder_out = model.encoder(src_tokens, src_lengths=None)
+        _, extra = model.decoder(prev_output_tokens, encoder_out=encoder_out)
+        return extra["attn_list"][0], betas, alphas
+
+    def test_layers_share_the_alignment(self):
+        model = build_monotonic_model(dummy_dictionary(20))
+        for training in [True, False]:
+            model.train(training)
+            attn, _, alphas = self._forward(model)
+            for alpha in alphas[1:]:
+                self.assertEqual(alpha.data_ptr(), alphas[0].data_ptr())
+            self.assertIs(attn["alpha"], alphas[-1])
+
+    def test_average_beta_at_inference_only(self):
+        model = build_monotonic_model(dummy_dictionary(20))
+        attn, betas, _ = self._forward(model.eval())
+        self.assertTrue(
+            torch.allclose(attn["beta"], torch.mean(torch.stack(betas), 0))
+        )
+        attn, _, _ = self._forward(model.train())
+        self.assertNotIn("beta", attn)
+
+
+def differentiable_average_lagging_loop(delays, src_lens, tgt_lens, target_padding_mask):
+    """DAL with the recursion over target steps, as originally written"""
+    gamma = tgt_lens / src_lens
+    new_delays = [delays[0]]
+    for i in range(1, delays.size(0)):
+        new_delays.append(torch.max(new_delays[-1] + 1 / gamma[0], delays[i]))
+    DAL = torch.stack(new_delays) - torch.arange(delays.size(0)).unsqueeze(1) / gamma
+    DAL = DAL.masked_fill(target_padding_mask, 0)
+    return DAL.sum(dim=0, keepdim=True) / tgt_lens
+
+
+class TestDifferentiableAverageLagging(unittest.TestCase):
+    def test_matches_loop(self):
+        torch.manual_seed(0)
+        tgt_len, bsz = 30, 8
+        tgt_lens = torch.randint(1, tgt_len + 1, (1, bsz)).float()
+        tgt_lens[0, 0] = tgt_len
+        target_padding_mask = torch.arange(tgt_len).unsqueeze(1) >= tgt_lens
+        src_lens = torch.randint(1, 40, (1, bsz)).float()
+        delays = (torch.rand(tgt_len, bsz) * src_lens).masked_fill(
+            target_padding_mask, 0
+        )
+
+        outputs = []
+        for cal_metric in [
+            differentiable_average_lagging_loop,
+            DifferentiableAverageLagging.cal_metric,
+        ]:
+            x = delays.clone().requires_grad_()
+            DAL = cal_metric(x, src_lens, tgt_lens, target_padding_mask)
+            DAL.sum().backward()
+            outputs.append((DAL, x.grad))
+        self.assertTrue(torch.allclose(outputs[0][0], outputs[1][0], atol=1e-5))
+        self.assertTrue(torch.equal(outputs[0][1], outputs[1][1]))
+
+
+class TestSinglePathTraining(unittest.TestCase):
+    def test_single_path_skips_backward_data(self):
+        torch.manual_seed(0)
+        dictionary = dummy_dictionary(20)
+        model = build_monotonic_model(dictionary).train()
+        target = torch.randint(4, len(dictionary), (2, 5))
+        target[:, -1] = dictionary.eos()
+        net_input = {
+            "src_tokens": torch.randint(4, len(dictionary), (2, 6)),
+            "src_lengths": torch.tensor([6, 6]),
+            "prev_output_tokens": torch.cat(
+                [torch.full((2, 1), dictionary.eos()), target[:, :-1]], dim=1
+            ),
+        }
+        _, back_decoder_out, dual_path_dist, back_data, _ = model(
+            **net_input, dual=False
+        )
+        self.assertEqual(back_decoder_out, [])
+        self.assertIsNone(dual_path_dist)
+        self.assertIsNone(back_data)
+
+        # A single path model trains with the default dual weight
+        task = argparse.Namespace(target_dictionary=dictionary)
+        criterion = LabelSmoothedCrossEntropyCriterion(task, False, 0.1)
+        sample = {
+            "id": torch.arange(2),
+            "nsentences": 2,
+            "ntokens": target.numel(),
+            "net_input": net_input,
+            "target": target,
+        }
+        loss, sample_size, logging_output = criterion(model, sample)
+        loss.backward()
+        self.assertEqual(sample_size, target.numel())
+        self.assertEqual(logging_output["nsentences"], 2)
+
+        # The dual path loss is not silently dropped without a backward model
+        model.args.single_path = False
+        with self.assertRaises(AssertionError):
+            criterion(model, sample)
+
+
+class TestLanguageModelFusion(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.task, parser = get_dummy_task_and_parser()
+        TransformerModelSimulTrans.add_args(parser)
+        MonotonicMultiheadAttentionHardAligned.add_args(parser)
+        args = parser.parse_args(["--single-path", "--add-language-model"])
+        args.encoder_embed_dim = args.decoder_embed_dim = 16
+        args.encoder_ffn_embed_dim = args.decoder_ffn_embed_dim = 32
+        args.encoder_attention_heads = args.decoder_attention_heads = 4
+        args.encoder_layers = args.decoder_layers = 2
+        args.simul_type = "hard_aligned"
+        base_monotonic_architecture(args)
+        self.model = TransformerModelSimulTrans.build_model(args, self.task).eval()
+        # Spread the outputs for less uniform hypotheses
+        for p in self.model.parameters():
+            nn.init.normal_(p, std=0.5)
+
+    def test_build_model_adds_lm_decoder(self):
+        self.assertIsInstance(self.model.lm_decoder, TransformerDecoder)
+        self.assertIsNone(self.model.lm_decoder.layers[0].encoder_attn)
+
+    def test_incremental_matches_full_prefix(self):
+        eos = self.task.tgt_dict.eos()
+        src_tokens = torch.randint(4, 50, (6, 8))
+        src_tokens[:, -1] = eos
+        sample = {
+            "net_input": {"src_tokens": src_tokens, "src_lengths": torch.full((6,), 8)}
+        }
+        generator = SequenceGenerator(
+            [self.model],
+            self.task.tgt_dict,
+            beam_size=1,
+            max_len_b=10,
+            min_len=2,
+            lm_model=self.model.lm_decoder,
+            lm_weight=0.5,
+        )
+        self.assertTrue(generator.lm_incremental)
+        with torch.no_grad():
+            hypos, reads, _ = generator.generate([self.model], sample)
+            generator.lm_incremental = False
+            expected_hypos, expected_reads, _ = generator.generate([self.model], sample)
+        self.assertEqual(reads, expected_reads)
+        for hypo, expected_hypo in zip(hypos, expected_hypos):
+            self.assertTrue(torch.equal(hypo[0]["tokens"], expected_hypo[0]["tokens"]))
+            self.assertTrue(
+                torch.allclose(
+                    hypo[0]["positional_scores"],
+                    expected_hypo[0]["positional_scores"],
+                    atol=1e-5,
+                )
+            )
+
+
+class TestReadTracking(unittest.TestCase):
+    def test_reads_by_sentence(self):
+        torch.manual_seed(0)
+        dictionary = dummy_dictionary(20)
+        model = build_monotonic_model(dictionary)
+        for p in model.parameters():
+            nn.init.normal_(p, std=0.5)
+        bsz, src_len = 6, 9
+        src_tokens = torch.randint(4, len(dictionary), (bsz, src_len))
+        src_tokens[:, -1] = dictionary.eos()
+        src_lengths = torch.tensor([9, 5, 7, 2, 9, 3])
+        src_tokens[torch.arange(src_len) < src_len - src_lengths.unsqueeze(1)] = (
+            dictionary.pad()
+        )
+        sample = {"net_input": {"src_tokens": src_tokens, "src_lengths": src_lengths}}
+        # Sentences finish at different steps
+        tgt_lengths = torch.tensor([3, 1, 6, 3, 9, 4])
+        prefix_tokens = torch.randint(4, len(dictionary), (bsz, 10))
+        prefix_tokens[torch.arange(bsz), tgt_lengths] = dictionary.eos()
+        prefix_tokens[torch.arange(10) > tgt_lengths.unsqueeze(1)] = dictionary.pad()
+        generator = SequenceGenerator([model], dictionary, beam_size=1, max_len_b=12)
+        with torch.no_grad():
+            hypos, reads, src_lens = generator.generate(
+                [model], sample, prefix_tokens=prefix_tokens
+            )
+
+        self.assertEqual(src_lens, src_lengths.tolist())
+        for hypo, hypo_reads, tgt_len in zip(hypos, reads, tgt_lengths.tolist()):
+            self.assertEqual(len(hypo[0]["tokens"]), tgt_len + 1)
+            self.assertEqual(len(hypo_reads), tgt_len + 1)
+            self.assertEqual(hypo_reads, sorted(hypo_reads))
+        # One copy for every step finalizing sentences, and one for each
+        # of the reads and source lengths of the batch
+        num_steps = len(set(tgt_lengths.tolist()))
+        self.assertEqual(generator.num_host_syncs, num_steps + 2)
+
+    def test_compact_threshold(self):
+        torch.manual_seed(0)
+        dictionary = dummy_dictionary(20)
+        model = build_monotonic_model(dictionary)
+        for p in model.parameters():
+            nn.init.normal_(p, std=0.5)
+        bsz = 6
+        src_tokens = torch.randint(4, len(dictionary), (bsz, 9))
+        src_tokens[:, -1] = dictionary.eos()
+        sample = {
+            "net_input": {
+                "src_tokens": src_tokens,
+                "src_lengths": torch.full((bsz,), 9),
+            }
+        }
+        tgt_lengths = torch.tensor([3, 1, 6, 3, 9, 4])
+        prefix_tokens = torch.randint(4, len(dictionary), (bsz, 10))
+        prefix_tokens[torch.arange(bsz), tgt_lengths] = dictionary.eos()
+        prefix_tokens[torch.arange(10) > tgt_lengths.unsqueeze(1)] = dictionary.pad()
+
+        def generate(compact_threshold, beam_size, prefix_tokens):
+            generator = SequenceGenerator(
+                [model],
+                dictionary,
+                beam_size=beam_size,
+                max_len_b=12,
+                compact_threshold=compact_threshold,
+            )
+            with torch.no_grad():
+                return generator.generate([model], sample, prefix_tokens=prefix_tokens)
+
+        for beam_size, prefix in [(1, prefix_tokens), (3, prefix_tokens[:, :2])]:
+            expected_hypos, expected_reads, _ = generate(0.0, beam_size, prefix)
+            for compact_threshold in [0.5, 1.0]:
+                hypos, reads, _ = generate(compact_threshold, beam_size, prefix)
+                self.assertEqual(reads, expected_reads)
+                for hypo, expected in zip(hypos, expected_hypos):
+                    self.assertEqual(len(hypo), beam_size)
+                    for h, e in zip(hypo, expected):
+                        self.assertTrue(torch.equal(h["tokens"], e["tokens"]))
+                        self.assertAlmostEqual(
+                            float(h["score"]), float(e["score"]), places=5
+                        )
+
+
+class TestTorchScript(unittest.TestCase):
+    def test_attention(self):
+        torch.manual_seed(0)
+        query, key = torch.rand(5, 2, 16), torch.rand(7, 2, 16)
+        for attention_class, args in [
+            (MonotonicMultiheadAttentionHardAligned, {}),
+            (MonotonicMultiheadAttentionInfiniteLookback, {}),
+            (MonotonicMultiheadAttentionWaitK, {"waitk_lagging": 2}),
+        ]:
+            attention = attention_class(
+                build_monotonic_attention_args(**args)
+            ).eval()
+            scripted = torch.jit.script(attention)
+            with torch.no_grad():
+                expected, _ = attention(query=query, key=key, value=key)
+                attn, _ = scripted(query=query, key=key, value=key)
+            self.assertTrue(torch.allclose(attn, expected, atol=1e-6))
+
+    def test_scripted_layers(self):
+        torch.manual_seed(0)
+        model = build_monotonic_model(dummy_dictionary(20)).eval()
+        scripted = copy.deepcopy(model)
+        for layers in [scripted.encoder.layers, scripted.decoder.layers]:
+            for i, layer in enumerate(layers):
+                layers[i] = torch.jit.script(layer)
+        src_tokens = torch.randint(4, 20, (2, 6))
+        prev_output_tokens = torch.randint(4, 20, (2, 5))
+
+        def forward(model):
+            encoder_out = model.encoder(src_tokens, src_lengths=None)
+            return model.decoder(prev_output_tokens, encoder_out=encoder_out)[0]
+
+        with torch.no_grad():
+            self.assertTrue(
+                torch.allclose(forward(scripted), forward(model), atol=1e-5)
+            )
+
+    def test_cached_arange(self):
+        # Eager calls slice one shared buffer, scripted calls do not need it
+        first = cached_arange(5, torch.device("cpu"))
+        second = cached_arange(3, torch.device("cpu"))
+        self.assertEqual(first.data_ptr(), second.data_ptr())
+        self.assertTrue(torch.equal(first, torch.arange(5)))
+
+        lengths = torch.tensor([2, 3, 4])
+        scripted = torch.jit.script(lengths_to_mask)
+        self.assertTrue(
+            torch.equal(scripted(lengths, 5, 1), lengths_to_mask(lengths, 5, 1))
+        )
+
+
+class TestDynamicQuantization(unittest.TestCase):
+    def test_p_choose_decisions(self):
+        torch.manual_seed(0)
+        model = build_monotonic_model(dummy_dictionary(20)).eval()
+        energy = "decoder.layers.0.encoder_attn.k_proj"
+        quantized = quantize_model_dynamic(copy.deepcopy(model), [energy])
+        linear = [
+            name
+            for name, module in quantized.named_modules()
+            if isinstance(module, nn.Linear)
+        ]
+        self.assertEqual(linear, [energy])
+
+        src_tokens = torch.randint(4, 20, (4, 8))
+        prev_output_tokens = torch.randint(4, 20, (4, 7))
+
+        def p_choose(model):
+            encoder_out = model.encoder(src_tokens, src_lengths=None)
+            _, extra = model.decoder(prev_output_tokens, encoder_out=encoder_out)
+            return extra["attn_list"][0]["p_choose"]
+
+        with torch.no_grad():
+            expected, actual = p_choose(model), p_choose(quantized)
+        self.assertLess((actual - expected).abs().max(), 0.05)
+        flips = (actual >= 0.5) != (expected >= 0.5)
+        self.assertLess(flips.float().mean(), 0.02)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import unittest
+
+import torch
+from examples.simultaneous_translation.models.transformer_monotonic_attention import (
+    TransformerMonotonicDecoderOut,
+)
+from examples.simultaneous_translation.utils.stream_scheduler import (
+    READ_ACTION,
+    WRITE_ACTION,
+    MultiStreamScheduler,
+)
+from tests.utils import build_monotonic_model, dummy_dictionary
+
+
+MAX_LEN = 12
+
+
+def run_scheduler(model, sources, max_batch_size):
+    """Feed one source unit to a stream every time it reads"""
+    scheduler = MultiStreamScheduler(
+        model, max_len=MAX_LEN, max_batch_size=max_batch_size
+    )
+    stream_ids = [scheduler.add_stream() for _ in sources]
+    num_read = [0 for _ in sources]
+    actions = {stream_id: [] for stream_id in stream_ids}
+    while not all(scheduler.streams[i].finished for i in stream_ids):
+        for stream_id, action in scheduler.step().items():
+            actions[stream_id].append(tuple(action))
+            if action.action == READ_ACTION:
+                source = sources[stream_id]
+                scheduler.push_source(
+                    stream_id,
+                    source[num_read[stream_id] : num_read[stream_id] + 1],
+                    finished=num_read[stream_id] + 1 >= len(source),
+                )
+                num_read[stream_id] += 1
+    return [actions[stream_id] for stream_id in stream_ids]
+
+
+def run_online_decoder(model, source):
+    """Online decoding of a single stream, as in the simultaneous agents"""
+    eos = model.decoder.dictionary.eos()
+    read_source = [source[0]]
+    actions = [(READ_ACTION, None)]
+    target = [eos]
+    encoder_state, incremental_state = {}, {"online": {}}
+    while True:
+        finish_read = len(read_source) >= len(source)
+        src_tokens = torch.tensor([read_source + ([eos] if finish_read else [])])
+        encoder_out = model.encoder(src_tokens, incremental_state=encoder_state)
+        incremental_state["steps"] = {
+            "src": src_tokens.size(1),
+            "tgt": len(target),
+        }
+        incremental_state["online"]["only"] = torch.BoolTensor([not finish_read])
+        x, outputs = model.decoder.forward(
+            prev_output_tokens=torch.tensor([target]),
+            encoder_out=encoder_out,
+            incremental_state=incremental_state,
+        )
+        if isinstance(outputs, TransformerMonotonicDecoderOut):
+            actions.append((READ_ACTION, None))
+            read_source.append(source[len(read_source)])
+            continue
+        index = x[0, -1].argmax().item()
+        actions.append((WRITE_ACTION, index))
+        target.append(index)
+        if index == eos or len(target) > MAX_LEN:
+            return actions
+
+
+class TestMultiStreamScheduler(unittest.TestCase):
+    def _assert_batched_matches_streams_one_by_one(self, **kwargs):
+        dictionary = dummy_dictionary(20)
+        for seed in range(3):
+            torch.manual_seed(seed)
+            model = build_monotonic_model(dictionary, **kwargs)
+            sources = [
+                torch.randint(4, len(dictionary), (src_len,)).tolist()
+                for src_len in [3, 7, 1, 12, 5]
+            ]
+            with torch.no_grad():
+                expected = [run_online_decoder(model, source) for source in sources]
+            self.assertEqual(run_scheduler(model, sources, max_batch_size=1), expected)
+            self.assertEqual(run_scheduler(model, sources, max_batch_size=8), expected)
+            self.assertEqual(run_scheduler(model, sources, max_batch_size=3), expected)
+
+    def test_batched_matches_streams_one_by_one(self):
+        self._assert_batched_matches_streams_one_by_one(simul_type="hard_aligned")
+
+    def test_batched_matches_streams_one_by_one_infinite_lookback(self):
+        self._assert_batched_matches_streams_one_by_one(
+            simul_type="infinite_lookback", num_layers=3
+        )
+
+    def test_waitk_is_rejected(self):
+        model = build_monotonic_model(
+            dummy_dictionary(20), simul_type="waitk", waitk_lagging=2
+        )
+        with self.assertRaises(ValueError):
+            MultiStreamScheduler(model)
+
+
+if __name__ == "__main__":
+    unittest.main()
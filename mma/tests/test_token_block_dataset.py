@@ -5,9 +5,10 @@
 
 import unittest
 
+import numpy as np
 import tests.utils as test_utils
 import torch
-from fairseq.data import TokenBlockDataset
+from fairseq.data import TokenBlockDataset, token_block_utils_numpy
 
 
 class TestTokenBlockDataset(unittest.TestCase):
@@ -74,6 +75,33 @@ class TestTokenBlockDataset(unittest.TestCase):
         self.assertEqual(ds[1].tolist(), [5, 1, 1])
         self.assertEqual(ds[2].tolist(), [6, 1])
 
+    def test_numpy_matches_cython(self):
+        try:
+            from fairseq.data import token_block_utils_fast
+        except ImportError:
+            raise unittest.SkipTest("Cython components are not built")
+
+        rng = np.random.RandomState(0)
+        sizes = rng.randint(0, 30, size=1000).astype(np.int64)
+        sizes[rng.rand(len(sizes)) < 0.1] = 1  # document separators
+        for break_mode in ["none", "complete", "complete_doc", "eos"]:
+            for block_size in [1, 8, 512]:
+                expected = token_block_utils_fast._get_slice_indices_fast(
+                    sizes, break_mode, block_size, 1
+                )
+                slice_indices = token_block_utils_numpy._get_slice_indices_fast(
+                    sizes, break_mode, block_size, 1
+                )
+                np.testing.assert_array_equal(slice_indices, expected)
+                np.testing.assert_array_equal(
+                    token_block_utils_numpy._get_block_to_dataset_index_fast(
+                        sizes, slice_indices
+                    ),
+                    token_block_utils_fast._get_block_to_dataset_index_fast(
+                        sizes, expected
+                    ),
+                )
+
     def test_4billion_tokens(self):
         """Regression test for numpy type promotion issue https://github.com/numpy/numpy/issues/5745"""
         data = [torch.tensor(list(range(10000)), dtype=torch.long)] * 430000
@@ -105,6 +105,14 @@ class TestUtils(unittest.TestCase):
         resolved = utils.resolve_max_positions(None, (2000, 100, 2000), 12000)
         self.assertEqual(resolved, (2000, 100, 2000))
 
+    def test_buffered_arange(self):
+        self.assertEqual(utils.buffered_arange(5).tolist(), list(range(5)))
+        # A buffer created in inference mode can be used outside of it
+        with utils.inference_mode():
+            self.assertEqual(utils.buffered_arange(20).tolist(), list(range(20)))
+        self.assertEqual((utils.buffered_arange(8) * 2).tolist(), list(range(0, 16, 2)))
+        self.assertEqual(utils.buffered_arange(3, "cpu").device, torch.device("cpu"))
+
     def assertAlmostEqual(self, t1, t2):
         self.assertEqual(t1.size(), t2.size(), "size mismatch")
         self.assertLess(utils.item((t1 - t2).abs().max()), 1e-4)
@@ -718,3 +718,86 @@ def train_language_model(
             + (extra_valid_flags or []),
         )
         validate.main(validate_args)
+
+
+def build_monotonic_attention_args(
+    simul_type="hard_aligned", embed_dim=16, num_heads=4, **kwargs
+):
+    """
+    Arguments of a monotonic attention with the default values of
+    MonotonicMultiheadAttentionHardAligned, overridden by *kwargs*.
+    Build the attention with build_monotonic_attention(args).
+    """
+    from examples.simultaneous_translation.modules.monotonic_multihead_attention import (
+        MonotonicMultiheadAttentionHardAligned,
+    )
+
+    parser = argparse.ArgumentParser()
+    MonotonicMultiheadAttentionHardAligned.add_args(parser)
+    args = parser.parse_args([])
+    args.simul_type = simul_type
+    args.encoder_embed_dim = args.decoder_embed_dim = embed_dim
+    args.decoder_attention_heads = num_heads
+    args.attention_dropout = 0.0
+    for key, value in kwargs.items():
+        setattr(args, key, value)
+    return args
+
+
+def build_monotonic_model(
+    dictionary=None,
+    simul_type="hard_aligned",
+    embed_dim=16,
+    ffn_embed_dim=32,
+    num_heads=4,
+    num_layers=2,
+    vocab_size=20,
+    max_positions=64,
+    **kwargs
+):
+    """
+    A randomly initialized TransformerModelSimulTrans, in eval mode,
+    with default arguments overridden by *kwargs*, e.g. waitk_lagging
+    for wait-k models.
+    Without *dictionary*, both sides share a dictionary of *vocab_size*
+    symbols. The model gets an auxiliary LM decoder with
+    add_language_model=True.
+    """
+    import torch.nn as nn
+    from examples.simultaneous_translation.models.transformer_monotonic_attention import (
+        TransformerModelSimulTrans,
+        base_monotonic_architecture,
+    )
+    from fairseq.models.transformer import TransformerDecoder
+
+    args = build_monotonic_attention_args(
+        simul_type=simul_type, embed_dim=embed_dim, num_heads=num_heads
+    )
+    args.encoder_ffn_embed_dim = args.decoder_ffn_embed_dim = ffn_embed_dim
+    args.encoder_attention_heads = num_heads
+    args.encoder_layers = args.decoder_layers = num_layers
+    args.max_source_positions = args.max_target_positions = max_positions
+    args.dropout = 0.0
+    # There is no backward model
+    args.single_path = True
+    for key, value in kwargs.items():
+        setattr(args, key, value)
+    base_monotonic_architecture(args)
+
+    if dictionary is None:
+        dictionary = Dictionary()
+        for i in range(vocab_size):
+            dictionary.add_symbol("token_{}".format(i))
+
+    def embed_tokens():
+        return nn.Embedding(len(dictionary), embed_dim, dictionary.pad())
+
+    encoder = TransformerModelSimulTrans.build_encoder(args, dictionary, embed_tokens())
+    decoder = TransformerModelSimulTrans.build_decoder(args, dictionary, embed_tokens())
+    lm_decoder = None
+    if getattr(args, "add_language_model", False):
+        lm_decoder = TransformerDecoder(
+            args, dictionary, embed_tokens(), no_encoder_attn=True
+        )
+    model = TransformerModelSimulTrans(args, encoder, decoder, None, None, lm_decoder)
+    return model.eval()